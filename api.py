@@ -0,0 +1,180 @@
+import datetime
+import json
+from flask import Blueprint, Response, abort, jsonify, request, stream_with_context
+from models import Venue, Artist, Show, db
+from pagination import keyset_paginate
+from cache import cache
+import availability
+import recommend
+import conditional
+import genres
+
+# Read-only JSON API. List endpoints stream their rows as NDJSON (default) or
+# as a chunked JSON array (?format=json) straight from a server-side cursor,
+# so an export never holds the whole table in memory. ?fields=id,name limits
+# the columns that are selected and serialized; venue and artist genres are
+# looked up once per chunk of rows.
+#
+# /api/venues/availability answers "which venues are free when", and every
+# venue and artist has a calendar as JSON or iCal (?format=ics) and a list of
+# recommended matches from the other side.
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+MODELS = {'venues': Venue, 'artists': Artist, 'shows': Show}
+CHUNK_SIZE = 1000
+
+
+def _default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def dumps(data):
+    return json.dumps(data, default=_default, separators=(',', ':'))
+
+
+def selected_columns(model):
+    # (columns, whether genres are wanted); genres need the id column
+    columns = {column.key: getattr(model, column.key) for column in db.inspect(model).column_attrs}
+    has_genres = model in genres.ASSOCIATIONS
+    fields = request.args.get('fields')
+    if not fields:
+        return list(columns.values()), has_genres
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in columns and not (has_genres and name == 'genres')]
+    if unknown:
+        abort(400, description=f'Unknown fields: {", ".join(unknown)}')
+    with_genres = 'genres' in names
+    if with_genres and 'id' not in names:
+        names.insert(0, 'id')
+    return [columns[name] for name in names if name != 'genres'], with_genres
+
+
+def stream_rows(query, keys, chunk_size=CHUNK_SIZE):
+    rows = query.execution_options(stream_results=True).yield_per(chunk_size)
+    for row in rows:
+        yield dict(zip(keys, row))
+
+
+def ndjson(records):
+    for record in records:
+        yield dumps(record) + '\n'
+
+
+def json_array(records):
+    yield '['
+    first = True
+    for record in records:
+        yield dumps(record) if first else ',' + dumps(record)
+        first = False
+    yield ']'
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def api_error(error):
+    return jsonify({'error': error.name, 'message': error.description}), error.code
+
+
+@api.route('/<any(venues, artists, shows):kind>')
+def list_entities(kind):
+    model = MODELS[kind]
+    columns, with_genres = selected_columns(model)
+    query = db.session.query(*columns).order_by(model.id)
+    records = stream_rows(query, [column.key for column in columns])
+    if with_genres:
+        records = genres.with_genres(model, records, CHUNK_SIZE)
+    if request.args.get('format', 'ndjson') == 'json':
+        return Response(stream_with_context(json_array(records)), mimetype='application/json')
+    return Response(stream_with_context(ndjson(records)), mimetype='application/x-ndjson')
+
+
+@api.route('/<any(venues, artists, shows):kind>/<int:entity_id>')
+def get_entity(kind, entity_id):
+    model = MODELS[kind]
+    columns, with_genres = selected_columns(model)
+    row = db.session.query(*columns).filter(model.id == entity_id).first()
+    if row is None:
+        abort(404, description=f'No {kind[:-1]} with id {entity_id}')
+    record = dict(zip([column.key for column in columns], row))
+    if with_genres:
+        record['genres'] = genres.genre_names(model, [entity_id])[entity_id]
+    return Response(dumps(record), mimetype='application/json')
+
+
+@api.route('/venues/availability')
+def venue_availability():
+    # free slots per venue in UTC, e.g. ?city=Austin&state=TX&genre=Rock n Roll
+    # &start=2027-03-01&end=2027-04-01&days=fri&from=18:00&to=23:59&min_minutes=120
+    # &tz=America/Chicago
+    start, end = availability.window_args()
+    slots = availability.windows(start, end, availability.parse_weekdays(), availability.parse_time('from'),
+                                 availability.parse_time('to'), availability.parse_timezone())
+    min_minutes = request.args.get('min_minutes', type=int)
+    min_length = datetime.timedelta(minutes=min_minutes) if min_minutes else None
+    query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state)
+    for field in ('city', 'state'):
+        if request.args.get(field):
+            query = query.filter(db.func.lower(getattr(Venue, field)) == request.args[field].lower())
+    query = genres.filter_by_genres(query, Venue, genres.requested())
+    page = keyset_paginate(query, (Venue.name, Venue.id), request.args.get('cursor'))
+    busy = availability.busy_intervals(Venue, [row.id for row in page.items], start, end)
+    data = [{
+        'id': row.id,
+        'name': row.name,
+        'city': row.city,
+        'state': row.state,
+        'free': [{'start': free_start, 'end': free_end}
+                 for free_start, free_end in availability.subtract(slots, busy[row.id], min_length)],
+    } for row in page.items]
+    return Response(dumps({'data': data, 'next_cursor': page.next_cursor, 'prev_cursor': page.prev_cursor}),
+                    mimetype='application/json')
+
+
+def calendar(model, entity_id):
+    entity = db.session.query(model.id, model.name).filter(model.id == entity_id).first()
+    if entity is None:
+        abort(404, description=f'No {model.__tablename__.lower()} with id {entity_id}')
+    start, end = availability.calendar_window()
+    events = availability.calendar_events(model, entity_id, start, end)
+    if request.args.get('format') == 'ics':
+        return Response(availability.ical(entity.name, events, request.host), mimetype='text/calendar')
+    busy = availability.busy_intervals(model, [entity_id], start, end)[entity_id]
+    return Response(dumps({'id': entity.id, 'name': entity.name, 'start': start, 'end': end, 'shows': events,
+                           'busy': [{'start': busy_start, 'end': busy_end} for busy_start, busy_end in busy]}),
+                    mimetype='application/json')
+
+
+def calendar_state(validator):
+    # the entity's validator plus the resolved window, which moves daily when
+    # no range is given
+    def state(**kwargs):
+        result = validator(**kwargs)
+        return None if result is None else result + availability.calendar_window()
+    return state
+
+
+@api.route('/venues/<int:venue_id>/calendar')
+@cache.cached('venue:{venue_id}', 'venues', vary=availability.calendar_key)
+@conditional.conditional(calendar_state(conditional.venue_state))
+def venue_calendar(venue_id):
+    return calendar(Venue, venue_id)
+
+
+@api.route('/artists/<int:artist_id>/calendar')
+@cache.cached('artist:{artist_id}', 'artists', vary=availability.calendar_key)
+@conditional.conditional(calendar_state(conditional.artist_state))
+def artist_calendar(artist_id):
+    return calendar(Artist, artist_id)
+
+
+@api.route('/<any(venues, artists):kind>/<int:entity_id>/recommendations')
+def recommendations(kind, entity_id):
+    model = MODELS[kind]
+    k = min(max(request.args.get('k', 10, type=int), 1), 100)
+    matches = recommend.recommendations(model, entity_id, k)
+    if matches is None:
+        abort(404, description=f'No {kind[:-1]} with id {entity_id}')
+    return jsonify({'data': matches})
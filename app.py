@@ -3,9 +3,7 @@
 #----------------------------------------------------------------------------#
 
 import json
-import dateutil.parser
-import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for
+from flask import Flask, render_template, request, Response, flash, redirect, url_for, abort, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import logging
@@ -13,7 +11,26 @@ from logging import Formatter, FileHandler
 from flask_wtf import Form
 from forms import *
 from flask_migrate import Migrate
-from models import Venue, Artist, Show, db
+from models import Venue, Artist, Show, ShowListing, db
+import counters
+import search
+import typeahead
+from pagination import keyset_paginate
+from cache import cache
+import conditional
+import scheduling
+import recommend
+import feed
+from generation import data_generation
+import listing
+import tasks
+import genres
+import formatting
+import profiler
+import metrics
+from api import api
+from importer import import_cli
+from exporter import export_cli
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
@@ -23,7 +40,20 @@ moment = Moment(app)
 app.config.from_object('config')
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 db.init_app(app)
+metrics.init_app(app)
+profiler.init_app(app)
 migrate = Migrate(app, db)
+app.cli.add_command(counters.counters_cli)
+app.cli.add_command(listing.listing_cli)
+app.cli.add_command(tasks.tasks_cli)
+app.cli.add_command(import_cli)
+app.cli.add_command(export_cli)
+cache.init_app(app)
+data_generation.init_app(app)
+recommend.recommender.init_app(app)
+feed.home_feed.init_app(app)
+tasks.task_queue.init_app(app)
+app.register_blueprint(api)
 
 
 #----------------------------------------------------------------------------#
@@ -36,74 +66,134 @@ migrate = Migrate(app, db)
 
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-  if isinstance(value, str):
-      date = dateutil.parser.parse(value)
-  else:
-      date = value
-  if format == 'full':
-      format="EEEE MMMM, d, y 'at' h:mma"
-  elif format == 'medium':
-      format="EE MM, dd, y h:mma"
-  return babel.dates.format_datetime(date, format, locale='en')
-
-app.jinja_env.filters['datetime'] = format_datetime
+formatting.init_app(app)
 
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
+def split_shows(tiles):
+  # splits show tiles in start order into (past, upcoming) against a single "now"
+  now = datetime.utcnow()
+  past_shows = []
+  upcoming_shows = []
+  for tile in tiles:
+      if tile['start_time'] > now:
+          upcoming_shows.append(tile)
+      else:
+          past_shows.append(tile)
+  return past_shows, upcoming_shows
+
+
+def venue_areas(rows):
+  # groups (id, name, city, state, num_upcoming_shows) rows ordered by state
+  # and city into areas in one pass
+  data = []
+  for row in rows:
+      if not data or data[-1]['city'] != row.city or data[-1]['state'] != row.state:
+          data.append({
+              "city": row.city,
+              "state": row.state,
+              "venues": []
+          })
+      data[-1]['venues'].append(
+          {'id': row.id, 'name': row.name, 'num_upcoming_shows': row.num_upcoming_shows})
+  return data
+
+
+def venue_details(venue, genres, past_shows, upcoming_shows):
+  # template data of a venue page; `venue` may be a Venue or a row
+  return {
+      "id": venue.id,
+      "name": venue.name,
+      "genres": genres,
+      "address": venue.address,
+      "city": venue.city,
+      "state": venue.state,
+      "phone": venue.phone,
+      "website": venue.website_link,
+      "facebook_link": venue.facebook_link,
+      "seeking_talent": venue.seeking_talent,
+      "seeking_description": venue.seeking_description,
+      "image_link": venue.image_link,
+      "past_shows": past_shows,
+      "upcoming_shows": upcoming_shows,
+      "past_shows_count": len(past_shows),
+      "upcoming_shows_count": len(upcoming_shows)
+  }
+
+
+def artist_details(artist, genres, past_shows, upcoming_shows):
+  return {
+      "id": artist.id,
+      "name": artist.name,
+      "genres": genres,
+      "city": artist.city,
+      "state": artist.state,
+      "phone": artist.phone,
+      "website": artist.website_link,
+      "facebook_link": artist.facebook_link,
+      "seeking_venue": artist.seeking_venue,
+      "seeking_description": artist.seeking_description,
+      "image_link": artist.image_link,
+      "past_shows": past_shows,
+      "upcoming_shows": upcoming_shows,
+      "past_shows_count": len(past_shows),
+      "upcoming_shows_count": len(upcoming_shows)
+  }
+
+
 @app.route('/')
+@cache.cached('home', 'venues', 'artists')
+@conditional.conditional(conditional.home_state)
 def index():
-  recent_artists = Artist.query.order_by(Artist.date_created).limit(10).all()
-  recent_venues = Venue.query.order_by(Venue.date_created).limit(10).all()
-  return render_template('pages/home.html', recent_artists=recent_artists, recent_venues=recent_venues)
+  return render_template('pages/home.html', recent_artists=feed.home_feed.recent('artists'),
+                         recent_venues=feed.home_feed.recent('venues'), recent_shows=feed.home_feed.recent('shows'))
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cache.cached('venues:list', 'venues')
+@conditional.conditional(conditional.venues_state)
 def venues():
   form = VenueForm()
-  data = []
-  venues = Venue.query.all()
-  locations = set()
-  for venue in venues:
-      locations.add((venue.city, venue.state))
-  for location in locations:
-      data.append({
-          "city": location[0],
-          "state": location[1],
-          "venues": []
-      })
-  for venue in venues:
-      for loc in data:
-          if loc['city'] == venue.city and loc['state'] == venue.state:
-              upcoming_shows = Show.query.join(Venue).filter(Venue.id == venue.id).filter(
-                  Show.start_time > datetime.utcnow())
-              loc['venues'].append(
-                  {'id': venue.id, 'name': venue.name, 'num_upcoming_shows': upcoming_shows.count()})
-  return render_template('pages/venues.html', areas=data, form=form)
+  # one query for a page of venues and their maintained upcoming show counters,
+  # ordered so that venues in the same area are adjacent
+  query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+                           Venue.upcoming_shows_count.label('num_upcoming_shows'))
+  query = genres.filter_by_genres(query, Venue, genres.requested())
+  page = keyset_paginate(query, (Venue.state, Venue.city, Venue.name, Venue.id),
+                         request.args.get('cursor'))
+  return render_template('pages/venues.html', areas=venue_areas(page.items), form=form, page=page,
+                         facets=genres.facet_counts(Venue, query), selected_genres=genres.requested())
+
+@app.route('/venues/autocomplete')
+def autocomplete_venues():
+  return jsonify({'data': typeahead.venues.search(request.args.get('q', ''))})
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
   form = VenueForm()
-  search_keyword = request.form.get('search_term')
-  data = (Venue.query.filter((Venue.city.ilike('%' + search_keyword + '%') |
-                                      Venue.name.ilike('%' + search_keyword + '%') |
-                                      Venue.state.ilike('%' + search_keyword + '%') )))
-
-  return render_template('pages/search_venues.html', form=form, results=data, search_term=request.form.get('search_term', ''))
+  search_keyword = request.form.get('search_term', '')
+  page = request.form.get('page', 1, type=int)
+  selected_genres = genres.requested()
+  data = search.search(Venue, search_keyword, page, app.config['SEARCH_PAGE_SIZE'], selected_genres)
+  return render_template('pages/search_venues.html', form=form, results=data, search_term=search_keyword,
+                         facets=genres.facet_counts(Venue, data.query), selected_genres=selected_genres)
 
 @app.route('/venues/<int:venue_id>')
+@cache.cached('venue:{venue_id}', 'venues')
+@conditional.conditional(conditional.venue_state)
 def show_venue(venue_id):
-  form = VenueForm()
   # shows the venue page with the given venue_id
   venue = Venue.query.get(venue_id)
-  upcoming_shows = Show.query.join(Venue).filter(Venue.id == venue_id).filter(Show.show_time > datetime.utcnow())
-  past_shows = Show.query.join(Venue).filter(Venue.id == venue_id).filter(Show.show_time <= datetime.utcnow())
-  return render_template('pages/show_venue.html', venue=venue, upcoming_shows=upcoming_shows, past_shows=past_shows)
+  if venue is None:
+      abort(404)
+  past_shows, upcoming_shows = split_shows(row._asdict() for row in listing.tiles_query(Venue, venue.id))
+  data = venue_details(venue, venue.genres, past_shows, upcoming_shows)
+  return render_template('pages/show_venue.html', venue=data)
 
 
 #  Create Venue
@@ -132,9 +222,11 @@ def create_venue_submission():
             state=venue_state,
             city=venue_city,
             image_link=venue_image_link,
+            genres=request.form.getlist("genres"),
             seeking_talent=venue_seeking_talent, seeking_description=venue_seeking_description)
         db.session.add(venue)
         db.session.commit()
+        typeahead.venues.add(venue.id, venue.name)
         flash(venue_name + ' was successfully listed!')
         return render_template('pages/home.html')
     except Exception as e:
@@ -150,37 +242,54 @@ def create_venue_submission():
 def delete_venue(venue_id):
   # BONUS CHALLENGE: Implement a button to delete a Venue on a Venue Page, have it so that
   # clicking that button delete it from the db then redirect the user to the homepage
+  venue = Venue.query.get_or_404(venue_id)
   try:
-     venue = Venue.query.get(venue_id)
+     artist_ids = counters.delete_shows_of(Venue, venue.id)
      db.session.delete(venue)
+     db.session.commit()
+     counters.refresh_later(Artist, artist_ids)
+     typeahead.venues.remove(venue.id)
+     flash('Venue was successfully deleted!')
+     return jsonify({'success': True})
   except Exception as e:
      db.session.rollback()
-  return None
+     return jsonify({'success': False}), 500
 
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cache.cached('artists:list', 'artists')
+@conditional.conditional(conditional.artists_state)
 def artists():
-  form = ArtistForm()
-  data = Artist.query.all()
-  return render_template('pages/artists.html', artists=data)
+  query = genres.filter_by_genres(db.session.query(Artist.id, Artist.name), Artist, genres.requested())
+  page = keyset_paginate(query, (Artist.name, Artist.id), request.args.get('cursor'))
+  return render_template('pages/artists.html', artists=page.items, page=page,
+                         facets=genres.facet_counts(Artist, query), selected_genres=genres.requested())
+
+@app.route('/artists/autocomplete')
+def autocomplete_artists():
+  return jsonify({'data': typeahead.artists.search(request.args.get('q', ''))})
 
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
   form = ArtistForm()
-  search_keyword = request.form.get('search_term')
-  data = (Artist.query.filter((Artist.city.ilike('%' + search_keyword + '%') |
-                                        Artist.name.ilike('%' + search_keyword + '%') |
-                                        Artist.state.ilike('%' + search_keyword + '%') )))
-  return render_template('pages/search_artists.html', form=form, results=data, search_term=request.form.get('search_term', ''))
+  search_keyword = request.form.get('search_term', '')
+  page = request.form.get('page', 1, type=int)
+  selected_genres = genres.requested()
+  data = search.search(Artist, search_keyword, page, app.config['SEARCH_PAGE_SIZE'], selected_genres)
+  return render_template('pages/search_artists.html', form=form, results=data, search_term=search_keyword,
+                         facets=genres.facet_counts(Artist, data.query), selected_genres=selected_genres)
 
 @app.route('/artists/<int:artist_id>')
+@cache.cached('artist:{artist_id}', 'artists')
+@conditional.conditional(conditional.artist_state)
 def show_artist(artist_id):
-  form = ArtistForm()
   artist = Artist.query.get(artist_id)
-  upcoming_shows = Show.query.join(Artist).filter(Artist.id == artist_id).filter(Show.show_time > datetime.utcnow())
-  past_shows = Show.query.join(Artist).filter(Artist.id == artist_id).filter(Show.show_time <= datetime.utcnow())
-  return render_template('pages/show_artist.html', artist=artist, upcoming_shows=upcoming_shows, past_shows=past_shows)
+  if artist is None:
+      abort(404)
+  past_shows, upcoming_shows = split_shows(row._asdict() for row in listing.tiles_query(Artist, artist.id))
+  data = artist_details(artist, artist.genres, past_shows, upcoming_shows)
+  return render_template('pages/show_artist.html', artist=data)
 
 
 #  Update
@@ -190,7 +299,7 @@ def edit_artist(artist_id):
     artist = Artist.query.get(artist_id)
     form = ArtistForm()
     form.name.data = artist.name
-    form.genres.data = artist.genres
+    form.genres.data = list(artist.genres)
     form.state.data = artist.state
     form.city.data = artist.state
     form.phone.data = artist.phone
@@ -226,15 +335,16 @@ def edit_artist_submission(artist_id):
         artist.state = artist_state
         artist.address = artist_address
         db.session.commit()
+        typeahead.artists.add(artist.id, artist.name)
         flash(artist_name + ' was successfully updated!')
-        return redirect(url_for('show_artist', artist_id=artist_id), form=form)
+        return redirect(url_for('show_artist', artist_id=artist_id))
     except Exception as e:
          db.session.rollback()
          flash('Artist ' + request.form['name'] + f' could not be listed!')
-         return redirect(url_for('show_artist', artist_id=artist_id), form=form)
+         return redirect(url_for('show_artist', artist_id=artist_id))
   else:
     flash(f'An error occurred, Please check form and try again {artist}')
-    return redirect(url_for('show_artist', artist_id=artist_id), form=form)
+    return redirect(url_for('show_artist', artist_id=artist_id))
 
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
@@ -242,7 +352,7 @@ def edit_venue(venue_id):
   venue = Artist.query.get(venue_id)
   form = VenueForm()
   form.name.data = venue.name
-  form.genres.data = venue.genres
+  form.genres.data = list(venue.genres)
   form.state.data = venue.state
   form.city.data = venue.state
   form.phone.data = venue.phone
@@ -270,15 +380,16 @@ def edit_venue_submission(venue_id):
         venue.state = request.form.get("state")
         venue.address = request.form.get("address")
         db.session.commit()
-        flash(artist_name + ' was successfully updated!')
+        typeahead.venues.add(venue.id, venue.name)
+        flash(venue.name + ' was successfully updated!')
         return redirect(url_for('show_venue', venue_id=venue_id))
     except Exception as e:
          db.session.rollback()
          flash('Artist ' + request.form['name'] + f' could not be listed!')
-         return redirect(url_for('show_venue', venue_id=venue_id), form=form)
+         return redirect(url_for('show_venue', venue_id=venue_id))
  else:
     flash(f'An error occurred, Please check form and try again')
-    return redirect(url_for('show_venue', venue_id=venue_id), form=form)
+    return redirect(url_for('show_venue', venue_id=venue_id))
 
 
 #  Create Artist
@@ -309,9 +420,11 @@ def create_artist_submission():
           state=artist_state,
           city=artist_city,
           image_link=artist_image_link,
+          genres=request.form.getlist("genres"),
           seeking_venue=artist_looking_for_venues, seeking_description=artist_seeking_description)
           db.session.add(artist)
           db.session.commit()
+          typeahead.artists.add(artist.id, artist.name)
           flash(artist_name + ' was successfully listed!')
           return render_template('pages/home.html')
       except Exception as e:
@@ -328,11 +441,13 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cache.cached('shows:list', 'venues', 'artists')
+@conditional.conditional(conditional.shows_state)
 def shows():
-  # displays list of shows at /shows
-  # TODO: replace with real venues data.
-  shows = Show.query.all()
-  return render_template('pages/shows.html', shows=shows)
+  # displays list of shows at /shows, from the denormalized listing
+  page = keyset_paginate(db.session.query(ShowListing), (ShowListing.start_time, ShowListing.show_id),
+                         request.args.get('cursor'))
+  return render_template('pages/shows.html', shows=page.items, page=page)
 
 @app.route('/shows/create')
 def create_shows():
@@ -348,10 +463,19 @@ def create_show_submission():
       try:
           artist_id = request.form.get("artist_id")
           venue_id = request.form.get("venue_id")
-          start_time = request.form.get("start_time")
-          show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time)
+          start_time = form.start_time.data
+          end_time = start_time + scheduling.duration(form.duration.data)
+          clash = scheduling.find_conflict(int(venue_id), int(artist_id), start_time, end_time)
+          if clash:
+              kind, other = clash
+              flash(f'The {kind} is already booked from {other.start_time} to {other.end_time} '
+                    f'(show {other.id}). Show could not be listed!')
+              return redirect(url_for('create_shows'))
+          show = Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time, end_time=end_time)
           db.session.add(show)
           db.session.commit()
+          counters.refresh_later(Venue, [show.venue_id])
+          counters.refresh_later(Artist, [show.artist_id])
           flash('Show was successfully listed!')
           return render_template('pages/home.html')
       except Exception as e:
@@ -365,6 +489,16 @@ def create_show_submission():
 
 
 
+@app.route('/cache/stats')
+def cache_stats():
+  return jsonify(cache.stats())
+
+
+@app.route('/db/stats')
+def db_stats():
+  return jsonify(db.stats())
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
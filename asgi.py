@@ -0,0 +1,327 @@
+import asyncio
+import contextvars
+import io
+import itertools
+import sys
+from asgiref.wsgi import WsgiToAsgi
+from flask import abort, g, render_template, request, session
+from flask_sqlalchemy import Pagination
+from sqlalchemy.exc import NoSuchModuleError
+from werkzeug.exceptions import HTTPException
+from app import app, venue_areas, venue_details, artist_details, split_shows
+from database import pinned_to_primary
+from models import Venue, Artist, db
+from pagination import keyset_query, keyset_page
+from cache import cache
+from feed import home_feed
+from forms import VenueForm, ArtistForm
+from listing import tiles_query
+import conditional
+import genres
+import search
+
+# ASGI entry point (`uvicorn asgi:application`). The read routes -- home,
+# listings, detail pages and search -- are served by async views on an async
+# SQLAlchemy engine, running their independent queries concurrently on
+# separate connections: the page and its genre facets on listings, and the
+# venue or artist, its show tiles and its genres on detail pages, which split
+# the tiles into past and upcoming as the WSGI views do; the home page comes from the in-memory feed. Statements are
+# built with the same query helpers as the WSGI views and rendered with the
+# same templates, response cache and ETags. Like the WSGI app, a request
+# reads from one of the REPLICA_BINDS replicas (each gets its own async
+# engine) unless its client is pinned to the primary after a write; sync
+# helpers run through run_sync() read from the primary. Every other request,
+# and any read that has flashed messages to show, goes to the WSGI app, which
+# stays the default way to run Fyyur.
+#
+# Needs asgiref, and SQLAlchemy 1.4+ with an async driver (asyncpg, or
+# aiosqlite for SQLite) for the async views; without those everything goes
+# to the WSGI app.
+
+DRIVERS = {'postgresql': 'postgresql+asyncpg', 'postgres': 'postgresql+asyncpg', 'sqlite': 'sqlite+aiosqlite'}
+
+wsgi = WsgiToAsgi(app)
+
+
+def async_url(url):
+    scheme, _, rest = url.partition('://')
+    driver = DRIVERS.get(scheme.split('+')[0])
+    return f'{driver}://{rest}' if driver else None
+
+
+def create_engines():
+    # {bind: async engine}, None for the primary; replicas whose URL has no
+    # async driver are left out
+    urls = {None: app.config.get('ASYNC_DATABASE_URI') or async_url(app.config['SQLALCHEMY_DATABASE_URI'])}
+    if urls[None] is None:
+        return {}
+    for bind in app.config.get('REPLICA_BINDS') or ():
+        urls[bind] = async_url(app.config['SQLALCHEMY_BINDS'][bind])
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+        # the driver is imported here, so a missing one fails now
+        return {bind: create_async_engine(url) for bind, url in urls.items() if url}
+    except (ImportError, NoSuchModuleError) as e:
+        app.logger.warning(f'Serving every route through WSGI, no async engine: {e}')
+        return {}
+
+
+engines = create_engines()
+engine = engines.get(None)
+replicas = [bind for bind in engines if bind is not None]
+_next_replica = itertools.count()
+# the engine the current request reads from
+read_engine = contextvars.ContextVar('read_engine', default=None)
+
+
+def pick_engine():
+    # round-robin over the replicas, as RoutingSession does
+    if replicas and not pinned_to_primary():
+        g.db_replica = replicas[next(_next_replica) % len(replicas)]
+        return engines[g.db_replica]
+    return engine
+
+
+async def fetch(statement):
+    # each query gets its own connection so gathered queries run in parallel
+    async with (read_engine.get() or engine).connect() as connection:
+        return (await connection.execute(statement)).fetchall()
+
+
+async def run_sync(func, *args):
+    # sync code using db.session, on a worker thread with its own session
+    def call():
+        with app.app_context():
+            try:
+                return func(*args)
+            finally:
+                db.session.remove()
+    return await asyncio.get_running_loop().run_in_executor(None, call)
+
+
+def validate(statement, result):
+    # an async validator from a conditional *_statement() / *_result() pair
+    async def state():
+        return result((await fetch(statement))[0])
+    return state
+
+
+async def home_state():
+    if not home_feed.loaded:
+        await run_sync(home_feed.load)
+    return conditional.home_state()
+
+
+async def cached_view(view, tags, validator, **kwargs):
+    # cache.cached() and conditional.conditional() for async views;
+    # `validator` is a coroutine function returning the validator state
+    key = cache.request_key() if cache.backend is not None and not pinned_to_primary() else None
+    if key is not None:
+        response = cache.lookup(key)
+        if response is not None:
+            return response
+        entry_tags = [tag.format(**kwargs) for tag in tags]
+        versions = cache.versions(entry_tags)
+    state = await validator()
+    if state is None:
+        response = app.make_response(await view(**kwargs))
+    else:
+        etag, last_modified, not_modified = conditional.check(state)
+        if not_modified is not None:
+            return not_modified
+        response = conditional.stamp(app.make_response(await view(**kwargs)), etag, last_modified)
+    return cache.store(key, response, entry_tags, versions) if key is not None else response
+
+
+async def index():
+    # home_state() has loaded the feed
+    return render_template('pages/home.html', recent_artists=home_feed.recent('artists'),
+                           recent_venues=home_feed.recent('venues'), recent_shows=home_feed.recent('shows'))
+
+
+async def listing(model, query, columns):
+    # (keyset page, genre facets) of a listing query
+    cursor = request.args.get('cursor')
+    page_query, direction, per_page = keyset_query(query, columns, cursor)
+    rows, facets = await asyncio.gather(fetch(page_query.statement),
+                                        fetch(genres.facet_query(model, query).statement))
+    return keyset_page(rows, columns, cursor, direction, per_page), facets
+
+
+async def venues():
+    query = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state,
+                             Venue.upcoming_shows_count.label('num_upcoming_shows'))
+    query = genres.filter_by_genres(query, Venue, genres.requested())
+    page, facets = await listing(Venue, query, (Venue.state, Venue.city, Venue.name, Venue.id))
+    return render_template('pages/venues.html', areas=venue_areas(page.items), form=VenueForm(), page=page,
+                           facets=facets, selected_genres=genres.requested())
+
+
+async def artists():
+    query = genres.filter_by_genres(db.session.query(Artist.id, Artist.name), Artist, genres.requested())
+    page, facets = await listing(Artist, query, (Artist.name, Artist.id))
+    return render_template('pages/artists.html', artists=page.items, page=page,
+                           facets=facets, selected_genres=genres.requested())
+
+
+async def details(model, entity_id):
+    # (row, genres, past tiles, upcoming tiles), or None
+    rows, names, tiles = await asyncio.gather(
+        fetch(db.session.query(model).filter(model.id == entity_id).statement),
+        fetch(genres.genre_names_query(model, [entity_id]).statement),
+        fetch(tiles_query(model, entity_id).statement))
+    if not rows:
+        return None
+    return (rows[0], [name for _, name in names], *split_shows(row._asdict() for row in tiles))
+
+
+async def show_venue(venue_id):
+    found = await details(Venue, venue_id)
+    if found is None:
+        abort(404)
+    return render_template('pages/show_venue.html', venue=venue_details(*found))
+
+
+async def show_artist(artist_id):
+    found = await details(Artist, artist_id)
+    if found is None:
+        abort(404)
+    return render_template('pages/show_artist.html', artist=artist_details(*found))
+
+
+async def search_page(model, template, form):
+    search_term = request.form.get('search_term', '')
+    page = max(request.form.get('page', 1, type=int), 1)
+    per_page = app.config['SEARCH_PAGE_SIZE']
+    selected_genres = genres.requested()
+    query = search.search_query(model, search_term, selected_genres)
+    count = db.select([db.func.count()]).select_from(query.order_by(None).subquery())
+    total, items, facets = await asyncio.gather(
+        fetch(count),
+        fetch(query.limit(per_page).offset((page - 1) * per_page).statement),
+        fetch(genres.facet_query(model, query).statement))
+    results = Pagination(query, page, per_page, total[0][0], items)
+    return render_template(template, form=form, results=results, search_term=search_term,
+                           facets=facets, selected_genres=selected_genres)
+
+
+# WSGI endpoint -> async view
+VIEWS = {
+    'index': lambda: cached_view(index, ('home', 'venues', 'artists'), home_state),
+    'venues': lambda: cached_view(venues, ('venues:list', 'venues'),
+                                  validate(conditional.listing_statement(Venue), conditional.listing_result)),
+    'artists': lambda: cached_view(artists, ('artists:list', 'artists'),
+                                   validate(conditional.listing_statement(Artist), conditional.listing_result)),
+    'show_venue': lambda venue_id: cached_view(
+        show_venue, ('venue:{venue_id}', 'venues'),
+        validate(conditional.detail_statement(Venue, venue_id), conditional.detail_result), venue_id=venue_id),
+    'show_artist': lambda artist_id: cached_view(
+        show_artist, ('artist:{artist_id}', 'artists'),
+        validate(conditional.detail_statement(Artist, artist_id), conditional.detail_result), artist_id=artist_id),
+    'search_venues': lambda: search_page(Venue, 'pages/search_venues.html', VenueForm()),
+    'search_artists': lambda: search_page(Artist, 'pages/search_artists.html', ArtistForm()),
+}
+
+
+def environ_for(scope, body):
+    # the WSGI environ of an HTTP scope, as WsgiToAsgi builds it
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode().decode('latin1'),
+        'PATH_INFO': scope['path'].encode().decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_PROTOCOL': 'HTTP/' + scope['http_version'],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = map(str, scope.get('server') or ('localhost', 80))
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = map(str, scope['client'])
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1').upper().replace('-', '_')
+        if name not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            name = 'HTTP_' + name
+        value = value.decode('latin1')
+        environ[name] = f'{environ[name]},{value}' if name in environ else value
+    return environ
+
+
+def async_view(scope):
+    # the VIEWS entry for an HTTP request, or None
+    if engine is None:
+        return None
+    environ = environ_for(scope, b'')
+    try:
+        endpoint, _ = app.url_map.bind_to_environ(environ).match()
+    except HTTPException:
+        return None
+    return VIEWS.get(endpoint)
+
+
+async def read_body(receive):
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            return body
+
+
+def replay(body):
+    # a receive() for the WSGI app once the body has been read
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+    return receive
+
+
+async def send_response(send, response, head):
+    headers = [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in response.headers]
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': b'' if head else response.get_data()})
+
+
+async def dispatch(view):
+    try:
+        response = app.preprocess_request()
+        if response is None:
+            read_engine.set(pick_engine())
+            response = await view(**request.view_args)
+    except HTTPException as e:
+        response = app.handle_user_exception(e)
+    except Exception as e:
+        response = app.handle_exception(e)
+    return app.process_response(app.make_response(response))
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            for bind_engine in engines.values():
+                await bind_engine.dispose()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    view = async_view(scope) if scope['type'] == 'http' else None
+    if view is None:
+        return await wsgi(scope, receive, send)
+    body = await read_body(receive)
+    environ = environ_for(scope, body)
+    response = None
+    with app.request_context(environ):
+        if '_flashes' not in session:
+            response = await dispatch(view)
+    if response is None:
+        return await wsgi(scope, replay(body), send)
+    await send_response(send, response, scope['method'] == 'HEAD')
@@ -0,0 +1,282 @@
+import datetime
+from flask import abort, request
+from models import Venue, Artist, Show, db, MAX_SHOW_DURATION
+from cache import cache
+from formatting import timezone_for
+
+# Availability and calendars. Busy time of a venue or artist is read with one
+# range query over the (entity, start_time) index for a whole page of
+# entities, merged into sorted disjoint intervals, and subtracted from the
+# requested windows with a linear sweep. Busy sets are cached per entity and
+# calendar month in the cache's derived store, apart from the pages, under
+# the entity's cache tag, so any show write for the venue or artist
+# invalidates them.
+#
+# Shows are stored in naive UTC and every window is computed in UTC. A `tz`
+# argument (e.g. America/Chicago, UTC by default) gives naive start/end
+# values, the weekdays and the from/to hours, and "today" in that timezone;
+# values with a UTC offset are taken as they are.
+
+KEYS = {Venue: Show.venue_id, Artist: Show.artist_id}
+PREFIXES = {Venue: 'venue', Artist: 'artist'}
+WEEKDAYS = ('mon', 'tue', 'wed', 'thu', 'fri', 'sat', 'sun')
+UTC = datetime.timezone.utc
+
+
+def to_utc(value, zone=UTC):
+    # a naive wall time in `zone`, or an aware datetime, as naive UTC
+    if value.tzinfo is None:
+        value = zone.localize(value) if hasattr(zone, 'localize') else value.replace(tzinfo=zone)
+    return value.astimezone(UTC).replace(tzinfo=None)
+
+
+def to_local(value, zone=UTC):
+    # a naive UTC datetime as naive wall time in `zone`
+    return value.replace(tzinfo=UTC).astimezone(zone).replace(tzinfo=None)
+
+
+def merge(intervals):
+    # sorted (start, end) pairs to disjoint intervals, touching ones coalesced
+    merged = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract(windows, busy, min_length=None):
+    # parts of the sorted, disjoint `windows` not covered by the sorted,
+    # disjoint `busy` intervals, in one pass over both
+    free = []
+    i = 0
+    for start, end in windows:
+        while i < len(busy) and busy[i][1] <= start:
+            i += 1
+        cursor = start
+        j = i
+        while j < len(busy) and busy[j][0] < end:
+            if busy[j][0] > cursor:
+                free.append((cursor, busy[j][0]))
+            cursor = max(cursor, busy[j][1])
+            j += 1
+        if cursor < end:
+            free.append((cursor, end))
+    if min_length:
+        free = [(start, end) for start, end in free if end - start >= min_length]
+    return free
+
+
+def windows(start, end, weekdays=None, day_start=None, day_end=None, zone=None):
+    # the parts of [start, end) on `weekdays` between `day_start` and
+    # `day_end`; a day_end at or before day_start runs past midnight. With a
+    # `zone`, start and end are naive UTC and the days and hours are local
+    # to it; the windows come back in UTC.
+    if day_start is None and day_end is None and weekdays is None:
+        return [(start, end)]
+    if zone is not None:
+        local = windows(to_local(start, zone), to_local(end, zone), weekdays, day_start, day_end)
+        return merge((to_utc(opens, zone), to_utc(closes, zone)) for opens, closes in local)
+    day_start = day_start or datetime.time()
+    result = []
+    day = start.date() - datetime.timedelta(days=1)
+    while day < end.date() + datetime.timedelta(days=1):
+        if weekdays is None or day.weekday() in weekdays:
+            opens = datetime.datetime.combine(day, day_start)
+            closes = datetime.datetime.combine(day, day_end) if day_end else None
+            if closes is None or closes <= opens:
+                closes = datetime.datetime.combine(day + datetime.timedelta(days=1), day_end or datetime.time())
+            opens, closes = max(opens, start), min(closes, end)
+            if opens < closes:
+                result.append((opens, closes))
+        day += datetime.timedelta(days=1)
+    return merge(result)
+
+
+def _months(start, end):
+    # first days of the calendar months overlapping [start, end)
+    month = datetime.datetime(start.year, start.month, 1)
+    while month < end:
+        yield month
+        month = _next_month(month)
+
+
+def _next_month(month):
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
+def overlapping(start, end):
+    # shows overlapping [start, end) as a bounded start_time range, so the
+    # (entity, start_time) indexes serve it
+    return db.and_(Show.start_time < end, Show.start_time > start - MAX_SHOW_DURATION, Show.end_time > start)
+
+
+def _query_busy(model, ids, start, end):
+    key = KEYS[model]
+    rows = (db.session.query(key, Show.start_time, Show.end_time)
+            .filter(key.in_(ids), overlapping(start, end))
+            .order_by(key, Show.start_time))
+    busy = {entity_id: [] for entity_id in ids}
+    for entity_id, show_start, show_end in rows:
+        busy[entity_id].append((show_start, show_end))
+    return busy
+
+
+def busy_intervals(model, ids, start, end):
+    # {id: merged busy intervals within [start, end)} for venues or artists
+    ids = list(ids)
+    if not ids:
+        return {}
+    months = list(_months(start, end))
+    buckets = {}
+    missing = []
+    if cache.backend is None:
+        missing = ids
+    else:
+        for entity_id in ids:
+            cached = [cache.get(f'busy:{PREFIXES[model]}:{entity_id}:{month:%Y-%m}', cache.derived)
+                      for month in months]
+            if any(bucket is None for bucket in cached):
+                missing.append(entity_id)
+            else:
+                buckets[entity_id] = [interval for bucket in cached for interval in bucket]
+    if missing:
+        # tag versions are read before querying so a concurrent show write
+        # can't be hidden behind the stored busy set
+        tags = {entity_id: [f'{PREFIXES[model]}:{entity_id}', PREFIXES[model] + 's'] for entity_id in missing}
+        versions = {entity_id: cache.versions(entity_tags) for entity_id, entity_tags in tags.items()} \
+            if cache.backend is not None else None
+        loaded = _query_busy(model, missing, months[0], _next_month(months[-1]))
+        for entity_id, intervals in loaded.items():
+            buckets[entity_id] = intervals
+            if cache.backend is None:
+                continue
+            for month in months:
+                following = _next_month(month)
+                bucket = [(s, e) for s, e in intervals if s < following and e > month]
+                cache.set(f'busy:{PREFIXES[model]}:{entity_id}:{month:%Y-%m}', bucket,
+                          tags[entity_id], versions[entity_id], cache.derived)
+    # a show spanning a month boundary is in both buckets, merge() folds it
+    return {entity_id: merge((max(s, start), min(e, end)) for s, e in sorted(buckets[entity_id])
+                             if s < end and e > start)
+            for entity_id in ids}
+
+
+def parse_timezone():
+    name = request.args.get('tz')
+    if not name:
+        return UTC
+    try:
+        return timezone_for(name)
+    except LookupError:
+        abort(400, description='tz must be a timezone name such as America/Chicago.')
+
+
+def parse_datetime(name, zone=UTC, default=None):
+    # naive UTC; naive values are wall times in `zone`
+    value = request.args.get(name)
+    if not value:
+        return default
+    try:
+        value = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f'{name} must be an ISO date or datetime.')
+    return to_utc(value, zone)
+
+
+def parse_time(name):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.time.fromisoformat(value)
+    except ValueError:
+        abort(400, description=f'{name} must be a time such as 18:00.')
+
+
+def parse_weekdays():
+    value = request.args.get('days')
+    if not value:
+        return None
+    try:
+        return {WEEKDAYS.index(day.strip().lower()[:3]) for day in value.split(',') if day.strip()}
+    except ValueError:
+        abort(400, description='days must be a list of weekdays such as fri,sat.')
+
+
+def window_args(default_days=30):
+    # (start, end) of the requested window in naive UTC, defaulting to the
+    # next `default_days` days from midnight in the request's timezone
+    zone = parse_timezone()
+    today = datetime.datetime.combine(to_local(datetime.datetime.utcnow(), zone).date(), datetime.time())
+    start = parse_datetime('start', zone, to_utc(today, zone))
+    end = parse_datetime('end', zone, start + datetime.timedelta(days=default_days))
+    if end <= start:
+        abort(400, description='end must be after start.')
+    if end - start > datetime.timedelta(days=366):
+        abort(400, description='The window can span at most a year.')
+    return start, end
+
+
+def calendar_window():
+    # a calendar covers the next year unless a range is given
+    return window_args(default_days=365)
+
+
+def calendar_key():
+    # the resolved window, for the cache key of a calendar without a range
+    start, end = calendar_window()
+    return f'{start.isoformat()}/{end.isoformat()}'
+
+
+def calendar_events(model, entity_id, start, end):
+    # shows of a venue or artist overlapping [start, end), with both names
+    rows = (db.session.query(Show.id, Show.start_time, Show.end_time, Show.venue_id, Show.artist_id,
+                             Venue.name.label('venue_name'), Artist.name.label('artist_name'))
+            .join(Venue, Venue.id == Show.venue_id)
+            .join(Artist, Artist.id == Show.artist_id)
+            .filter(KEYS[model] == entity_id, overlapping(start, end))
+            .order_by(Show.start_time))
+    return [row._asdict() for row in rows]
+
+
+def _ical_text(value):
+    return (value or '').replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+def _ical_time(value):
+    # show times are naive UTC; without the Z clients read floating local time
+    return value.strftime('%Y%m%dT%H%M%SZ')
+
+
+def _fold(line):
+    # content lines are folded at 75 octets
+    data = line.encode()
+    if len(data) <= 75:
+        return line
+    parts = []
+    while data:
+        size = 75 if not parts else 74
+        while size < len(data) and (data[size] & 0xC0) == 0x80:
+            size -= 1
+        parts.append(data[:size].decode())
+        data = data[size:]
+    return '\r\n '.join(parts)
+
+
+def ical(name, events, host):
+    now = _ical_time(datetime.datetime.utcnow())
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//Fyyur//Calendar//EN', 'CALSCALE:GREGORIAN',
+             f'X-WR-CALNAME:{_ical_text(name)}']
+    for event in events:
+        lines += ['BEGIN:VEVENT',
+                  f'UID:show-{event["id"]}@{host}',
+                  f'DTSTAMP:{now}',
+                  f'DTSTART:{_ical_time(event["start_time"])}',
+                  f'DTEND:{_ical_time(event["end_time"])}',
+                  f'SUMMARY:{_ical_text(event["artist_name"])} at {_ical_text(event["venue_name"])}',
+                  'END:VEVENT']
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
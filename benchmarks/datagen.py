@@ -0,0 +1,143 @@
+import datetime
+import itertools
+import math
+import random
+import sys
+
+# Deterministic synthetic data for benchmarks. `generate(shows, seed)` yields
+# the same venues, artists and shows for the same arguments: one venue per
+# 20 shows and one artist per 10, in cities weighted by population, with one
+# to three genres drawn from a Zipf distribution over GENRES. Shows are
+# spread over the year before and after `now`, one evening slot per day, and
+# a venue or artist plays at most once a day, so no booking overlaps.
+#
+#     python -m benchmarks.datagen SHOWS [SEED]   # loads into DATABASE_URL
+
+sys.path.insert(0, '.')
+
+# most popular first
+GENRES = ['Rock n Roll', 'Pop', 'Hip-Hop', 'Alternative', 'Electronic', 'R&B', 'Country', 'Jazz', 'Punk',
+          'Heavy Metal', 'Blues', 'Soul', 'Folk', 'Funk', 'Reggae', 'Classical', 'Instrumental',
+          'Musical Theatre', 'Other']
+# (city, state, population in millions)
+CITIES = [
+    ('New York', 'NY', 8.3), ('Los Angeles', 'CA', 3.9), ('Chicago', 'IL', 2.7), ('Houston', 'TX', 2.3),
+    ('Phoenix', 'AZ', 1.6), ('Philadelphia', 'PA', 1.6), ('San Antonio', 'TX', 1.5), ('San Diego', 'CA', 1.4),
+    ('Dallas', 'TX', 1.3), ('Austin', 'TX', 0.96), ('San Francisco', 'CA', 0.87), ('Seattle', 'WA', 0.74),
+    ('Denver', 'CO', 0.72), ('Nashville', 'TN', 0.69), ('Boston', 'MA', 0.68), ('Portland', 'OR', 0.65),
+    ('Las Vegas', 'NV', 0.64), ('Detroit', 'MI', 0.63), ('Memphis', 'TN', 0.63), ('Atlanta', 'GA', 0.5),
+    ('Miami', 'FL', 0.44), ('Minneapolis', 'MN', 0.43), ('New Orleans', 'LA', 0.38), ('Pittsburgh', 'PA', 0.3),
+]
+WORDS = ['Blue', 'Velvet', 'Golden', 'Electric', 'Midnight', 'Silver', 'Red', 'Rusty', 'Neon', 'Wild',
+         'Lonely', 'Crimson', 'Hollow', 'Echo', 'River', 'Stone', 'Garden', 'Owl', 'Lantern', 'Harbor']
+VENUE_KINDS = ['Hall', 'Lounge', 'Room', 'Club', 'Theatre', 'Tavern', 'Bar', 'Ballroom']
+DAYS = 365
+SHOW_HOURS = (18, 19, 20, 21)
+
+
+def sizes(shows):
+    return max(shows // 20, 10), max(shows // 10, 10)
+
+
+def _zipf_weights(n, s=1.1):
+    return [1 / (rank ** s) for rank in range(1, n + 1)]
+
+
+def _entities(rng, count, kind):
+    genre_weights = _zipf_weights(len(GENRES))
+    city_weights = [population for _, _, population in CITIES]
+    for i in range(1, count + 1):
+        city, state, _ = rng.choices(CITIES, city_weights)[0]
+        genres = sorted(set(rng.choices(GENRES, genre_weights, k=rng.randint(1, 3))))
+        if kind == 'venue':
+            name = f'The {rng.choice(WORDS)} {rng.choice(WORDS)} {rng.choice(VENUE_KINDS)} {i}'
+        else:
+            name = f'{rng.choice(WORDS)} {rng.choice(WORDS)} {i}'
+        yield {
+            'id': i,
+            'name': name,
+            'city': city,
+            'state': state,
+            'phone': f'{rng.randint(200, 999)}-{rng.randint(200, 999)}-{rng.randint(1000, 9999)}',
+            'image_link': f'https://images.example.com/{kind}/{i}.jpg',
+            'seeking': rng.random() < 0.3,
+            'genres': genres,
+        }
+
+
+def generate(shows, seed=0, now=None):
+    # (venues, artists, show rows) as lists of dicts; ids start at 1
+    rng = random.Random(seed)
+    now = now or datetime.datetime(2027, 1, 1)
+    venue_count, artist_count = sizes(shows)
+    venues = list(_entities(rng, venue_count, 'venue'))
+    for venue in venues:
+        venue['address'] = f'{rng.randint(1, 9999)} {rng.choice(WORDS)} St'
+    artists = list(_entities(rng, artist_count, 'artist'))
+    first_day = datetime.datetime.combine(now.date(), datetime.time()) - datetime.timedelta(days=DAYS)
+    # listed in id order over the past year
+    for entities in (venues, artists):
+        for i, entity in enumerate(entities):
+            entity['date_created'] = first_day + datetime.timedelta(days=DAYS) * i / len(entities)
+    per_day = math.ceil(shows / (2 * DAYS))
+    rows = []
+    show_id = itertools.count(1)
+    for day in range(2 * DAYS):
+        count = min(per_day, shows - len(rows), venue_count, artist_count)
+        if count <= 0:
+            break
+        date = first_day + datetime.timedelta(days=day)
+        for venue_index, artist_index in zip(rng.sample(range(venue_count), count),
+                                             rng.sample(range(artist_count), count)):
+            start = date + datetime.timedelta(hours=rng.choice(SHOW_HOURS))
+            rows.append({
+                'id': next(show_id),
+                'venue_id': venue_index + 1,
+                'artist_id': artist_index + 1,
+                'start_time': start,
+                'end_time': start + datetime.timedelta(hours=2),
+            })
+    return venues, artists, rows
+
+
+def load(venues, artists, rows, batch_size=10000):
+    # inserts generated rows into the app's database and refreshes the show
+    # counters; needs an app context and empty tables
+    from models import Venue, Artist, Show, db
+    from importer import insert_rows, link_genres
+    import counters
+    from generation import data_generation
+    for model, entities, seeking in ((Venue, venues, 'seeking_talent'), (Artist, artists, 'seeking_venue')):
+        for start in range(0, len(entities), batch_size):
+            batch = entities[start:start + batch_size]
+            columns = [{key: value for key, value in entity.items() if key not in ('seeking', 'genres')}
+                       for entity in batch]
+            for column, entity in zip(columns, batch):
+                column[seeking] = entity['seeking']
+            insert_rows(model.__table__, columns)
+            link_genres(model, [(entity['id'], entity['genres']) for entity in batch])
+            db.session.commit()
+    for start in range(0, len(rows), batch_size):
+        insert_rows(Show.__table__, rows[start:start + batch_size])
+        db.session.commit()
+    if db.engine.dialect.name == 'postgresql':
+        for model in (Venue, Artist, Show):
+            db.session.execute(db.text(
+                f"SELECT setval(pg_get_serial_sequence('\"{model.__tablename__}\"', 'id'), "
+                f"(SELECT max(id) FROM \"{model.__tablename__}\"))"))
+    for model in (Venue, Artist):
+        counters.refresh(model)
+    db.session.commit()
+    data_generation.bump()
+    return len(venues), len(artists), len(rows)
+
+
+def main(shows, seed=0):
+    from app import app
+    with app.app_context():
+        data = generate(int(shows), int(seed), datetime.datetime.utcnow())
+        print('loaded %d venues, %d artists, %d shows' % load(*data))
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:])
@@ -0,0 +1,142 @@
+import argparse
+import json
+import re
+import sys
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Query-plan check. Loads the same generated data as benchmarks.harness,
+# requests every read route twice through the test client and runs EXPLAIN
+# on each SELECT of the second request (the first one fills the process
+# caches, such as the typeahead index and the recommender, whose one-off
+# loads read whole tables). A sequential scan of a table holding at least
+# --min-rows rows fails the check, unless the route is in ALLOWED for that
+# table. On SQLite a "SCAN <table>" without an index is a sequential scan;
+# ordered index scans, which stop at the page size, are fine.
+#
+#     python -m benchmarks.explain --scale 10k
+
+sys.path.insert(0, '.')
+from benchmarks import harness  # noqa: E402
+
+# route -> tables it reads in full on purpose
+ALLOWED = {
+    # the JSON API streams whole tables in id order
+    'GET /api/venues': {'Venue'},
+    'GET /api/artists': {'Artist'},
+    'GET /api/shows': {'Show'},
+}
+_ALIAS = re.compile(r'_\d+$')
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.explain', description='Check the query plans.')
+    parser.add_argument('--scale', type=harness.scale, default=harness.scale('10k'),
+                        help='shows to generate (1k, 100k, 1M)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database', help='database URL, default the SQLite file of benchmarks.harness')
+    parser.add_argument('--regenerate', action='store_true', help='recreate the default SQLite database')
+    parser.add_argument('--min-rows', type=int, default=1000, help='tables smaller than this may be scanned')
+    parser.add_argument('--route', action='append', default=[], help='only routes containing this text')
+    parser.add_argument('--verbose', action='store_true', help='print every plan')
+    args = parser.parse_args(argv)
+    args.cache = False
+    return args
+
+
+class Capture:
+    # the SELECT statements run while `statements` is a list
+
+    def __init__(self):
+        self.statements = None
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        if self.statements is not None and not executemany and \
+                statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            self.statements.append((statement, parameters))
+
+
+def sqlite_scans(cursor, statement, parameters):
+    # (plan lines, tables scanned without an index)
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+    lines = [row[-1] for row in cursor.fetchall()]
+    scanned = set()
+    for line in lines:
+        words = line.split()
+        if words[:1] == ['SCAN'] and len(words) >= 2 and 'USING' not in words and 'VIRTUAL' not in words:
+            # SQLAlchemy's anonymous aliases are the table name and a number
+            scanned.add(_ALIAS.sub('', words[1]))
+    return lines, scanned
+
+
+def postgres_scans(cursor, statement, parameters):
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+    plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    lines, scanned = [], set()
+    nodes = [(plan[0]['Plan'], 0)]
+    while nodes:
+        node, depth = nodes.pop()
+        lines.append('  ' * depth + node['Node Type'] + (f' on {node["Relation Name"]}' if 'Relation Name' in node else ''))
+        if node['Node Type'] == 'Seq Scan':
+            scanned.add(node['Relation Name'])
+        nodes.extend((child, depth + 1) for child in reversed(node.get('Plans', [])))
+    return lines, scanned
+
+
+def table_sizes(db):
+    return {name: db.session.execute(db.select([db.func.count()]).select_from(table)).scalar()
+            for name, table in db.metadata.tables.items()}
+
+
+def check(app, targets, min_rows, verbose=False):
+    # [(route, table, statement)] of the sequential scans of large tables
+    from models import db
+    capture = Capture()
+    event.listen(Engine, 'before_cursor_execute', capture)
+    client = harness.TestClient(app)
+    found = []
+    try:
+        with app.app_context():
+            sizes = table_sizes(db)
+            explain = postgres_scans if db.engine.dialect.name == 'postgresql' else sqlite_scans
+            connection = db.engine.raw_connection()
+        for name, method, path, form in targets:
+            client.request(method, path, form)
+            capture.statements = []
+            client.request(method, path, form)
+            statements, capture.statements = capture.statements, None
+            for statement, parameters in statements:
+                cursor = connection.cursor()
+                try:
+                    lines, scanned = explain(cursor, statement, parameters)
+                finally:
+                    cursor.close()
+                if verbose:
+                    print(name, ' '.join(statement.split())[:200], *lines, sep='\n    ')
+                for table in sorted(scanned):
+                    if sizes.get(table, 0) >= min_rows and table not in ALLOWED.get(name, ()):
+                        found.append((name, table, statement))
+        connection.close()
+    finally:
+        event.remove(Engine, 'before_cursor_execute', capture)
+    return found
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    harness.configure(args)
+    from app import app
+    data = harness.datagen.generate(args.scale, args.seed)
+    harness.prepare(app, data)
+    targets = harness.targets(app, data, args.route)
+    found = check(app, targets, args.min_rows, args.verbose)
+    for name, table, statement in found:
+        print(f'SEQUENTIAL SCAN {name}: "{table}" in', ' '.join(statement.split())[:300])
+    print(f'checked {len(targets)} routes,', f'{len(found)} sequential scans' if found else 'no sequential scans')
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
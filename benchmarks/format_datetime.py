@@ -0,0 +1,41 @@
+import datetime
+import sys
+import timeit
+import babel.dates
+
+# Per-call cost of the `datetime` template filter the way it used to work
+# (babel re-parsing the CLDR pattern and locale on every call) against the
+# cached formatter, for a page's worth of distinct show times.
+#
+#     python -m benchmarks.format_datetime [calls]
+
+sys.path.insert(0, '.')
+import formatting  # noqa: E402
+
+PATTERN = "EEEE MMMM, d, y 'at' h:mma"
+
+
+def legacy(value, format='full'):
+    return babel.dates.format_datetime(value, PATTERN, locale='en')
+
+
+def cached(value, format='full'):
+    return formatting._format(value, format, 'en', 'UTC')
+
+
+def main(calls=5000):
+    start = datetime.datetime(2027, 1, 1, 20)
+    values = [start + datetime.timedelta(hours=i) for i in range(calls)]
+    assert legacy(values[0]) == cached(values[0])
+    results = [
+        ('legacy', lambda: [legacy(value) for value in values]),
+        ('cached pattern, cold', lambda: (formatting._format.cache_clear(), [cached(value) for value in values])),
+        ('cached pattern, warm', lambda: [cached(value) for value in values]),
+    ]
+    for name, run in results:
+        seconds = min(timeit.repeat(run, number=1, repeat=5))
+        print(f'{name:26} {seconds / calls * 1e6:8.2f} us/call')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,316 @@
+import argparse
+import collections
+import datetime
+import importlib.util
+import json
+import math
+import os
+import re
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+# Route benchmarks. Loads `--scale` generated shows (benchmarks.datagen) into
+# a SQLite file kept per scale and seed in the temp directory, or into
+# --database, then requests every read route of the app -- pages, search and
+# the JSON API -- through the Flask test client, or through a running server
+# at --url (loaded with the same datagen arguments). Routes that write are
+# left out. Per route it reports p50/p95/p99 and mean latency, throughput and
+# the queries the SQL profiler counted (streamed API responses query after
+# their headers are sent and show none), and writes them as JSON to --out.
+#
+# With --baseline, a route whose p95 grew by more than --threshold, or that
+# runs more queries or fails where it used to succeed, is a regression and
+# the exit status is 1. A missing baseline file is written from this run;
+# baselines only mean something on the machine that recorded them.
+#
+#     python -m benchmarks.harness --scale 10k --baseline benchmarks/baseline.json
+
+sys.path.insert(0, '.')
+from benchmarks import datagen  # noqa: E402
+
+# endpoints that only read despite their method
+READ_POSTS = {'search_venues', 'search_artists'}
+SKIP = {'static'}
+ARGS = {
+    'autocomplete_venues': {'q': 'The Bl'},
+    'autocomplete_artists': {'q': 'Bl'},
+    'api.venue_availability': {'city': 'New York', 'state': 'NY', 'days': 'fri,sat', 'from': '18:00'},
+}
+FORMS = {
+    'search_venues': {'search_term': 'blue'},
+    'search_artists': {'search_term': 'blue'},
+}
+MIN_REGRESSION_MS = 2.0
+_SCALE = re.compile(r'^(\d+(?:\.\d+)?)([kKmM]?)$')
+_KINDS = re.compile(r'<any\(([^)]*)\):kind>')
+
+
+def scale(value):
+    match = _SCALE.match(value)
+    if match is None:
+        raise argparse.ArgumentTypeError(f'not a number of shows: {value!r}')
+    number, suffix = match.groups()
+    return int(float(number) * {'': 1, 'k': 1000, 'm': 1000000}[suffix.lower()])
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.harness', description='Benchmark the read routes.')
+    parser.add_argument('--scale', type=scale, default=scale('10k'), help='shows to generate (1k, 100k, 1M)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--database', help='database URL, default a SQLite file per scale and seed')
+    parser.add_argument('--regenerate', action='store_true', help='recreate the default SQLite database')
+    parser.add_argument('--url', help='benchmark a running server instead of the test client')
+    parser.add_argument('--requests', type=int, default=50, help='timed requests per route')
+    parser.add_argument('--warmup', type=int, default=5, help='untimed requests per route')
+    parser.add_argument('--cache', action='store_true', help='keep the response cache on')
+    parser.add_argument('--route', action='append', default=[], help='only routes containing this text')
+    parser.add_argument('--out', help='write the results here as JSON')
+    parser.add_argument('--baseline', help='compare against, or create, this results file')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed p95 growth, 0.25 is 25%%')
+    return parser.parse_args(argv)
+
+
+def configure(args):
+    # environment for config.py, before the app is imported
+    if args.database is None:
+        path = os.path.join(tempfile.gettempdir(), f'fyyur-bench-{args.scale}-{args.seed}.db')
+        if args.regenerate and os.path.exists(path):
+            os.remove(path)
+        args.database = f'sqlite:///{path}'
+    os.environ['DATABASE_URL'] = args.database
+    os.environ['DATABASE_REPLICA_URLS'] = ''
+    os.environ['SQL_PROFILE'] = 'header'
+    if not args.cache:
+        os.environ['CACHE_TYPE'] = 'null'
+
+
+def create_schema(db):
+    if db.engine.dialect.name != 'sqlite':
+        import flask_migrate
+        flask_migrate.upgrade()
+        return
+    # the migrations are written for Postgres; SQLite gets the tables from the
+    # models and its search tables from the search migration
+    db.create_all()
+    if 'venue_search' in db.engine.table_names():
+        return
+    from alembic.migration import MigrationContext
+    from alembic.operations import Operations
+    path = os.path.join('migrations', 'versions', '9b4e6f21c3d8_search_indexes.py')
+    spec = importlib.util.spec_from_file_location('search_indexes', path)
+    migration = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(migration)
+    with db.engine.begin() as connection:
+        migration.op = Operations(MigrationContext.configure(connection))
+        migration.upgrade()
+
+
+def prepare(app, data):
+    from models import Venue, db
+    with app.app_context():
+        create_schema(db)
+        if db.session.query(Venue.id).first() is not None:
+            print('using the data already in', app.config['SQLALCHEMY_DATABASE_URI'])
+            return
+        start = time.perf_counter()
+        counts = datagen.load(*data)
+        print('loaded %d venues, %d artists, %d shows' % counts, 'in %.1fs' % (time.perf_counter() - start))
+
+
+def busiest(rows, key):
+    return collections.Counter(row[key] for row in rows).most_common(1)[0][0]
+
+
+def targets(app, data, only=()):
+    # [(name, method, path, form)] for every read route, with the busiest
+    # venue and artist as sample ids
+    _, _, rows = data
+    ids = {'venue_id': busiest(rows, 'venue_id'), 'artist_id': busiest(rows, 'artist_id')}
+    found = []
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: rule.rule):
+        if rule.endpoint in SKIP:
+            continue
+        if 'GET' in rule.methods:
+            method = 'GET'
+        elif 'POST' in rule.methods and rule.endpoint in READ_POSTS:
+            method = 'POST'
+        else:
+            continue
+        kinds = [None]
+        if 'kind' in rule.arguments:
+            kinds = [kind.strip() for kind in _KINDS.search(rule.rule).group(1).split(',')]
+        for kind in kinds:
+            values = dict(ARGS.get(rule.endpoint, {}))
+            if kind is not None:
+                values['kind'] = kind
+                values['entity_id'] = ids['artist_id'] if kind == 'artists' else ids['venue_id']
+            for argument in rule.arguments:
+                if argument in ids:
+                    values[argument] = ids[argument]
+            try:
+                _, path = rule.build(values)
+            except (KeyError, TypeError, ValueError):
+                continue
+            name = f'{method} {rule.rule}'
+            if kind is not None:
+                name = _KINDS.sub(kind, name)
+            if not only or any(text in name for text in only):
+                found.append((name, method, path, FORMS.get(rule.endpoint)))
+    return found
+
+
+class TestClient:
+
+    def __init__(self, app):
+        # errors are counted as 500s rather than raised, as a server would
+        app.config['PROPAGATE_EXCEPTIONS'] = False
+        self.client = app.test_client()
+
+    def request(self, method, path, form):
+        response = self.client.open(path, method=method, data=form)
+        response.get_data()
+        return response.status_code, response.headers.get('X-SQL-Queries')
+
+
+class HTTPClient:
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def request(self, method, path, form):
+        body = urllib.parse.urlencode(form).encode() if form else None
+        try:
+            with urllib.request.urlopen(urllib.request.Request(self.url + path, body, method=method)) as response:
+                response.read()
+                return response.status, response.headers.get('X-SQL-Queries')
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, e.headers.get('X-SQL-Queries')
+
+
+def percentile(ordered, fraction):
+    # nearest rank
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def measure(client, method, path, form, requests, warmup):
+    for _ in range(warmup):
+        client.request(method, path, form)
+    latencies, statuses, queries = [], collections.Counter(), []
+    for _ in range(requests):
+        start = time.perf_counter()
+        status, count = client.request(method, path, form)
+        latencies.append(time.perf_counter() - start)
+        statuses[status] += 1
+        if count is not None:
+            queries.append(int(count))
+    ordered = sorted(latencies)
+    return {
+        'method': method,
+        'path': path,
+        'requests': requests,
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'errors': sum(count for status, count in statuses.items() if status >= 500),
+        'p50_ms': round(percentile(ordered, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(ordered, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(ordered, 0.99) * 1000, 3),
+        'mean_ms': round(sum(latencies) / len(latencies) * 1000, 3),
+        'rps': round(len(latencies) / sum(latencies), 1),
+        'queries': max(queries) if queries else None,
+    }
+
+
+def regressions(results, baseline, threshold):
+    # {route: [reasons]} of the routes doing worse than in the baseline
+    found = {}
+    for name, before in baseline['routes'].items():
+        after = results['routes'].get(name)
+        if after is None:
+            continue
+        reasons = []
+        if after['errors'] and not before['errors']:
+            reasons.append(f'{after["errors"]} server errors')
+        limit = before['p95_ms'] * (1 + threshold)
+        if after['p95_ms'] > limit and after['p95_ms'] - before['p95_ms'] > MIN_REGRESSION_MS:
+            reasons.append(f'p95 {after["p95_ms"]}ms, baseline {before["p95_ms"]}ms')
+        if None not in (after['queries'], before['queries']) and after['queries'] > before['queries']:
+            reasons.append(f'{after["queries"]} queries, baseline {before["queries"]}')
+        if reasons:
+            found[name] = reasons
+    return found
+
+
+def report(results):
+    print(f'{"route":<60} {"p50":>8} {"p95":>8} {"p99":>8} {"rps":>8} {"sql":>4}  status')
+    for name, route in results['routes'].items():
+        statuses = ' '.join(f'{status}x{count}' for status, count in route['statuses'].items())
+        queries = '' if route['queries'] is None else route['queries']
+        print(f'{name:<60} {route["p50_ms"]:>8.2f} {route["p95_ms"]:>8.2f} {route["p99_ms"]:>8.2f} '
+              f'{route["rps"]:>8.1f} {queries:>4}  {statuses}')
+
+
+def write(path, results):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.url is None:
+        configure(args)
+    from app import app
+    data = datagen.generate(args.scale, args.seed, datetime.datetime.utcnow())
+    if args.url is None:
+        prepare(app, data)
+        client = TestClient(app)
+    else:
+        client = HTTPClient(args.url)
+    results = {
+        'meta': {
+            'scale': args.scale,
+            'seed': args.seed,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'target': args.url or 'test client',
+            'database': None if args.url else app.config['SQLALCHEMY_DATABASE_URI'],
+            'cache': args.cache,
+            'python': sys.version.split()[0],
+            'created': datetime.datetime.utcnow().isoformat(timespec='seconds'),
+        },
+        'routes': {},
+    }
+    routes = {name: (method, path, form) for name, method, path, form in targets(app, data, args.route)}
+    for name, (method, path, form) in routes.items():
+        results['routes'][name] = measure(client, method, path, form, args.requests, args.warmup)
+    baseline = None
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline['meta']['scale'], baseline['meta']['seed']) != (args.scale, args.seed):
+            print(f'baseline is for scale {baseline["meta"]["scale"]} seed {baseline["meta"]["seed"]}, '
+                  'not comparing')
+            baseline = None
+    found = {}
+    if baseline is not None:
+        # a slow run can be noise on a busy machine: routes that regressed
+        # are measured again and only count if they still do
+        for name in regressions(results, baseline, args.threshold):
+            results['routes'][name] = measure(client, *routes[name], args.requests, args.warmup)
+        found = regressions(results, baseline, args.threshold)
+    report(results)
+    if args.out:
+        write(args.out, results)
+    if args.baseline and not os.path.exists(args.baseline):
+        write(args.baseline, results)
+        print('no baseline yet, wrote', args.baseline)
+    for name, reasons in found.items():
+        print('REGRESSION', name + ':', '; '.join(reasons))
+    return 1 if found else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,394 @@
+import functools
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import current_app, request, session
+from sqlalchemy import event
+from database import pinned_to_primary, read_replica
+from generation import data_generation
+from models import Venue, Artist, Show, db
+
+# Response cache for the read routes. Every entry records the version of each
+# tag it depends on (e.g. "venue:42", "shows:list") when it is stored; bumping
+# a tag makes all entries that saw an older version stale. Tags are bumped
+# from SQLAlchemy session events after a commit touches a Venue, Artist or
+# Show, so the views never invalidate anything by hand.
+#
+# CACHE_TYPE picks the backend: "lru" keeps entries in process memory, "file"
+# shares entries and tag versions between worker processes through
+# CACHE_DIR, and "null" disables caching.
+#
+# Every entry also records the data generation (generation.py), which the
+# importer bumps from its own process, so an import reaches every worker's
+# "lru" entries as well; it is shared through DATA_GENERATION_FILE.
+#
+# With read replicas, a client that just wrote is pinned to the primary and
+# bypasses the cache, which may hold pages from before its write; and a page
+# rendered from a replica within REPLICA_STICKY_SECONDS of one of its tags
+# being bumped isn't stored, as the replica may not have the write yet.
+#
+# Derived data that isn't a page (availability's busy intervals) goes in its
+# own per-process LRU of CACHE_DERIVED_MAX_ENTRIES, validated by the same tag
+# versions, so it can't evict pages or count as page hits and misses.
+
+
+class LRUBackend:
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._bumped = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def tag_version(self, tag):
+        return self._tags.get(tag, 0)
+
+    def bump(self, tag):
+        with self._lock:
+            self._tags[tag] = self._tags.get(tag, 0) + 1
+            self._bumped[tag] = time.time()
+
+    def bumped_at(self, tag):
+        return self._bumped.get(tag, 0)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+            self._bumped.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileBackend:
+
+    def __init__(self, directory, max_entries):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._writes = 0
+        os.makedirs(os.path.join(directory, 'entries'), exist_ok=True)
+        os.makedirs(os.path.join(directory, 'tags'), exist_ok=True)
+
+    def _path(self, kind, key):
+        return os.path.join(self.directory, kind, hashlib.sha1(key.encode()).hexdigest())
+
+    def _write(self, path, data):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def get(self, key):
+        try:
+            with open(self._path('entries', key), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def set(self, key, value):
+        self._write(self._path('entries', key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._evict()
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path('entries', key))
+        except FileNotFoundError:
+            pass
+
+    def _evict(self):
+        # drops the least recently written entries once over max_entries
+        entries = os.path.join(self.directory, 'entries')
+        files = []
+        for name in os.listdir(entries):
+            try:
+                files.append((os.stat(os.path.join(entries, name)).st_mtime, name))
+            except FileNotFoundError:
+                pass
+        files.sort()
+        for _, name in files[:max(len(files) - self.max_entries, 0)]:
+            try:
+                os.unlink(os.path.join(entries, name))
+                self.evictions += 1
+            except FileNotFoundError:
+                pass
+
+    def tag_version(self, tag):
+        try:
+            with open(self._path('tags', tag), 'rb') as f:
+                return f.read().decode()
+        except FileNotFoundError:
+            return 0
+
+    def bump(self, tag):
+        # versions only need to differ, so a unique token avoids cross-process
+        # read-modify-write races
+        self._write(self._path('tags', tag), uuid.uuid4().hex.encode())
+
+    def bumped_at(self, tag):
+        try:
+            return os.stat(self._path('tags', tag)).st_mtime
+        except FileNotFoundError:
+            return 0
+
+    def clear(self):
+        for kind in ('entries', 'tags'):
+            path = os.path.join(self.directory, kind)
+            for name in os.listdir(path):
+                try:
+                    os.unlink(os.path.join(path, name))
+                except FileNotFoundError:
+                    pass
+
+    def __len__(self):
+        return len(os.listdir(os.path.join(self.directory, 'entries')))
+
+
+def tags_for(obj):
+    # tags a changed Venue, Artist or Show invalidates
+    if isinstance(obj, Venue):
+        return {f'venue:{obj.id}', 'venues:list', 'shows:list', 'home'}
+    if isinstance(obj, Artist):
+        return {f'artist:{obj.id}', 'artists:list', 'shows:list', 'home'}
+    if isinstance(obj, Show):
+        tags = {'shows:list', 'venues:list', 'home'}
+        state = db.inspect(obj)
+        for attr, prefix in (('venue_id', 'venue'), ('artist_id', 'artist')):
+            for value in state.attrs[attr].history.sum():
+                if value is not None:
+                    tags.add(f'{prefix}:{value}')
+        return tags
+    return set()
+
+
+def shared_show_tags(changed):
+    # the detail tags of the artists that played the changed venues and of the
+    # venues that hosted the changed artists, from one query; the session
+    # can't run it after its commit, so it goes through the engine
+    venue_ids = {entity_id for model, entity_id in changed if model is Venue}
+    artist_ids = {entity_id for model, entity_id in changed if model is Artist}
+    conditions = [column.in_(ids) for column, ids in ((Show.venue_id, venue_ids), (Show.artist_id, artist_ids))
+                  if ids]
+    query = db.select([Show.venue_id, Show.artist_id]).distinct().where(db.or_(*conditions))
+    tags = set()
+    with db.engine.connect() as connection:
+        for venue_id, artist_id in connection.execute(query):
+            if venue_id in venue_ids:
+                tags.add(f'artist:{artist_id}')
+            if artist_id in artist_ids:
+                tags.add(f'venue:{venue_id}')
+    return tags
+
+
+# the pseudo-tag whose version is the data generation
+GENERATION_TAG = '@generation'
+
+# bulk Query.update()/delete() calls don't say which rows they touched, so
+# they invalidate every page of that kind
+BULK_TAGS = {
+    Venue: {'venues', 'venues:list', 'shows:list', 'home'},
+    Artist: {'artists', 'artists:list', 'shows:list', 'home'},
+    Show: {'venues', 'artists', 'venues:list', 'shows:list', 'home'},
+}
+
+
+class ResponseCache:
+
+    def __init__(self):
+        self.backend = None
+        self.derived = None
+        self.variants = []
+        self.ttl = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # request threads update the counters concurrently
+        self._stats_lock = threading.Lock()
+
+    def init_app(self, app):
+        cache_type = app.config.get('CACHE_TYPE', 'lru')
+        max_entries = app.config.get('CACHE_MAX_ENTRIES', 1024)
+        if cache_type == 'lru':
+            self.backend = LRUBackend(max_entries)
+        elif cache_type == 'file':
+            self.backend = FileBackend(app.config['CACHE_DIR'], max_entries)
+        elif cache_type == 'null':
+            self.backend = None
+        else:
+            raise ValueError(f'Unknown CACHE_TYPE {cache_type!r}')
+        self.derived = LRUBackend(app.config.get('CACHE_DERIVED_MAX_ENTRIES', 4096)) \
+            if self.backend is not None else None
+        self.ttl = app.config.get('CACHE_TTL')
+        event.listen(db.session, 'after_flush', self._collect_tags)
+        event.listen(db.session, 'after_bulk_update', self._collect_bulk_tags)
+        event.listen(db.session, 'after_bulk_delete', self._collect_bulk_tags)
+        event.listen(db.session, 'after_commit', self._invalidate_pending)
+        event.listen(db.session, 'after_rollback', self._discard_pending)
+
+    def _collect_tags(self, session, flush_context):
+        tags = session.info.setdefault('cache_tags', set())
+        for obj in session.new:
+            tags |= tags_for(obj)
+        for obj in list(session.dirty) + list(session.deleted):
+            tags |= tags_for(obj)
+            if isinstance(obj, (Venue, Artist)):
+                # the other side's detail pages show this entity's name; they
+                # are looked up once, at commit
+                session.info.setdefault('cache_changed', set()).add((type(obj), obj.id))
+
+    def _collect_bulk_tags(self, update_context):
+        mapper = update_context.mapper
+        if mapper is not None:
+            tags = update_context.session.info.setdefault('cache_tags', set())
+            tags |= BULK_TAGS.get(mapper.class_, set())
+
+    def _invalidate_pending(self, session):
+        tags = session.info.pop('cache_tags', None)
+        changed = session.info.pop('cache_changed', None)
+        if changed and self.backend is not None:
+            tags |= shared_show_tags(changed)
+        if tags:
+            self.invalidate(*tags)
+
+    def _discard_pending(self, session):
+        session.info.pop('cache_tags', None)
+        session.info.pop('cache_changed', None)
+
+    def invalidate(self, *tags):
+        if self.backend is None:
+            return
+        for tag in tags:
+            self.backend.bump(tag)
+        with self._stats_lock:
+            self.invalidations += len(tags)
+
+    def get(self, key, store=None):
+        # lookups in a `store` other than the page backend aren't counted
+        entry = (store or self.backend).get(key)
+        if entry is not None:
+            versions, expires, value = entry
+            if (expires is None or expires > time.time()) and \
+                    all(self.tag_version(tag) == version for tag, version in versions.items()):
+                if store is None:
+                    with self._stats_lock:
+                        self.hits += 1
+                return value
+            (store or self.backend).delete(key)
+        if store is None:
+            with self._stats_lock:
+                self.misses += 1
+        return None
+
+    def set(self, key, value, tags, versions=None, store=None):
+        # pass the versions read before computing `value` so that a concurrent
+        # invalidation isn't masked by storing stale data under new versions
+        if versions is None:
+            versions = self.versions(tags)
+        expires = time.time() + self.ttl if self.ttl else None
+        (store or self.backend).set(key, (versions, expires, value))
+
+    def vary(self, func):
+        # `func()` names a variant of the current request (e.g. its locale)
+        # that needs its own cache entries and ETags
+        self.variants.append(func)
+        return func
+
+    def request_key(self):
+        return '|'.join(['view:' + request.full_path] + [func() for func in self.variants])
+
+    def tag_version(self, tag):
+        return data_generation.current() if tag == GENERATION_TAG else self.backend.tag_version(tag)
+
+    def versions(self, tags):
+        return {tag: self.tag_version(tag) for tag in [*tags, GENERATION_TAG]}
+
+    def cached(self, *tags, vary=None):
+        # caches a GET view's 200 responses; tags may use the view's arguments,
+        # e.g. @cache.cached('venue:{venue_id}'), and `vary()` names what else
+        # the response depends on besides the URL (e.g. a window from today)
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(**kwargs):
+                if self.backend is None or request.method not in ('GET', 'HEAD') or '_flashes' in session \
+                        or pinned_to_primary():
+                    return view(**kwargs)
+                key = self.request_key()
+                if vary is not None:
+                    key += '|' + vary()
+                response = self.lookup(key)
+                if response is not None:
+                    return response
+                entry_tags = [tag.format(**kwargs) for tag in tags]
+                versions = self.versions(entry_tags)
+                return self.store(key, current_app.make_response(view(**kwargs)), entry_tags, versions)
+            return wrapper
+        return decorator
+
+    def lookup(self, key):
+        # the stored response for `key`, or None
+        cached = self.get(key)
+        if cached is None:
+            return None
+        body, status, headers = cached
+        return current_app.response_class(body, status, headers).make_conditional(request)
+
+    def store(self, key, response, tags, versions):
+        if response.status_code == 200 and not response.direct_passthrough and not self.may_lag(tags):
+            headers = [(name, value) for name, value in response.headers if name != 'Set-Cookie']
+            self.set(key, (response.get_data(), response.status_code, headers), tags, versions)
+        return response
+
+    def may_lag(self, tags):
+        # whether the response was read from a replica soon enough after an
+        # invalidation of `tags` to predate the write behind it
+        if read_replica() is None:
+            return False
+        since = time.time() - current_app.config.get('REPLICA_STICKY_SECONDS', 5)
+        return any(self.backend.bumped_at(tag) > since for tag in tags)
+
+    def stats(self):
+        with self._stats_lock:
+            hits, misses, invalidations = self.hits, self.misses, self.invalidations
+        lookups = hits + misses
+        return {
+            'backend': type(self.backend).__name__ if self.backend else None,
+            'entries': len(self.backend) if self.backend else 0,
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / lookups if lookups else None,
+            'evictions': self.backend.evictions if self.backend else 0,
+            'invalidations': invalidations,
+            'derived_entries': len(self.derived) if self.derived else 0,
+        }
+
+
+cache = ResponseCache()
@@ -0,0 +1,178 @@
+import datetime
+import functools
+import hashlib
+from flask import current_app, request, session
+from sqlalchemy import DDL, event
+from models import Venue, Artist, Show, Deletion, db
+from cache import cache
+from feed import home_feed
+
+# Conditional GET for the read routes. A validator runs one cheap aggregate
+# query (latest updated_at plus row counts) and the result is hashed into an
+# ETag; when it matches If-None-Match, or Last-Modified is not newer than
+# If-Modified-Since, the view answers 304 without querying or rendering
+# anything else.
+#
+# Last-Modified has to move with everything a page shows. A deleted row
+# leaves no updated_at behind, so triggers record the last deletion from each
+# table in Deletion (any deletion of a show moves every detail page's date);
+# and a show moving from upcoming to past changes no row, so detail pages also
+# count the start of their latest past show. The home page's feed has no
+# dates and sends no Last-Modified.
+
+DELETION_TABLES = (Venue, Artist, Show)
+
+SQLITE_TRIGGERS = [
+    f'CREATE TRIGGER deletion_{model.__tablename__.lower()}_ad AFTER DELETE ON "{model.__tablename__}" BEGIN '
+    f"UPDATE \"Deletion\" SET deleted_at = CURRENT_TIMESTAMP WHERE table_name = '{model.__tablename__}'; END"
+    for model in DELETION_TABLES
+]
+
+POSTGRES_TRIGGERS = [
+    'CREATE OR REPLACE FUNCTION record_deletion() RETURNS trigger AS $$ BEGIN '
+    'UPDATE "Deletion" SET deleted_at = TIMEZONE(\'utc\', CURRENT_TIMESTAMP) WHERE table_name = TG_TABLE_NAME; '
+    'RETURN NULL; END $$ LANGUAGE plpgsql',
+] + [
+    f'CREATE TRIGGER deletion_{model.__tablename__.lower()} AFTER DELETE ON "{model.__tablename__}" '
+    'FOR EACH STATEMENT EXECUTE PROCEDURE record_deletion()'
+    for model in DELETION_TABLES
+]
+
+event.listen(Deletion.__table__, 'after_create', DDL(
+    'INSERT INTO "Deletion" (table_name) VALUES '
+    + ', '.join(f"('{model.__tablename__}')" for model in DELETION_TABLES)))
+for dialect, statements in (('sqlite', SQLITE_TRIGGERS), ('postgresql', POSTGRES_TRIGGERS)):
+    for statement in statements:
+        # once every table exists
+        event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect=dialect))
+
+
+def conditional(validator):
+    # `validator(**view_args)` returns (last_modified, *other_state) or None
+    # when there is nothing to validate (e.g. the entity doesn't exist)
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(**kwargs):
+            if request.method not in ('GET', 'HEAD') or '_flashes' in session:
+                return view(**kwargs)
+            state = validator(**kwargs)
+            if state is None:
+                return view(**kwargs)
+            etag, last_modified, not_modified = check(state)
+            if not_modified is not None:
+                return not_modified
+            return stamp(current_app.make_response(view(**kwargs)), etag, last_modified)
+        return wrapper
+    return decorator
+
+
+def check(state):
+    # (etag, last_modified, 304 response or None) for a validator's state
+    last_modified = state[0]
+    if last_modified is not None:
+        last_modified = last_modified.replace(tzinfo=datetime.timezone.utc, microsecond=0)
+    etag = hashlib.sha1(repr((cache.request_key(),) + tuple(state)).encode()).hexdigest()
+    probe = current_app.response_class()
+    probe.set_etag(etag)
+    # werkzeug stamps the current time when it is set to None
+    if last_modified is not None:
+        probe.last_modified = last_modified
+    if probe.make_conditional(request).status_code == 304:
+        return etag, last_modified, probe
+    return etag, last_modified, None
+
+
+def stamp(response, etag, last_modified):
+    if response.status_code == 200:
+        response.set_etag(etag)
+        if last_modified is not None:
+            response.last_modified = last_modified
+        response.cache_control.no_cache = True
+    return response
+
+
+def _latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def _table_state(model):
+    # (latest updated_at, count) as scalar subqueries, so that several
+    # tables' states share one SELECT without a FROM
+    return [db.select([aggregate]).scalar_subquery()
+            for aggregate in (db.func.max(model.updated_at), db.func.count(model.id))]
+
+
+def _deleted_at(model):
+    return db.select([Deletion.deleted_at]).where(Deletion.table_name == model.__tablename__).scalar_subquery()
+
+
+# the *_statement() / *_result() halves let callers with their own
+# connection (asgi.py) run a validator
+
+
+def listing_statement(*models):
+    # (latest updated_at, count) per model, then the last deletion from each,
+    # in one statement
+    columns = [column for model in models for column in _table_state(model)]
+    columns.extend(_deleted_at(model) for model in models)
+    return db.select(columns)
+
+
+def listing_result(row):
+    states = len(row) // 3 * 2
+    return (_latest(*row[:states:2], *row[states:]),) + tuple(row[1:states:2])
+
+
+def listing_state(*models):
+    return listing_result(db.session.execute(listing_statement(*models)).first())
+
+
+def venues_state():
+    return listing_state(Venue)
+
+
+def artists_state():
+    return listing_state(Artist)
+
+
+def shows_state():
+    return listing_state(Show, Artist, Venue)
+
+
+def home_state():
+    # the home page shows the in-memory feed, which is its own validator
+    return (None, home_feed.state())
+
+
+def detail_statement(model, entity_id):
+    other = Artist if model is Venue else Venue
+    foreign_key, other_key = (Show.venue_id, Show.artist_id) if model is Venue else (Show.artist_id, Show.venue_id)
+    now = datetime.datetime.utcnow()
+    entity = db.select([model.updated_at]).where(model.id == entity_id).as_scalar()
+    return (db.session.query(entity,
+                             db.func.max(Show.updated_at),
+                             db.func.max(other.updated_at),
+                             db.func.count(Show.id),
+                             db.func.sum(db.case([(Show.start_time > now, 1)], else_=0)),
+                             db.func.max(db.case([(Show.start_time <= now, Show.start_time)])),
+                             _deleted_at(Show))
+            .select_from(Show)
+            .outerjoin(other, other.id == other_key)
+            .filter(foreign_key == entity_id)
+            .statement)
+
+
+def detail_result(row):
+    if row[0] is None:
+        return None
+    # the upcoming count changes as shows start even when no row does
+    return (_latest(*row[:3], *row[5:]), row[3], row[4] or 0)
+
+
+def venue_state(venue_id):
+    return detail_result(db.session.execute(detail_statement(Venue, venue_id)).first())
+
+
+def artist_state(artist_id):
+    return detail_result(db.session.execute(detail_statement(Artist, artist_id)).first())
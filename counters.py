@@ -0,0 +1,134 @@
+import datetime
+import click
+from flask.cli import AppGroup
+from models import Venue, Artist, Show, db
+from tasks import task_queue
+
+# Venue and Artist carry denormalized upcoming/past show counters so listings
+# don't have to aggregate the Show table on every request. The write handlers
+# queue a background refresh of each venue and artist whose shows changed
+# (refresh_later); the importer bumps them in bulk in its own transaction.
+# `flask counters rollover` moves shows from upcoming to past as time passes
+# and `flask counters check` recomputes them in bulk.
+
+counters_cli = AppGroup('counters', help='Maintain the upcoming/past show counters.')
+
+SHOW_FOREIGN_KEYS = {Venue: Show.venue_id, Artist: Show.artist_id}
+MODELS = {model.__name__: model for model in SHOW_FOREIGN_KEYS}
+
+
+def record_shows(shows, now=None):
+    # bumps the counters for (venue_id, artist_id, start_time) rows: one
+    # executemany of primary-key updates per table and counter
+    now = now or datetime.datetime.utcnow()
+    increments = {}
+    for venue_id, artist_id, start_time in shows:
+        column = 'upcoming_shows_count' if start_time > now else 'past_shows_count'
+        for model, entity_id in ((Venue, venue_id), (Artist, artist_id)):
+            if entity_id is not None:
+                key = (model, column)
+                increments.setdefault(key, {})
+                increments[key][entity_id] = increments[key].get(entity_id, 0) + 1
+    for (model, column), counts in increments.items():
+        table = model.__table__
+        statement = (table.update().where(table.c.id == db.bindparam('entity_id'))
+                     .values({column: table.c[column] + db.bindparam('increment')}))
+        db.session.execute(statement, [{'entity_id': entity_id, 'increment': increment}
+                                       for entity_id, increment in counts.items()])
+
+
+def refresh(model, ids=None, now=None):
+    # recomputes the counters of `model` from the Show table with a single
+    # UPDATE, restricted to `ids` when given
+    now = now or datetime.datetime.utcnow()
+    foreign_key = SHOW_FOREIGN_KEYS[model]
+    upcoming = (db.select([db.func.count(Show.id)])
+                .where(foreign_key == model.id).where(Show.start_time > now).as_scalar())
+    past = (db.select([db.func.count(Show.id)])
+            .where(foreign_key == model.id).where(Show.start_time <= now).as_scalar())
+    query = model.query
+    if ids is not None:
+        ids = list(ids)
+        if not ids:
+            return 0
+        query = query.filter(model.id.in_(ids))
+    return query.update({model.upcoming_shows_count: upcoming, model.past_shows_count: past},
+                        synchronize_session=False)
+
+
+@task_queue.task('counters.refresh')
+def refresh_entity(model, entity_id):
+    # recomputing rather than incrementing makes retries and duplicates harmless
+    refresh(MODELS[model], [entity_id])
+
+
+def refresh_later(model, ids):
+    # queues a counter refresh per venue or artist, call after commit
+    for entity_id in ids:
+        if entity_id is not None:
+            task_queue.enqueue('counters.refresh', model=model.__name__, entity_id=int(entity_id))
+
+
+def delete_shows_of(model, entity_id):
+    # deletes every show of a venue or artist, call before commit; returns the
+    # ids of the entities on the other side of those shows, for refresh_later
+    foreign_key = SHOW_FOREIGN_KEYS[model]
+    other_key = SHOW_FOREIGN_KEYS[Artist if model is Venue else Venue]
+    other_ids = [row[0] for row in db.session.query(other_key).filter(foreign_key == entity_id)
+                 .filter(other_key.isnot(None)).distinct()]
+    Show.query.filter(foreign_key == entity_id).delete(synchronize_session=False)
+    return other_ids
+
+
+def mismatches(model, now=None):
+    # yields (id, stored upcoming, stored past, actual upcoming, actual past)
+    now = now or datetime.datetime.utcnow()
+    foreign_key = SHOW_FOREIGN_KEYS[model]
+    actual = (db.session.query(foreign_key.label('entity_id'),
+                               db.func.sum(db.case([(Show.start_time > now, 1)], else_=0)).label('upcoming'),
+                               db.func.sum(db.case([(Show.start_time <= now, 1)], else_=0)).label('past'))
+              .group_by(foreign_key).subquery())
+    rows = (db.session.query(model.id, model.upcoming_shows_count, model.past_shows_count,
+                             db.func.coalesce(actual.c.upcoming, 0), db.func.coalesce(actual.c.past, 0))
+            .outerjoin(actual, actual.c.entity_id == model.id))
+    for row in rows:
+        if (row[1], row[2]) != (row[3], row[4]):
+            yield row
+
+
+@counters_cli.command('rollover')
+@click.option('--hours', default=24, show_default=True,
+              help='Refresh entities with shows that started within this many hours.')
+def rollover(hours):
+    """Move shows that have started from the upcoming to the past counters."""
+    now = datetime.datetime.utcnow()
+    since = now - datetime.timedelta(hours=hours)
+    started = Show.query.filter(Show.start_time > since, Show.start_time <= now)
+    venue_ids = [row[0] for row in started.with_entities(Show.venue_id).distinct()]
+    artist_ids = [row[0] for row in started.with_entities(Show.artist_id).distinct()]
+    refresh(Venue, venue_ids, now)
+    refresh(Artist, artist_ids, now)
+    db.session.commit()
+    click.echo(f'Rolled over {len(venue_ids)} venues and {len(artist_ids)} artists.')
+
+
+@counters_cli.command('check')
+@click.option('--fix', is_flag=True, help='Recompute every counter after reporting.')
+def check(fix):
+    """Report venues and artists whose counters disagree with the Show table."""
+    now = datetime.datetime.utcnow()
+    total = 0
+    for model in (Venue, Artist):
+        for row in mismatches(model, now):
+            total += 1
+            click.echo(f'{model.__tablename__} {row[0]}: stored {row[1]}/{row[2]}, '
+                       f'actual {row[3]}/{row[4]} (upcoming/past)')
+    if fix:
+        refresh(Venue, now=now)
+        refresh(Artist, now=now)
+        db.session.commit()
+        click.echo(f'Recomputed counters, {total} were out of date.')
+    else:
+        click.echo(f'{total} counters out of date.')
+    if total and not fix:
+        raise SystemExit(1)
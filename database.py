@@ -0,0 +1,168 @@
+import itertools
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, _EngineConnector
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool, StaticPool
+
+# Engines and session routing. GET/HEAD requests and search read from the
+# replicas in REPLICA_BINDS (SQLALCHEMY_BINDS entries), one replica per
+# session picked round-robin; everything else, and any statement after the
+# session has flushed, uses the primary. A client that wrote something reads
+# from the primary for REPLICA_STICKY_SECONDS afterwards, so it sees its own
+# writes despite replication lag; the response cache skips such clients and
+# doesn't keep replica renders from that long after an invalidation. The
+# deadline is a plain cookie rather than part of the signed session, so every
+# worker can read it whatever its SECRET_KEY; forging one only sends that
+# client to the primary.
+#
+# Every engine uses a TimedQueuePool sized from SQLALCHEMY_ENGINE_OPTIONS,
+# which records how long each checkout waited for a connection.
+
+# POST routes that only read
+READ_ENDPOINTS = {'search_venues', 'search_artists'}
+STICKY_KEY = 'db_primary_until'
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolStats:
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, wait):
+        with self._lock:
+            stats = self._pools.setdefault(name, {
+                'checkouts': 0,
+                'wait_seconds_total': 0.0,
+                'wait_seconds_max': 0.0,
+                'wait_buckets': [0] * len(WAIT_BUCKETS),
+            })
+            stats['checkouts'] += 1
+            stats['wait_seconds_total'] += wait
+            stats['wait_seconds_max'] = max(stats['wait_seconds_max'], wait)
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if wait <= bound:
+                    stats['wait_buckets'][i] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(stats, wait_buckets=list(stats['wait_buckets']))
+                    for name, stats in self._pools.items()}
+
+
+pool_stats = PoolStats()
+
+
+class TimedQueuePool(QueuePool):
+    # a QueuePool recording the time each checkout waits for a connection,
+    # under the engine's bind name
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            pool_stats.record(self.logging_name, time.perf_counter() - start)
+
+
+class Connector(_EngineConnector):
+
+    def get_options(self, sa_url, echo):
+        result = super().get_options(sa_url, echo)
+        # Flask-SQLAlchemy 2.5 returns (sa_url, options)
+        options = result[1] if isinstance(result, tuple) else result
+        if options.get('poolclass') is StaticPool:
+            # in-memory SQLite has a single connection
+            for option in ('pool_size', 'max_overflow', 'pool_timeout'):
+                options.pop(option, None)
+        else:
+            options['poolclass'] = TimedQueuePool
+            options['pool_logging_name'] = self._bind or 'primary'
+            if sa_url.drivername.startswith('sqlite'):
+                options.setdefault('connect_args', {})['check_same_thread'] = False
+        return result
+
+
+class RoutingSession(SignallingSession):
+
+    _replicas = itertools.count()
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if self.info.get('replica') and not self._flushing and not self.info.get('wrote'):
+            replicas = self.app.config.get('REPLICA_BINDS') or ()
+            if replicas:
+                if 'replica_bind' not in self.info:
+                    self.info['replica_bind'] = replicas[next(self._replicas) % len(replicas)]
+                if has_request_context():
+                    g.db_replica = self.info['replica_bind']
+                db = self.app.extensions['sqlalchemy'].db
+                return db.get_engine(self.app, bind=self.info['replica_bind'])
+        return super().get_bind(mapper, clause, **kw)
+
+
+def sticky_until():
+    # the time until which the current client reads from the primary
+    try:
+        return float(request.cookies.get(STICKY_KEY, 0))
+    except ValueError:
+        return 0
+
+
+def pinned_to_primary():
+    # whether the current client reads from the primary, despite replicas,
+    # because it wrote within REPLICA_STICKY_SECONDS
+    return bool(current_app.config.get('REPLICA_BINDS')) and sticky_until() >= time.time()
+
+
+def read_replica():
+    # the replica bind the current request read from, or None
+    return g.get('db_replica') if not g.get('db_wrote') else None
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def make_connector(self, app=None, bind=None):
+        return Connector(self, self.get_app(app), bind)
+
+    def init_app(self, app):
+        super().init_app(app)
+        event.listen(self.session, 'after_flush', mark_write)
+
+        @app.before_request
+        def route_reads():
+            if request.method in ('GET', 'HEAD') or request.endpoint in READ_ENDPOINTS:
+                if sticky_until() < time.time():
+                    self.session.info['replica'] = True
+
+        @app.after_request
+        def stick_to_primary(response):
+            if g.get('db_wrote'):
+                seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+                response.set_cookie(STICKY_KEY, str(time.time() + seconds), max_age=seconds, httponly=True,
+                                    samesite='Lax')
+            return response
+
+    def stats(self):
+        # checkout waits and current pool usage per bind
+        stats = pool_stats.snapshot()
+        app = self.get_app()
+        for bind in [None] + list(app.config.get('SQLALCHEMY_BINDS') or ()):
+            pool = self.get_engine(app, bind=bind).pool
+            if isinstance(pool, QueuePool):
+                stats.setdefault(bind or 'primary', {}).update(
+                    size=pool.size(), checked_out=pool.checkedout(), overflow=pool.overflow())
+        return stats
+
+
+def mark_write(session, flush_context):
+    # later reads of this session, and of this client for a while, go to
+    # the primary
+    session.info['wrote'] = True
+    if has_request_context():
+        g.db_wrote = True
@@ -0,0 +1,245 @@
+import csv
+import datetime
+import json
+import itertools
+import os
+import sys
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import DDL, event
+from models import Venue, Artist, Show, Tombstone, db
+from api import dumps, stream_rows
+import genres
+
+# `flask export venues|artists|shows OUT` streams a table to CSV, NDJSON or
+# Parquet in constant memory: rows come from a server-side cursor in chunks
+# and are written as they arrive.
+#
+# --incremental exports the rows changed since the previous run, then a
+# tombstone (the id, deleted=true) for each row deleted since; every record
+# gets a `deleted` field. The watermark is the newest updated_at (and
+# deleted_at) exported. A transaction can stamp a row before that and commit
+# after the export read, so each run reads from EXPORT_OVERLAP_SECONDS before
+# the watermark and skips the (id, updated_at) pairs the state file says were
+# already exported. Triggers record deletions in Tombstone.
+
+export_cli = AppGroup('export', help='Export venues, artists and shows.')
+
+TOMBSTONE_TABLES = (Venue, Artist, Show)
+
+SQLITE_TRIGGERS = [
+    f'CREATE TRIGGER tombstone_{model.__tablename__.lower()}_ad AFTER DELETE ON "{model.__tablename__}" BEGIN '
+    f"INSERT INTO \"Tombstone\" (table_name, row_id) VALUES ('{model.__tablename__}', OLD.id); END"
+    for model in TOMBSTONE_TABLES
+]
+
+POSTGRES_TRIGGERS = [
+    'CREATE OR REPLACE FUNCTION record_tombstone() RETURNS trigger AS $$ BEGIN '
+    'INSERT INTO "Tombstone" (table_name, row_id) VALUES (TG_TABLE_NAME, OLD.id); '
+    'RETURN NULL; END $$ LANGUAGE plpgsql',
+] + [
+    f'CREATE TRIGGER tombstone_{model.__tablename__.lower()} AFTER DELETE ON "{model.__tablename__}" '
+    'FOR EACH ROW EXECUTE PROCEDURE record_tombstone()'
+    for model in TOMBSTONE_TABLES
+]
+
+for dialect, statements in (('sqlite', SQLITE_TRIGGERS), ('postgresql', POSTGRES_TRIGGERS)):
+    for statement in statements:
+        # once every table exists
+        event.listen(db.metadata, 'after_create', DDL(statement).execute_if(dialect=dialect))
+
+
+def table_columns(model):
+    return [getattr(model, column.key) for column in db.inspect(model).column_attrs]
+
+
+def write_csv(f, keys, records):
+    writer = csv.writer(f)
+    writer.writerow(keys)
+    for record in records:
+        writer.writerow([';'.join(value) if isinstance(value, list) else
+                         value.isoformat() if isinstance(value, datetime.datetime) else value
+                         for value in record.values()])
+
+
+def write_ndjson(f, keys, records):
+    for record in records:
+        f.write(dumps(record) + '\n')
+
+
+def arrow_schema(pa, columns, with_genres, with_deleted=False):
+    types = []
+    for column in columns:
+        if isinstance(column.type, db.Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(column.type, db.Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, db.DateTime):
+            arrow_type = pa.timestamp('us')
+        else:
+            arrow_type = pa.string()
+        types.append(pa.field(column.key, arrow_type))
+    if with_genres:
+        types.append(pa.field('genres', pa.list_(pa.string())))
+    if with_deleted:
+        types.append(pa.field('deleted', pa.bool_()))
+    return pa.schema(types)
+
+
+def write_parquet(path, columns, with_genres, with_deleted, records, chunk_size):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise click.UsageError('--format parquet requires pyarrow to be installed.')
+    schema = arrow_schema(pa, columns, with_genres, with_deleted)
+    with pq.ParquetWriter(path, schema, compression='zstd') as writer:
+        chunk = []
+        for record in records:
+            chunk.append(record)
+            if len(chunk) >= chunk_size:
+                writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+                chunk = []
+        if chunk:
+            writer.write_table(pa.Table.from_pylist(chunk, schema=schema))
+
+
+class Progress:
+    # the watermark of one stream of records (rows or tombstones): the newest
+    # updated_at exported and the (id, updated_at) pairs within `overlap` of
+    # it, which the next run reads again and skips
+
+    def __init__(self, overlap, watermark=None, seen=()):
+        self.overlap = overlap
+        self.watermark = watermark
+        self.seen = {(record_id, stamp) for record_id, stamp in seen}
+        self.count = 0
+        self._pruned_at = len(self.seen)
+
+    @classmethod
+    def load(cls, overlap, state, prefix=''):
+        watermark = state.get(f'{prefix}watermark')
+        return cls(overlap, watermark and datetime.datetime.fromisoformat(watermark),
+                   [(record_id, datetime.datetime.fromisoformat(stamp))
+                    for record_id, stamp in state.get(f'{prefix}seen', ())])
+
+    def dump(self, prefix=''):
+        return {f'{prefix}watermark': self.watermark and self.watermark.isoformat(),
+                f'{prefix}seen': sorted([record_id, stamp.isoformat()] for record_id, stamp in self._recent())}
+
+    def since(self):
+        # where the next read starts, or None to read everything
+        return self.watermark and self.watermark - self.overlap
+
+    def track(self, records):
+        # skips records already exported and counts and remembers the others
+        for record in records:
+            stamp = record['updated_at']
+            if (record['id'], stamp) in self.seen:
+                continue
+            self.count += 1
+            if stamp is not None:
+                if self.watermark is None or stamp > self.watermark:
+                    self.watermark = stamp
+                self.seen.add((record['id'], stamp))
+                if len(self.seen) > 2 * self._pruned_at + 1000:
+                    self.seen = self._recent()
+                    self._pruned_at = len(self.seen)
+            yield record
+
+    def _recent(self):
+        return {(record_id, stamp) for record_id, stamp in self.seen if stamp > self.since()}
+
+
+def read_state(state_file):
+    try:
+        with open(state_file, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def write_state(state_file, state):
+    with open(state_file, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+
+
+def tombstones(model, keys, progress, chunk_size):
+    # records for the rows of `model` deleted since the watermark, with the
+    # deletion time as their updated_at
+    query = (db.session.query(Tombstone.row_id, Tombstone.deleted_at)
+             .filter(Tombstone.table_name == model.__tablename__))
+    if progress.since() is not None:
+        query = query.filter(Tombstone.deleted_at > progress.since())
+    for row in stream_rows(query.order_by(Tombstone.id), ('id', 'updated_at'), chunk_size):
+        yield dict(dict.fromkeys(keys), **row, deleted=True)
+
+
+def live(records):
+    for record in records:
+        record['deleted'] = False
+        yield record
+
+
+def run_export(model, out, fmt, chunk_size, incremental, state_file):
+    started = time.perf_counter()
+    state_file = state_file or f'{out}.watermark'
+    overlap = datetime.timedelta(seconds=current_app.config.get('EXPORT_OVERLAP_SECONDS', 300))
+    state = read_state(state_file) if incremental else {}
+    rows, deleted = Progress.load(overlap, state), Progress.load(overlap, state, 'deleted_')
+    columns = table_columns(model)
+    keys = [column.key for column in columns]
+    query = db.session.query(*columns).order_by(model.id)
+    if rows.since() is not None:
+        query = query.filter(model.updated_at > rows.since())
+    records = rows.track(stream_rows(query, keys, chunk_size))
+    with_genres = model in genres.ASSOCIATIONS
+    if with_genres:
+        records = genres.with_genres(model, records, chunk_size)
+        keys = keys + ['genres']
+    if incremental:
+        removed = deleted.track(tombstones(model, keys, deleted, chunk_size))
+        records = itertools.chain(live(records), removed)
+        keys = keys + ['deleted']
+    if out == '-':
+        if fmt == 'parquet':
+            raise click.UsageError('--format parquet needs a file path.')
+        (write_csv if fmt == 'csv' else write_ndjson)(sys.stdout, keys, records)
+    else:
+        # written next to the target and renamed, so readers never see a
+        # partial export
+        tmp = f'{out}.tmp'
+        if fmt == 'parquet':
+            write_parquet(tmp, columns, with_genres, incremental, records, chunk_size)
+        else:
+            with open(tmp, 'w', encoding='utf-8', newline='') as f:
+                (write_csv if fmt == 'csv' else write_ndjson)(f, keys, records)
+        os.replace(tmp, out)
+    if incremental:
+        write_state(state_file, {**rows.dump(), **deleted.dump('deleted_')})
+    elapsed = time.perf_counter() - started
+    click.echo(f'{model.__tablename__}: exported {rows.count} rows and {deleted.count} deletions '
+               f'in {elapsed:.1f}s', err=True)
+
+
+def _command(model, name):
+    @export_cli.command(name, help=f'Export {name} to OUT (- for stdout).')
+    @click.argument('out')
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson', 'parquet']),
+                  help='Output format, guessed from the file extension by default.')
+    @click.option('--chunk-size', default=5000, show_default=True, help='Rows fetched per round-trip.')
+    @click.option('--incremental', is_flag=True, help='Only export rows changed since the last run.')
+    @click.option('--state-file', help='Where the incremental watermark is kept [default: OUT.watermark].')
+    def command(out, fmt, chunk_size, incremental, state_file):
+        if fmt is None:
+            extension = os.path.splitext(out)[1].lower().lstrip('.')
+            fmt = extension if extension in ('csv', 'parquet') else 'ndjson'
+        run_export(model, out, fmt, chunk_size, incremental, state_file)
+    return command
+
+
+export_venues = _command(Venue, 'venues')
+export_artists = _command(Artist, 'artists')
+export_shows = _command(Show, 'shows')
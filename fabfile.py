@@ -5,11 +5,15 @@ from fabric.contrib.console import confirm
 
 
 def test():
+    # tests, query plans, then route benchmarks against the baseline
+    # recorded on this machine
     with settings(warn_only=True):
         result = local(
-            "python test_tasks.py -v && python test_users.py -v", capture=True
+            "python -m pytest -q tests && "
+            "python -m benchmarks.explain --scale 10k && "
+            "python -m benchmarks.harness --scale 1k --requests 100 --baseline benchmarks/baseline.json"
         )
-    if result.failed and not confirm("Tests failed. Continue?"):
+    if result.failed and not confirm("Tests, query plans or benchmarks failed. Continue?"):
         abort("Aborted at user request.")
 
 
@@ -40,7 +44,7 @@ def heroku():
 
 def heroku_test():
     local(
-        "heroku run python test_tasks.py -v && heroku run python test_users.py -v"
+        "heroku run python -m benchmarks.harness --scale 1k --requests 20"
     )
 
 
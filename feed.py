@@ -0,0 +1,146 @@
+import collections
+import threading
+from sqlalchemy import event
+from models import Venue, Artist, Show, db
+from generation import data_generation
+
+# Recently added artists, venues and shows for the home page, newest first.
+# Each worker keeps the last HOME_FEED_SIZE of each in a ring buffer (a
+# bounded deque) filled from the database on first use; session events add
+# the entities a commit created, update renamed ones and drop deleted ones,
+# so the home page reads no rows. Bulk deletes and core inserts (the
+# importer) move the data generation, which makes the next read reload.
+
+KINDS = {Artist: 'artists', Venue: 'venues', Show: 'shows'}
+
+
+def entity_entry(row):
+    return {'id': row.id, 'name': row.name, 'image_link': row.image_link, 'date_created': row.date_created}
+
+
+def show_entry(show, artist, venue):
+    return {
+        'id': show.id,
+        'start_time': show.start_time,
+        'artist_id': show.artist_id,
+        'artist_name': artist.name,
+        'artist_image_link': artist.image_link,
+        'venue_id': show.venue_id,
+        'venue_name': venue.name,
+    }
+
+
+class Feed:
+
+    def __init__(self, size=10):
+        self.size = size
+        self.loaded = False
+        self.generation = None
+        self._lock = threading.Lock()
+        self._items = {kind: collections.deque(maxlen=size) for kind in KINDS.values()}
+
+    def init_app(self, app):
+        self.size = app.config.get('HOME_FEED_SIZE', self.size)
+        event.listen(db.session, 'after_flush', self._collect)
+        event.listen(db.session, 'after_commit', self._apply)
+        event.listen(db.session, 'after_rollback', self._discard)
+
+    def load(self):
+        with self._lock:
+            generation = data_generation.current()
+            if self.loaded and self.generation == generation:
+                return
+            items = {}
+            for model in (Artist, Venue):
+                rows = (db.session.query(model.id, model.name, model.image_link, model.date_created)
+                        .order_by(model.date_created.desc()).limit(self.size))
+                items[KINDS[model]] = [entity_entry(row) for row in rows]
+            rows = (db.session.query(Show.id, Show.start_time, Show.artist_id, Show.venue_id,
+                                     Artist.name.label('artist_name'), Artist.image_link.label('artist_image_link'),
+                                     Venue.name.label('venue_name'))
+                    .join(Artist, Artist.id == Show.artist_id)
+                    .join(Venue, Venue.id == Show.venue_id)
+                    .order_by(Show.id.desc()).limit(self.size))
+            items['shows'] = [row._asdict() for row in rows]
+            self._items = {kind: collections.deque(entries, maxlen=self.size) for kind, entries in items.items()}
+            self.generation = generation
+            self.loaded = True
+
+    def invalidate(self):
+        with self._lock:
+            self.loaded = False
+
+    def recent(self, kind):
+        self.load()
+        with self._lock:
+            return [dict(entry) for entry in self._items[kind]]
+
+    def state(self):
+        # the feed's contents, for the home page's ETag
+        self.load()
+        with self._lock:
+            return tuple((kind, tuple(tuple(entry.values()) for entry in entries))
+                         for kind, entries in sorted(self._items.items()))
+
+    def _collect(self, session, flush_context):
+        if not self.loaded:
+            return
+        pending = session.info.setdefault('feed', {'added': [], 'changed': {}, 'removed': set()})
+        for obj in session.new:
+            if isinstance(obj, (Venue, Artist)):
+                pending['added'].append((KINDS[type(obj)], entity_entry(obj)))
+            elif isinstance(obj, Show):
+                artist = session.query(Artist.name, Artist.image_link).filter(Artist.id == obj.artist_id).first()
+                venue = session.query(Venue.name).filter(Venue.id == obj.venue_id).first()
+                if artist is not None and venue is not None:
+                    pending['added'].append(('shows', show_entry(obj, artist, venue)))
+        for obj in session.dirty:
+            if isinstance(obj, (Venue, Artist)):
+                pending['changed'][(KINDS[type(obj)], obj.id)] = {'name': obj.name, 'image_link': obj.image_link}
+            elif isinstance(obj, Show):
+                pending['changed'][('shows', obj.id)] = {'start_time': obj.start_time}
+        for obj in session.deleted:
+            if isinstance(obj, tuple(KINDS)):
+                pending['removed'].add((KINDS[type(obj)], obj.id))
+
+    def _apply(self, session):
+        pending = session.info.pop('feed', None)
+        if not pending:
+            return
+        with self._lock:
+            if not self.loaded:
+                return
+            for kind, entry in pending['added']:
+                items = self._items[kind]
+                if entry['id'] not in {item['id'] for item in items}:
+                    items.appendleft(entry)
+            for (kind, entity_id), values in pending['changed'].items():
+                self._update(kind, entity_id, values)
+            for kind, entity_id in pending['removed']:
+                self._remove(kind, entity_id)
+
+    def _update(self, kind, entity_id, values):
+        for entry in self._items[kind]:
+            if entry['id'] == entity_id:
+                entry.update(values)
+        if kind != 'shows':
+            prefix = kind[:-1]
+            for entry in self._items['shows']:
+                if entry[f'{prefix}_id'] == entity_id:
+                    entry[f'{prefix}_name'] = values['name']
+                    if f'{prefix}_image_link' in entry:
+                        entry[f'{prefix}_image_link'] = values['image_link']
+
+    def _remove(self, kind, entity_id):
+        # the buffer would come up short, so it refills from the database on
+        # the next read; a deleted venue or artist takes its shows with it
+        prefix = kind[:-1]
+        if any(entry['id'] == entity_id for entry in self._items[kind]) or (
+                kind != 'shows' and any(entry[f'{prefix}_id'] == entity_id for entry in self._items['shows'])):
+            self.loaded = False
+
+    def _discard(self, session):
+        session.info.pop('feed', None)
+
+
+home_feed = Feed()
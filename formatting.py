@@ -0,0 +1,152 @@
+import datetime
+import functools
+import babel
+import babel.dates
+from flask import current_app, g, has_request_context, request
+from cache import cache
+
+# Date formatting for the `datetime` template filter. Each (CLDR pattern,
+# locale) pair is compiled once into a list of literal strings and small
+# field formatters with the locale's month, day and period names looked up
+# ahead of time; fields without a fast path fall back to babel. Formatted
+# strings of recent (value, pattern, locale, timezone) combinations are
+# memoized as well, so a page with thousands of show tiles does very little
+# work per tile. Values must already be datetimes (the database
+# returns them that way); they are stored as naive UTC and shown in the
+# request's timezone.
+#
+# The request locale comes from the `locale` cookie or Accept-Language,
+# limited to LANGUAGES; the timezone from the `tz` cookie or DEFAULT_TIMEZONE.
+
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+
+@functools.lru_cache(maxsize=None)
+def locale_for(identifier):
+    return babel.Locale.parse(identifier)
+
+
+def _number(attribute, count, transform=None):
+    def field(value):
+        number = getattr(value, attribute)
+        return str(transform(number) if transform else number).zfill(count)
+    return field
+
+
+def _name(names, key):
+    return lambda value: names[key(value)]
+
+
+def _field(char, count, locale):
+    if char == 'y':
+        return _number('year', 2, lambda year: year % 100) if count == 2 else _number('year', count)
+    if char in 'ML' and count >= 3:
+        width = 'abbreviated' if count == 3 else 'wide' if count == 4 else 'narrow'
+        names = locale.months['format' if char == 'M' else 'stand-alone'][width]
+        return _name({month: names[month] for month in range(1, 13)}, lambda value: value.month)
+    if char in 'ML':
+        return _number('month', count)
+    if char == 'd':
+        return _number('day', count)
+    if char == 'E':
+        width = 'abbreviated' if count <= 3 else 'wide' if count == 4 else 'narrow'
+        names = locale.days['format'][width]
+        return _name({day: names[day] for day in range(7)}, lambda value: value.weekday())
+    if char == 'h':
+        return _number('hour', count, lambda hour: hour % 12 or 12)
+    if char == 'H':
+        return _number('hour', count)
+    if char == 'm':
+        return _number('minute', count)
+    if char == 's':
+        return _number('second', count)
+    if char == 'a':
+        periods = locale.day_periods['format']['abbreviated']
+        names = {False: periods['am'], True: periods['pm']}
+        return _name(names, lambda value: value.hour >= 12)
+    field = char * count
+    return lambda value: babel.dates.DateTimeFormat(value, locale)[field]
+
+
+@functools.lru_cache(maxsize=None)
+def compiled(pattern, locale):
+    # a function formatting a datetime with `pattern` (or a FORMATS name)
+    locale = locale_for(locale)
+    parts = []
+    for kind, token in babel.dates.tokenize_pattern(FORMATS.get(pattern, pattern)):
+        if kind == 'chars':
+            if parts and isinstance(parts[-1], str):
+                parts[-1] += token
+            else:
+                parts.append(token)
+        else:
+            parts.append(_field(token[0], token[1], locale))
+    parts = [(part, None) if isinstance(part, str) else (None, part) for part in parts]
+    return lambda value: ''.join(text if text is not None else field(value) for text, field in parts)
+
+
+@functools.lru_cache(maxsize=None)
+def timezone_for(name):
+    return babel.dates.get_timezone(name)
+
+
+def request_locale():
+    if not has_request_context():
+        return current_app.config.get('DEFAULT_LOCALE', 'en')
+    if 'locale' not in g:
+        languages = current_app.config.get('LANGUAGES', ['en'])
+        locale = request.cookies.get('locale')
+        if locale not in languages:
+            locale = request.accept_languages.best_match(languages) or current_app.config.get('DEFAULT_LOCALE', 'en')
+        g.locale = locale
+    return g.locale
+
+
+def request_timezone():
+    if not has_request_context():
+        return current_app.config.get('DEFAULT_TIMEZONE', 'UTC')
+    if 'timezone' not in g:
+        timezone = request.cookies.get('tz')
+        try:
+            timezone_for(timezone or '')
+        except LookupError:
+            timezone = None
+        g.timezone = timezone or current_app.config.get('DEFAULT_TIMEZONE', 'UTC')
+    return g.timezone
+
+
+def cache_variant():
+    # the response cache and ETags have to tell locales and timezones apart
+    return f'{request_locale()}|{request_timezone()}'
+
+
+@functools.lru_cache(maxsize=8192)
+def _format(value, pattern, locale, timezone):
+    tzinfo = timezone_for(timezone)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    value = tzinfo.normalize(value.astimezone(tzinfo)) if hasattr(tzinfo, 'normalize') else value.astimezone(tzinfo)
+    return compiled(pattern, locale)(value)
+
+
+def format_datetime(value, format='medium', locale=None, timezone=None):
+    if value is None:
+        return ''
+    if not isinstance(value, datetime.datetime):
+        raise TypeError(f'datetime filter expects a datetime, got {type(value).__name__}')
+    return _format(value, format, locale or request_locale(), timezone or request_timezone())
+
+
+def init_app(app):
+    app.jinja_env.filters['datetime'] = format_datetime
+    cache.vary(cache_variant)
+
+    @app.after_request
+    def vary_on_locale(response):
+        if response.mimetype == 'text/html':
+            response.vary.add('Accept-Language')
+            response.vary.add('Cookie')
+        return response
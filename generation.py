@@ -0,0 +1,63 @@
+import os
+import threading
+from sqlalchemy import event
+from models import Venue, Artist, Show, db
+
+# The home feed, the typeahead index and the recommender are built in each
+# worker process and follow that process' own commits through session
+# events. Writes they can't follow -- the importer's core inserts, which run
+# in a CLI process, and bulk deletes, whose rows the events never see -- bump
+# a generation shared by every process through DATA_GENERATION_FILE. Each
+# structure remembers the generation it was built at and rebuilds on first
+# use after it moved. A bump appends a byte, so the generation is the file's
+# size: appends from concurrent processes never overwrite each other, and a
+# read is a stat(). Without the file the generation is per process.
+
+BULK_MODELS = (Venue, Artist, Show)
+
+
+class Generation:
+
+    def __init__(self):
+        self.path = None
+        self._local = 0
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.path = app.config.get('DATA_GENERATION_FILE') or None
+        if self.path:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        event.listen(db.session, 'after_bulk_delete', self._collect_bulk)
+        event.listen(db.session, 'after_commit', self._apply)
+        event.listen(db.session, 'after_rollback', self._discard)
+
+    def current(self):
+        if self.path is None:
+            return self._local
+        try:
+            return os.stat(self.path).st_size
+        except FileNotFoundError:
+            return 0
+
+    def bump(self):
+        # call after the commit, so that a rebuild sees the writes
+        if self.path is None:
+            with self._lock:
+                self._local += 1
+            return
+        with open(self.path, 'ab') as f:
+            f.write(b'.')
+
+    def _collect_bulk(self, delete_context):
+        if delete_context.mapper is not None and delete_context.mapper.class_ in BULK_MODELS:
+            delete_context.session.info['generation'] = True
+
+    def _apply(self, session):
+        if session.info.pop('generation', False):
+            self.bump()
+
+    def _discard(self, session):
+        session.info.pop('generation', None)
+
+
+data_generation = Generation()
@@ -0,0 +1,77 @@
+from flask import request
+from models import Venue, Artist, Genre, venue_genres, artist_genres, genre_key, db
+
+# Genre filters and facet counts over the VenueGenre / ArtistGenre association
+# tables. A filter on several genres matches entities that have all of them;
+# facet counts are one GROUP BY over the association rows of the filtered
+# entities.
+
+ASSOCIATIONS = {Venue: venue_genres.c.venue_id, Artist: artist_genres.c.artist_id}
+
+
+def requested():
+    # ?genre=Jazz&genre=Blues on listings, genre fields on search forms
+    names = request.args.getlist('genre') + request.form.getlist('genre')
+    return [name for name in names if genre_key(name)]
+
+
+def filter_by_genres(query, model, names):
+    foreign_key = ASSOCIATIONS[model]
+    genre_id = foreign_key.table.c.genre_id
+    for name in names or ():
+        query = query.filter(model.id.in_(
+            db.select([foreign_key]).select_from(foreign_key.table.join(Genre, Genre.id == genre_id))
+            .where(Genre.key == genre_key(name))))
+    return query
+
+
+def facet_counts(model, query):
+    # [(genre name, number of matching entities)] for the entities `query`
+    # selects, most common first
+    return facet_query(model, query).all()
+
+
+def facet_query(model, query):
+    foreign_key = ASSOCIATIONS[model]
+    ids = query.with_entities(model.id).order_by(None).limit(None).offset(None).subquery()
+    count = db.func.count(foreign_key)
+    return (db.session.query(Genre.name, count)
+            .join(foreign_key.table, foreign_key.table.c.genre_id == Genre.id)
+            .filter(foreign_key.in_(db.select([ids.c.id])))
+            .group_by(Genre.id, Genre.name)
+            .order_by(count.desc(), Genre.name))
+
+
+def genre_names(model, ids):
+    # {id: [genre names]} for the given venue or artist ids in one query
+    names = {entity_id: [] for entity_id in ids}
+    if names:
+        for entity_id, name in genre_names_query(model, list(names)):
+            names[entity_id].append(name)
+    return names
+
+
+def genre_names_query(model, ids):
+    foreign_key = ASSOCIATIONS[model]
+    return (db.session.query(foreign_key, Genre.name)
+            .join(Genre, Genre.id == foreign_key.table.c.genre_id)
+            .filter(foreign_key.in_(ids))
+            .order_by(foreign_key, Genre.name))
+
+
+def with_genres(model, records, chunk_size):
+    # adds 'genres' to streamed record dicts, looked up once per chunk
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= chunk_size:
+            yield from _attach(model, chunk)
+            chunk = []
+    yield from _attach(model, chunk)
+
+
+def _attach(model, records):
+    names = genre_names(model, [record['id'] for record in records])
+    for record in records:
+        record['genres'] = names[record['id']]
+        yield record
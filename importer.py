@@ -0,0 +1,267 @@
+import csv
+import datetime
+import io
+import json
+import os
+import re
+import time
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from werkzeug.datastructures import MultiDict
+from forms import VenueForm, ArtistForm, ShowForm
+from models import Venue, Artist, Show, Genre, genre_key, db
+from cache import cache, BULK_TAGS
+import counters
+import scheduling
+import genres
+from generation import data_generation
+
+# `flask import venues|artists|shows FILE` bulk-loads CSV or NDJSON. Rows are
+# validated with the same forms as the create pages, inserted in large
+# batches (COPY on Postgres, executemany elsewhere) with one commit per batch,
+# and rejected rows are reported with their form errors. Shows that overlap an
+# existing booking of their venue or artist, or an earlier row of the same
+# file, are rejected as well.
+
+import_cli = AppGroup('import', help='Bulk import venues, artists and shows.')
+
+FIELDS = {
+    Venue: ('name', 'city', 'state', 'address', 'phone', 'genres', 'image_link', 'facebook_link',
+            'website_link', 'seeking_talent', 'seeking_description'),
+    Artist: ('name', 'city', 'state', 'phone', 'genres', 'image_link', 'facebook_link',
+             'website_link', 'seeking_venue', 'seeking_description'),
+    Show: ('artist_id', 'venue_id', 'start_time', 'duration'),
+}
+FORMS = {Venue: VenueForm, Artist: ArtistForm, Show: ShowForm}
+FALSE_VALUES = ('', '0', 'false', 'f', 'no', 'n')
+
+
+def read_records(path, fmt):
+    f = click.get_text_stream('stdin') if path == '-' else open(path, encoding='utf-8', newline='')
+    with f:
+        if fmt == 'csv':
+            for record in csv.DictReader(f):
+                yield record
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def formdata(record):
+    data = MultiDict()
+    for key, value in record.items():
+        if value is None:
+            continue
+        if key == 'genres' and isinstance(value, str):
+            value = [genre.strip() for genre in re.split(r'[;,|]', value) if genre.strip()]
+        if isinstance(value, bool) or key.startswith('seeking_') and key != 'seeking_description':
+            if str(value).strip().lower() in FALSE_VALUES:
+                continue
+            value = 'y'
+        if isinstance(value, list):
+            for item in value:
+                data.add(key, str(item))
+        else:
+            data.add(key, str(value))
+    return data
+
+
+def validate(model, form, record):
+    # returns (column values, None) or (None, errors); `form` is reused across
+    # rows since building a form per row dominates the import time
+    form.process(formdata=formdata(record))
+    if not form.validate():
+        return None, form.errors
+    values = {field: form.data[field] for field in FIELDS[model]}
+    if model is Show:
+        try:
+            values['artist_id'] = int(values['artist_id'])
+            values['venue_id'] = int(values['venue_id'])
+        except (TypeError, ValueError):
+            return None, {'artist_id/venue_id': ['Must be integer ids.']}
+        values['end_time'] = values['start_time'] + scheduling.duration(values.pop('duration'))
+    return values, None
+
+
+def insert_rows(table, rows):
+    if db.engine.dialect.name == 'postgresql':
+        columns = list(rows[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in rows:
+            writer.writerow([row[column] for column in columns])
+        buffer.seek(0)
+        cursor = db.session.connection().connection.cursor()
+        quoted = ', '.join(f'"{column}"' for column in columns)
+        cursor.copy_expert(f'COPY "{table.name}" ({quoted}) FROM STDIN WITH (FORMAT csv)', buffer)
+    else:
+        db.session.execute(table.insert(), rows)
+
+
+def allocate_ids(model, count):
+    # ids for rows about to be inserted, so that their genres can be linked
+    # without reading the rows back
+    if db.engine.dialect.name == 'postgresql':
+        rows = db.session.execute(
+            db.text("SELECT nextval(pg_get_serial_sequence(:table, 'id')) FROM generate_series(1, :count)"),
+            {'table': f'"{model.__tablename__}"', 'count': count})
+        return [row[0] for row in rows]
+    # SQLite has no sequences; a concurrent writer makes the batch fail on
+    # the primary key rather than link genres to the wrong rows
+    start = (db.session.query(db.func.max(model.id)).scalar() or 0) + 1
+    return list(range(start, start + count))
+
+
+def link_genres(model, entity_genres):
+    # inserts the association rows for [(entity id, genre names)], creating
+    # genres that don't exist yet
+    names = {}
+    for _, entity_names in entity_genres:
+        for name in entity_names:
+            names.setdefault(genre_key(name), name.strip())
+    names.pop('', None)
+    if not names:
+        return
+    ids = dict(db.session.query(Genre.key, Genre.id).filter(Genre.key.in_(list(names))))
+    missing = [{'key': key, 'name': name} for key, name in names.items() if key not in ids]
+    if missing:
+        db.session.execute(Genre.__table__.insert(), missing)
+        ids.update(db.session.query(Genre.key, Genre.id).filter(Genre.key.in_([row['key'] for row in missing])))
+    foreign_key = genres.ASSOCIATIONS[model]
+    links = {(entity_id, ids[genre_key(name)]) for entity_id, entity_names in entity_genres
+             for name in entity_names if genre_key(name)}
+    if links:
+        insert_rows(foreign_key.table, [{foreign_key.name: entity_id, 'genre_id': genre_id}
+                                        for entity_id, genre_id in sorted(links)])
+
+
+def existing_ids(model, ids):
+    if not ids:
+        return set()
+    return {row[0] for row in db.session.query(model.id).filter(model.id.in_(ids))}
+
+
+def booking_conflict(bookings, row):
+    for kind in ('venue', 'artist'):
+        clash = bookings.conflict(kind, row[f'{kind}_id'], row['start_time'], row['end_time'])
+        if clash is not None:
+            clash = f'show {clash}' if isinstance(clash, int) else clash
+            return {f'{kind}_id': [f'The {kind} is already booked at that time ({clash}).']}
+    return None
+
+
+def flush_batch(model, batch, rejects, bookings=None):
+    # inserts one validated batch and commits it; shows whose artist or venue
+    # doesn't exist or is already booked are moved to `rejects`
+    if model is Show:
+        artists = existing_ids(Artist, {row['artist_id'] for _, row in batch})
+        venues = existing_ids(Venue, {row['venue_id'] for _, row in batch})
+        resolved = []
+        for line, row in batch:
+            if row['artist_id'] not in artists or row['venue_id'] not in venues:
+                errors = {'artist_id/venue_id': ['Unknown artist or venue.']}
+            else:
+                errors = booking_conflict(bookings, row)
+            if errors:
+                rejects.append({'line': line, 'errors': errors, 'row': row})
+            else:
+                # accepted rows are booked under their line number so later
+                # rows of the file are checked against them too
+                for kind in ('venue', 'artist'):
+                    bookings.schedule(kind, row[f'{kind}_id']).add(f'line {line}', row['start_time'],
+                                                                   row['end_time'])
+                resolved.append((line, row))
+        batch = resolved
+    if not batch:
+        return 0
+    now = datetime.datetime.utcnow()
+    rows = [dict(row, date_created=now, updated_at=now) if model is not Show else dict(row, updated_at=now)
+            for _, row in batch]
+    entity_genres = None
+    if model in genres.ASSOCIATIONS:
+        ids = allocate_ids(model, len(rows))
+        entity_genres = [(entity_id, row.pop('genres')) for entity_id, row in zip(ids, rows)]
+        for entity_id, row in zip(ids, rows):
+            row['id'] = entity_id
+    insert_rows(model.__table__, rows)
+    if entity_genres:
+        link_genres(model, entity_genres)
+    if model is Show:
+        counters.record_shows(((row['venue_id'], row['artist_id'], row['start_time']) for row in rows), now)
+    db.session.commit()
+    return len(rows)
+
+
+def run_import(model, path, fmt, batch_size, rejects_path):
+    fmt = fmt or ('csv' if os.path.splitext(path)[1].lower() == '.csv' else 'ndjson')
+    started = time.perf_counter()
+    read = inserted = rejected = shown = 0
+    rejects = []
+    batch = []
+    rejects_file = open(rejects_path, 'w', encoding='utf-8') if rejects_path else None
+    # schedules of every venue and artist the file touches, loaded once each
+    bookings = scheduling.BookingIndex(max_entities=None) if model is Show else None
+    try:
+        with current_app.test_request_context():
+            form = FORMS[model](meta={'csrf': False})
+            for line, record in enumerate(read_records(path, fmt), start=1):
+                read += 1
+                values, errors = validate(model, form, record)
+                if errors:
+                    rejects.append({'line': line, 'errors': errors, 'row': record})
+                else:
+                    batch.append((line, values))
+                if len(batch) >= batch_size:
+                    inserted += flush_batch(model, batch, rejects, bookings)
+                    batch = []
+                if rejects:
+                    rejected += len(rejects)
+                    shown = _report_rejects(rejects, rejects_file, shown)
+                    rejects = []
+            inserted += flush_batch(model, batch, rejects, bookings)
+            rejected += len(rejects)
+            _report_rejects(rejects, rejects_file, shown)
+    except Exception:
+        db.session.rollback()
+        raise
+    finally:
+        if rejects_file:
+            rejects_file.close()
+        # each batch commits, so a failed import still published the earlier ones
+        if inserted:
+            cache.invalidate(*BULK_TAGS[model])
+            data_generation.bump()
+    elapsed = time.perf_counter() - started
+    rate = read / elapsed if elapsed else 0
+    click.echo(f'{model.__tablename__}: read {read}, inserted {inserted}, rejected {rejected} '
+               f'in {elapsed:.1f}s ({rate:,.0f} rows/s)')
+
+
+def _report_rejects(rejects, rejects_file, shown):
+    # writes rejects to the rejects file, or echoes the first ten of the run
+    for reject in rejects:
+        if rejects_file:
+            rejects_file.write(json.dumps(reject, default=str) + '\n')
+        elif shown < 10:
+            click.echo(f'line {reject["line"]}: {reject["errors"]}', err=True)
+            shown += 1
+    return shown
+
+
+def _command(model, name):
+    @import_cli.command(name, help=f'Import {name} from a CSV or NDJSON file (- for stdin).')
+    @click.argument('path')
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']),
+                  help='Input format, guessed from the file extension by default.')
+    @click.option('--batch-size', default=5000, show_default=True, help='Rows per insert and commit.')
+    @click.option('--rejects', 'rejects_path', help='Write rejected rows to this NDJSON file.')
+    def command(path, fmt, batch_size, rejects_path):
+        run_import(model, path, fmt, batch_size, rejects_path)
+    return command
+
+
+import_venues = _command(Venue, 'venues')
+import_artists = _command(Artist, 'artists')
+import_shows = _command(Show, 'shows')
@@ -0,0 +1,130 @@
+import click
+from flask.cli import AppGroup
+from sqlalchemy import DDL, event
+from models import Venue, Artist, Show, ShowListing, db
+
+# ShowListing holds every show with its artist's and venue's names and
+# images, so /shows and the show sections of the venue and artist pages read
+# one indexed table instead of joining three. Triggers keep it current: a
+# show's row is rewritten when the show is inserted, updated or deleted, and
+# an artist or venue whose name or image changes rewrites the rows of its
+# shows. They fire for every write, including the importer's COPY and bulk
+# deletes. create_all() installs them through the DDL below; the migration
+# that adds the table carries its own copy of the Postgres ones.
+# `flask listing check` compares the table with a join and --fix rebuilds it.
+
+listing_cli = AppGroup('listing', help='Maintain the ShowListing table.')
+
+COLUMNS = list(ShowListing.__table__.columns)
+LISTING_COLUMNS = ', '.join(column.name for column in COLUMNS)
+# inserts the listing row of the show NEW
+INSERT_ROW = (
+    f'INSERT INTO "ShowListing" ({LISTING_COLUMNS}) '
+    'SELECT NEW.id, NEW.start_time, "Artist".id, "Artist".name, "Artist".image_link, '
+    '"Venue".id, "Venue".name, "Venue".image_link FROM "Artist", "Venue" '
+    'WHERE "Artist".id = NEW.artist_id AND "Venue".id = NEW.venue_id;'
+)
+
+SQLITE_TRIGGERS = [
+    f'CREATE TRIGGER show_listing_ai AFTER INSERT ON "Show" BEGIN {INSERT_ROW} END',
+    'CREATE TRIGGER show_listing_au AFTER UPDATE ON "Show" BEGIN '
+    f'DELETE FROM "ShowListing" WHERE show_id = OLD.id; {INSERT_ROW} END',
+    'CREATE TRIGGER show_listing_ad AFTER DELETE ON "Show" BEGIN '
+    'DELETE FROM "ShowListing" WHERE show_id = OLD.id; END',
+    'CREATE TRIGGER show_listing_artist_au AFTER UPDATE OF name, image_link ON "Artist" '
+    'WHEN OLD.name IS NOT NEW.name OR OLD.image_link IS NOT NEW.image_link BEGIN '
+    'UPDATE "ShowListing" SET artist_name = NEW.name, artist_image_link = NEW.image_link '
+    'WHERE artist_id = NEW.id; END',
+    'CREATE TRIGGER show_listing_venue_au AFTER UPDATE OF name, image_link ON "Venue" '
+    'WHEN OLD.name IS NOT NEW.name OR OLD.image_link IS NOT NEW.image_link BEGIN '
+    'UPDATE "ShowListing" SET venue_name = NEW.name, venue_image_link = NEW.image_link '
+    'WHERE venue_id = NEW.id; END',
+]
+
+POSTGRES_TRIGGERS = [
+    'CREATE FUNCTION show_listing_show() RETURNS trigger AS $$ BEGIN '
+    "IF TG_OP IN ('UPDATE', 'DELETE') THEN DELETE FROM \"ShowListing\" WHERE show_id = OLD.id; END IF; "
+    f"IF TG_OP IN ('INSERT', 'UPDATE') THEN {INSERT_ROW} END IF; "
+    'RETURN NULL; END $$ LANGUAGE plpgsql',
+    'CREATE TRIGGER show_listing_show AFTER INSERT OR UPDATE OR DELETE ON "Show" '
+    'FOR EACH ROW EXECUTE PROCEDURE show_listing_show()',
+    'CREATE FUNCTION show_listing_artist() RETURNS trigger AS $$ BEGIN '
+    'UPDATE "ShowListing" SET artist_name = NEW.name, artist_image_link = NEW.image_link '
+    'WHERE artist_id = NEW.id; RETURN NULL; END $$ LANGUAGE plpgsql',
+    'CREATE TRIGGER show_listing_artist AFTER UPDATE OF name, image_link ON "Artist" FOR EACH ROW '
+    'WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.image_link IS DISTINCT FROM NEW.image_link) '
+    'EXECUTE PROCEDURE show_listing_artist()',
+    'CREATE FUNCTION show_listing_venue() RETURNS trigger AS $$ BEGIN '
+    'UPDATE "ShowListing" SET venue_name = NEW.name, venue_image_link = NEW.image_link '
+    'WHERE venue_id = NEW.id; RETURN NULL; END $$ LANGUAGE plpgsql',
+    'CREATE TRIGGER show_listing_venue AFTER UPDATE OF name, image_link ON "Venue" FOR EACH ROW '
+    'WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.image_link IS DISTINCT FROM NEW.image_link) '
+    'EXECUTE PROCEDURE show_listing_venue()',
+]
+
+for dialect, statements in (('sqlite', SQLITE_TRIGGERS), ('postgresql', POSTGRES_TRIGGERS)):
+    for statement in statements:
+        event.listen(ShowListing.__table__, 'after_create', DDL(statement).execute_if(dialect=dialect))
+
+# (foreign key, prefix) of the other side of a venue's or artist's shows
+OTHER_SIDE = {
+    Venue: (ShowListing.venue_id, 'artist'),
+    Artist: (ShowListing.artist_id, 'venue'),
+}
+
+
+def tiles_query(model, entity_id, upcoming=None, now=None):
+    # the show tiles of a venue (artist_* fields) or an artist (venue_*
+    # fields) in start order, only upcoming or past ones when `upcoming` is
+    # True or False
+    foreign_key, prefix = OTHER_SIDE[model]
+    query = (db.session.query(getattr(ShowListing, f'{prefix}_id'), getattr(ShowListing, f'{prefix}_name'),
+                              getattr(ShowListing, f'{prefix}_image_link'), ShowListing.start_time)
+             .filter(foreign_key == entity_id))
+    if upcoming is not None:
+        query = query.filter(ShowListing.start_time > now if upcoming else ShowListing.start_time <= now)
+    return query.order_by(ShowListing.start_time)
+
+
+def _joined():
+    return (db.session.query(Show.id, Show.start_time, Artist.id, Artist.name, Artist.image_link,
+                             Venue.id, Venue.name, Venue.image_link)
+            .join(Artist, Artist.id == Show.artist_id)
+            .join(Venue, Venue.id == Show.venue_id))
+
+
+def rebuild():
+    # replaces the whole table with the join it mirrors; call before commit
+    db.session.query(ShowListing).delete(synchronize_session=False)
+    return db.session.execute(ShowListing.__table__.insert().from_select(COLUMNS, _joined())).rowcount
+
+
+def mismatches():
+    # yields (show id, problem) for listing rows missing, extra or out of date
+    expected = {row[0]: tuple(row) for row in _joined()}
+    actual = {row[0]: tuple(row) for row in db.session.query(*COLUMNS)}
+    for show_id in sorted(expected.keys() | actual.keys()):
+        if show_id not in actual:
+            yield show_id, 'missing'
+        elif show_id not in expected:
+            yield show_id, 'extra'
+        elif expected[show_id] != actual[show_id]:
+            yield show_id, 'out of date'
+
+
+@listing_cli.command('check')
+@click.option('--fix', is_flag=True, help='Rebuild the table after reporting.')
+def check(fix):
+    """Report shows whose ShowListing row is missing, extra or out of date."""
+    total = 0
+    for show_id, problem in mismatches():
+        total += 1
+        click.echo(f'Show {show_id}: {problem}')
+    if fix:
+        rows = rebuild()
+        db.session.commit()
+        click.echo(f'Rebuilt {rows} listing rows, {total} were wrong.')
+    else:
+        click.echo(f'{total} listing rows wrong.')
+    if total and not fix:
+        raise SystemExit(1)
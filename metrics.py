@@ -0,0 +1,280 @@
+import bisect
+import glob
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+import jinja2
+from flask import Response, g, has_app_context, request
+from cache import cache
+from database import WAIT_BUCKETS
+from models import db
+
+# Prometheus metrics at /metrics. Request latency per route, template render
+# time and database time per route are histograms with fixed buckets kept in
+# process memory: an observation is a bisect and two additions under a lock.
+# Cache and connection pool numbers are read from their own stats when a
+# snapshot is taken.
+#
+# With METRICS_DIR set, each worker process writes its snapshot to its own
+# file there at most every METRICS_FLUSH_SECONDS, and /metrics sums the files
+# of all workers, so any worker can answer a scrape. Counters and histograms
+# of workers that exited are kept; gauges only count live workers. Clear the
+# directory when deploying. Quantiles such as p50/p99 per route come from
+# histogram_quantile() over the _bucket series.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+class Histogram:
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> per-bucket counts (the last one is +Inf), then the sum
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(labels)
+            if row is None:
+                row = self._values[labels] = [0] * (len(self.buckets) + 2)
+            row[i] += 1
+            row[-1] += value
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(labels), list(row)] for labels, row in self._values.items()]
+        return {'type': 'histogram', 'help': self.help, 'labels': self.labels,
+                'buckets': self.buckets, 'values': values}
+
+
+class Counter:
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(labels), value] for labels, value in self._values.items()]
+        return {'type': 'counter', 'help': self.help, 'labels': self.labels, 'values': values}
+
+
+class Registry:
+
+    def __init__(self):
+        self.metrics = {}
+        # functions returning {name: snapshot} of numbers kept elsewhere
+        self.collectors = []
+        self.directory = None
+        self.flush_interval = 1.0
+        self._flushed = 0.0
+        self._path = None
+
+    def histogram(self, name, help, labels, buckets):
+        return self.metrics.setdefault(name, Histogram(name, help, labels, buckets))
+
+    def counter(self, name, help, labels):
+        return self.metrics.setdefault(name, Counter(name, help, labels))
+
+    def snapshot(self):
+        snapshot = {name: metric.snapshot() for name, metric in self.metrics.items()}
+        for collector in self.collectors:
+            snapshot.update(collector())
+        return snapshot
+
+    def flush(self, force=False):
+        # writes this process's snapshot for the other workers to read
+        if self.directory is None:
+            return
+        now = time.monotonic()
+        if not force and now - self._flushed < self.flush_interval:
+            return
+        self._flushed = now
+        if self._path is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._path = os.path.join(self.directory, f'{os.getpid()}-{uuid.uuid4().hex[:8]}.json')
+        data = json.dumps({'pid': os.getpid(), 'metrics': self.snapshot()})
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            f.write(data)
+        os.replace(tmp, self._path)
+
+    def collect(self):
+        # snapshots of every worker summed, or this process's alone
+        if self.directory is None:
+            return self.snapshot()
+        self.flush(force=True)
+        merged = {}
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    worker = json.load(f)
+            except (OSError, ValueError):
+                continue
+            live = _alive(worker['pid'])
+            for name, metric in worker['metrics'].items():
+                if metric['type'] == 'gauge' and not live:
+                    continue
+                _merge(merged.setdefault(name, dict(metric, values=[])), metric['values'])
+        return merged
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _merge(into, values):
+    index = {tuple(labels): entry for labels, entry in ((tuple(v[0]), v) for v in into['values'])}
+    for labels, value in values:
+        entry = index.get(tuple(labels))
+        if entry is None:
+            entry = index[tuple(labels)] = [labels, [0] * len(value) if isinstance(value, list) else 0]
+            into['values'].append(entry)
+        if isinstance(value, list):
+            entry[1] = [a + b for a, b in zip(entry[1], value)]
+        else:
+            entry[1] += value
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(snapshot):
+    # Prometheus text format
+    lines = []
+    for name in sorted(snapshot):
+        metric = snapshot[name]
+        lines.append(f'# HELP {name} {metric["help"]}')
+        lines.append(f'# TYPE {name} {metric["type"]}')
+        for labels, value in sorted(metric['values'], key=lambda entry: entry[0]):
+            if metric['type'] == 'histogram':
+                cumulative = 0
+                for bound, count in zip(list(metric['buckets']) + ['+Inf'], value[:-1]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _number(float(bound))
+                    lines.append(f'{name}_bucket{_labels(metric["labels"], labels, [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{_labels(metric["labels"], labels)} {_number(float(value[-1]))}')
+                lines.append(f'{name}_count{_labels(metric["labels"], labels)} {cumulative}')
+            else:
+                lines.append(f'{name}{_labels(metric["labels"], labels)} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+request_seconds = registry.histogram('fyyur_request_duration_seconds', 'Request latency by route.',
+                                     ['endpoint', 'method', 'status'], LATENCY_BUCKETS)
+template_seconds = registry.histogram('fyyur_template_render_seconds', 'Template render time.',
+                                      ['template'], LATENCY_BUCKETS)
+db_seconds = registry.histogram('fyyur_db_duration_seconds', 'Database time per request by route.',
+                                ['endpoint'], DB_BUCKETS)
+db_queries = registry.counter('fyyur_db_queries_total', 'Statements run by route.', ['endpoint'])
+
+
+class TimedTemplate(jinja2.Template):
+
+    def render(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            template_seconds.observe((self.name,), time.perf_counter() - start)
+
+
+def cache_metrics():
+    stats = cache.stats()
+    return {
+        f'fyyur_cache_{key}_total': {'type': 'counter', 'help': f'Response cache {key}.', 'labels': [],
+                                     'values': [[[], stats[key]]]}
+        for key in ('hits', 'misses', 'evictions', 'invalidations')
+    }
+
+
+def pool_metrics():
+    if not has_app_context():
+        return {}
+    stats = db.stats()
+    metrics = {
+        'fyyur_db_pool_wait_seconds': {
+            'type': 'histogram', 'help': 'Time waited for a pooled connection.', 'labels': ['bind'],
+            'buckets': WAIT_BUCKETS,
+            'values': [[[bind], _wait_row(pool)] for bind, pool in stats.items() if 'checkouts' in pool],
+        },
+    }
+    for key, help in (('size', 'Pool size.'), ('checked_out', 'Connections in use.'),
+                      ('overflow', 'Connections over the pool size.')):
+        metrics[f'fyyur_db_pool_{key}'] = {
+            'type': 'gauge', 'help': help, 'labels': ['bind'],
+            'values': [[[bind], pool[key]] for bind, pool in stats.items() if key in pool],
+        }
+    return metrics
+
+
+def _wait_row(pool):
+    # the pool keeps cumulative buckets; the snapshot rows hold per-bucket counts
+    cumulative = pool['wait_buckets'] + [pool['checkouts']]
+    return [cumulative[0]] + [b - a for a, b in zip(cumulative, cumulative[1:])] + [pool['wait_seconds_total']]
+
+
+def init_app(app):
+    registry.directory = app.config.get('METRICS_DIR')
+    registry.flush_interval = app.config.get('METRICS_FLUSH_SECONDS', 1.0)
+    registry.collectors = [cache_metrics, pool_metrics]
+
+    app.jinja_env.template_class = TimedTemplate
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+
+    @app.after_request
+    def observe(response):
+        # registered before the profiler so that this runs after it and sees
+        # the request's database time
+        start = g.pop('request_start', None)
+        if start is not None:
+            endpoint = request.endpoint or 'unmatched'
+            request_seconds.observe((endpoint, request.method, str(response.status_code)),
+                                    time.perf_counter() - start)
+            if 'sql_time' in g:
+                db_seconds.observe((endpoint,), g.sql_time)
+                db_queries.inc((endpoint,), g.sql_queries)
+            registry.flush()
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(exposition(registry.collect()), mimetype='text/plain; version=0.0.4')
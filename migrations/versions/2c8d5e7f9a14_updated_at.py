@@ -0,0 +1,29 @@
+"""add updated_at to Venue, Artist and Show
+
+Revision ID: 2c8d5e7f9a14
+Revises: e41a7c9d05b3
+Create Date: 2026-10-18 12:40:05.772460
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2c8d5e7f9a14'
+down_revision = 'e41a7c9d05b3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist', 'Show'):
+        # existing rows are stamped with the migration time
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), server_default=sa.func.now(), nullable=True))
+        op.create_index(op.f(f'ix_{table}_updated_at'), table, ['updated_at'], unique=False)
+
+
+def downgrade():
+    for table in ('Show', 'Artist', 'Venue'):
+        op.drop_index(op.f(f'ix_{table}_updated_at'), table_name=table)
+        op.drop_column(table, 'updated_at')
@@ -0,0 +1,40 @@
+"""add upcoming/past show counters to Venue and Artist
+
+Revision ID: 5d1f0c8a2b7e
+Revises: dab0268af1f7
+Create Date: 2026-10-18 09:12:40.118203
+
+"""
+import datetime
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1f0c8a2b7e'
+down_revision = 'dab0268af1f7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Venue', sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Artist', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('Artist', sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    now = datetime.datetime.utcnow()
+    for table, foreign_key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.get_bind().execute(sa.text(
+            f'UPDATE "{table}" SET '
+            f'upcoming_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{foreign_key} = "{table}".id '
+            f'AND "Show".start_time > :now), '
+            f'past_shows_count = (SELECT count(*) FROM "Show" WHERE "Show".{foreign_key} = "{table}".id '
+            f'AND "Show".start_time <= :now)'
+        ), now=now)
+
+
+def downgrade():
+    op.drop_column('Artist', 'past_shows_count')
+    op.drop_column('Artist', 'upcoming_shows_count')
+    op.drop_column('Venue', 'past_shows_count')
+    op.drop_column('Venue', 'upcoming_shows_count')
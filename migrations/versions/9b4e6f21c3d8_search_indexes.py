@@ -0,0 +1,71 @@
+"""full-text search indexes for Venue and Artist
+
+Revision ID: 9b4e6f21c3d8
+Revises: 5d1f0c8a2b7e
+Create Date: 2026-10-18 10:02:17.550914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e6f21c3d8'
+down_revision = '5d1f0c8a2b7e'
+branch_labels = None
+depends_on = None
+
+# tables indexed for search and the name of their SQLite FTS5 table
+SEARCH_TABLES = (('Venue', 'venue_search'), ('Artist', 'artist_search'))
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for table, _ in SEARCH_TABLES:
+            op.execute(
+                f'ALTER TABLE "{table}" ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ('
+                f"to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(city, '') || ' ' "
+                f"|| coalesce(state, ''))) STORED"
+            )
+            op.execute(f'CREATE INDEX "ix_{table}_search_vector" ON "{table}" USING gin (search_vector)')
+            op.execute(f'CREATE INDEX "ix_{table}_name_trgm" ON "{table}" USING gin (name gin_trgm_ops)')
+    elif dialect == 'sqlite':
+        for table, fts in SEARCH_TABLES:
+            op.execute(
+                f"CREATE VIRTUAL TABLE {fts} USING fts5(name, city, state, content='{table}', content_rowid='id')"
+            )
+            op.execute(
+                f'CREATE TRIGGER {fts}_ai AFTER INSERT ON "{table}" BEGIN '
+                f'INSERT INTO {fts}(rowid, name, city, state) VALUES (new.id, new.name, new.city, new.state); '
+                f'END'
+            )
+            op.execute(
+                f'CREATE TRIGGER {fts}_ad AFTER DELETE ON "{table}" BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, name, city, state) "
+                f"VALUES ('delete', old.id, old.name, old.city, old.state); "
+                f'END'
+            )
+            op.execute(
+                f'CREATE TRIGGER {fts}_au AFTER UPDATE OF name, city, state ON "{table}" BEGIN '
+                f"INSERT INTO {fts}({fts}, rowid, name, city, state) "
+                f"VALUES ('delete', old.id, old.name, old.city, old.state); "
+                f'INSERT INTO {fts}(rowid, name, city, state) VALUES (new.id, new.name, new.city, new.state); '
+                f'END'
+            )
+            op.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table, _ in SEARCH_TABLES:
+            op.execute(f'DROP INDEX IF EXISTS "ix_{table}_name_trgm"')
+            op.execute(f'DROP INDEX IF EXISTS "ix_{table}_search_vector"')
+            op.drop_column(table, 'search_vector')
+    elif dialect == 'sqlite':
+        for table, fts in SEARCH_TABLES:
+            for suffix in ('ai', 'ad', 'au'):
+                op.execute(f'DROP TRIGGER IF EXISTS {fts}_{suffix}')
+            op.execute(f'DROP TABLE IF EXISTS {fts}')
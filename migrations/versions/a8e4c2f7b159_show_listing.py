@@ -0,0 +1,107 @@
+"""denormalized ShowListing table kept by triggers
+
+Revision ID: a8e4c2f7b159
+Revises: f3b8e1d6a527
+Create Date: 2026-10-18 19:14:36.118420
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8e4c2f7b159'
+down_revision = 'f3b8e1d6a527'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ('show_id, start_time, artist_id, artist_name, artist_image_link, '
+           'venue_id, venue_name, venue_image_link')
+SELECT = ('"Artist".id, "Artist".name, "Artist".image_link, "Venue".id, "Venue".name, "Venue".image_link '
+          'FROM "Artist", "Venue"')
+INSERT_ROW = (f'INSERT INTO "ShowListing" ({COLUMNS}) SELECT NEW.id, NEW.start_time, {SELECT} '
+              'WHERE "Artist".id = NEW.artist_id AND "Venue".id = NEW.venue_id;')
+
+# the same as listing.SQLITE_TRIGGERS / listing.POSTGRES_TRIGGERS
+SQLITE_TRIGGERS = [
+    f'CREATE TRIGGER show_listing_ai AFTER INSERT ON "Show" BEGIN {INSERT_ROW} END',
+    'CREATE TRIGGER show_listing_au AFTER UPDATE ON "Show" BEGIN '
+    f'DELETE FROM "ShowListing" WHERE show_id = OLD.id; {INSERT_ROW} END',
+    'CREATE TRIGGER show_listing_ad AFTER DELETE ON "Show" BEGIN '
+    'DELETE FROM "ShowListing" WHERE show_id = OLD.id; END',
+    'CREATE TRIGGER show_listing_artist_au AFTER UPDATE OF name, image_link ON "Artist" '
+    'WHEN OLD.name IS NOT NEW.name OR OLD.image_link IS NOT NEW.image_link BEGIN '
+    'UPDATE "ShowListing" SET artist_name = NEW.name, artist_image_link = NEW.image_link '
+    'WHERE artist_id = NEW.id; END',
+    'CREATE TRIGGER show_listing_venue_au AFTER UPDATE OF name, image_link ON "Venue" '
+    'WHEN OLD.name IS NOT NEW.name OR OLD.image_link IS NOT NEW.image_link BEGIN '
+    'UPDATE "ShowListing" SET venue_name = NEW.name, venue_image_link = NEW.image_link '
+    'WHERE venue_id = NEW.id; END',
+]
+SQLITE_TRIGGER_NAMES = ('show_listing_ai', 'show_listing_au', 'show_listing_ad', 'show_listing_artist_au',
+                        'show_listing_venue_au')
+
+POSTGRES_TRIGGERS = [
+    'CREATE FUNCTION show_listing_show() RETURNS trigger AS $$ BEGIN '
+    "IF TG_OP IN ('UPDATE', 'DELETE') THEN DELETE FROM \"ShowListing\" WHERE show_id = OLD.id; END IF; "
+    f"IF TG_OP IN ('INSERT', 'UPDATE') THEN {INSERT_ROW} END IF; "
+    'RETURN NULL; END $$ LANGUAGE plpgsql',
+    'CREATE TRIGGER show_listing_show AFTER INSERT OR UPDATE OR DELETE ON "Show" '
+    'FOR EACH ROW EXECUTE PROCEDURE show_listing_show()',
+    'CREATE FUNCTION show_listing_artist() RETURNS trigger AS $$ BEGIN '
+    'UPDATE "ShowListing" SET artist_name = NEW.name, artist_image_link = NEW.image_link '
+    'WHERE artist_id = NEW.id; RETURN NULL; END $$ LANGUAGE plpgsql',
+    'CREATE TRIGGER show_listing_artist AFTER UPDATE OF name, image_link ON "Artist" FOR EACH ROW '
+    'WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.image_link IS DISTINCT FROM NEW.image_link) '
+    'EXECUTE PROCEDURE show_listing_artist()',
+    'CREATE FUNCTION show_listing_venue() RETURNS trigger AS $$ BEGIN '
+    'UPDATE "ShowListing" SET venue_name = NEW.name, venue_image_link = NEW.image_link '
+    'WHERE venue_id = NEW.id; RETURN NULL; END $$ LANGUAGE plpgsql',
+    'CREATE TRIGGER show_listing_venue AFTER UPDATE OF name, image_link ON "Venue" FOR EACH ROW '
+    'WHEN (OLD.name IS DISTINCT FROM NEW.name OR OLD.image_link IS DISTINCT FROM NEW.image_link) '
+    'EXECUTE PROCEDURE show_listing_venue()',
+]
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    op.create_table('ShowListing',
+                    sa.Column('show_id', sa.Integer(), nullable=False),
+                    sa.Column('start_time', sa.DateTime(), nullable=False),
+                    sa.Column('artist_id', sa.Integer(), nullable=False),
+                    sa.Column('artist_name', sa.String(), nullable=True),
+                    sa.Column('artist_image_link', sa.String(length=500), nullable=True),
+                    sa.Column('venue_id', sa.Integer(), nullable=False),
+                    sa.Column('venue_name', sa.String(), nullable=True),
+                    sa.Column('venue_image_link', sa.String(length=500), nullable=True),
+                    sa.ForeignKeyConstraint(['show_id'], ['Show.id'], ondelete='CASCADE'),
+                    sa.PrimaryKeyConstraint('show_id')
+                    )
+    op.create_index('ix_ShowListing_start_time_show_id', 'ShowListing', ['start_time', 'show_id'], unique=False)
+    op.create_index('ix_ShowListing_venue_id_start_time', 'ShowListing', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_ShowListing_artist_id_start_time', 'ShowListing', ['artist_id', 'start_time'],
+                    unique=False)
+    if dialect == 'postgresql':
+        for statement in POSTGRES_TRIGGERS:
+            op.execute(statement)
+    elif dialect == 'sqlite':
+        for statement in SQLITE_TRIGGERS:
+            op.execute(statement)
+    op.execute(f'INSERT INTO "ShowListing" ({COLUMNS}) SELECT "Show".id, "Show".start_time, {SELECT}, "Show" '
+               'WHERE "Artist".id = "Show".artist_id AND "Venue".id = "Show".venue_id')
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table, name in (('Venue', 'show_listing_venue'), ('Artist', 'show_listing_artist'),
+                            ('Show', 'show_listing_show')):
+            op.execute(f'DROP TRIGGER {name} ON "{table}"')
+            op.execute(f'DROP FUNCTION {name}()')
+    elif dialect == 'sqlite':
+        for name in SQLITE_TRIGGER_NAMES:
+            op.execute(f'DROP TRIGGER {name}')
+    op.drop_index('ix_ShowListing_artist_id_start_time', table_name='ShowListing')
+    op.drop_index('ix_ShowListing_venue_id_start_time', table_name='ShowListing')
+    op.drop_index('ix_ShowListing_start_time_show_id', table_name='ShowListing')
+    op.drop_table('ShowListing')
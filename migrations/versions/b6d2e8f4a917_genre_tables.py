@@ -0,0 +1,92 @@
+"""move Venue and Artist genres into a Genre table
+
+Revision ID: b6d2e8f4a917
+Revises: 7a3f9e2b6c41
+Create Date: 2026-10-18 14:05:31.418206
+
+"""
+import re
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6d2e8f4a917'
+down_revision = '7a3f9e2b6c41'
+branch_labels = None
+depends_on = None
+
+# entity table, association table and its foreign key column
+ASSOCIATIONS = (('Venue', 'VenueGenre', 'venue_id'), ('Artist', 'ArtistGenre', 'artist_id'))
+BATCH_SIZE = 5000
+
+
+def genre_key(name):
+    # same normalization as models.genre_key
+    return re.sub(r'[\W_]+', '', (name or '').casefold())
+
+
+def upgrade():
+    genre = op.create_table(
+        'Genre',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.Column('key', sa.String(length=100), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('key')
+    )
+    links = {}
+    for table, association, column in ASSOCIATIONS:
+        links[table] = op.create_table(
+            association,
+            sa.Column(column, sa.Integer(), nullable=False),
+            sa.Column('genre_id', sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint([column], [f'{table}.id'], ondelete='CASCADE'),
+            sa.ForeignKeyConstraint(['genre_id'], ['Genre.id'], ondelete='CASCADE'),
+            sa.PrimaryKeyConstraint(column, 'genre_id')
+        )
+        op.create_index(f'ix_{association}_genre_id_{column}', association, ['genre_id', column], unique=False)
+
+    # backfill from the arrays; near-duplicate spellings collapse into the
+    # first one seen
+    bind = op.get_bind()
+    ids = {}
+    for table, association, column in ASSOCIATIONS:
+        rows = []
+        result = bind.execute(sa.text(f'SELECT id, genres FROM "{table}" WHERE genres IS NOT NULL ORDER BY id'))
+        for entity_id, names in result:
+            seen = set()
+            for name in names:
+                key = genre_key(name)
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                if key not in ids:
+                    ids[key] = len(ids) + 1
+                    op.bulk_insert(genre, [{'id': ids[key], 'name': name.strip(), 'key': key}])
+                rows.append({column: entity_id, 'genre_id': ids[key]})
+                if len(rows) >= BATCH_SIZE:
+                    op.bulk_insert(links[table], rows)
+                    rows = []
+        if rows:
+            op.bulk_insert(links[table], rows)
+    if bind.dialect.name == 'postgresql' and ids:
+        op.execute('''SELECT setval(pg_get_serial_sequence('"Genre"', 'id'), (SELECT max(id) FROM "Genre"))''')
+
+    for table, _, _ in ASSOCIATIONS:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('genres')
+
+
+def downgrade():
+    for table, association, column in ASSOCIATIONS:
+        op.add_column(table, sa.Column('genres', postgresql.ARRAY(sa.String(length=100)), nullable=True))
+        op.execute(
+            f'UPDATE "{table}" SET genres = coalesce((SELECT array_agg(g.name ORDER BY g.name) '
+            f'FROM "{association}" a JOIN "Genre" g ON g.id = a.genre_id WHERE a.{column} = "{table}".id), '
+            "'{}')"
+        )
+        op.drop_index(f'ix_{association}_genre_id_{column}', table_name=association)
+        op.drop_table(association)
+    op.drop_table('Genre')
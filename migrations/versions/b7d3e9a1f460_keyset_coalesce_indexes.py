@@ -0,0 +1,34 @@
+"""index the listing sort keys with NULL text as ''
+
+Revision ID: b7d3e9a1f460
+Revises: c4f1a9d3e682
+Create Date: 2026-10-18 21:40:12.582914
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e9a1f460'
+down_revision = 'c4f1a9d3e682'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # keyset pagination now orders by coalesce(column, '') so that rows with
+    # a NULL name, city or state are not skipped by the cursor comparison
+    op.drop_index('ix_Venue_state_city_name_id', table_name='Venue')
+    op.drop_index('ix_Artist_name_id', table_name='Artist')
+    op.create_index('ix_Venue_state_city_name_id', 'Venue',
+                    [sa.text("coalesce(state, '')"), sa.text("coalesce(city, '')"),
+                     sa.text("coalesce(name, '')"), 'id'], unique=False)
+    op.create_index('ix_Artist_name_id', 'Artist', [sa.text("coalesce(name, '')"), 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Artist_name_id', table_name='Artist')
+    op.drop_index('ix_Venue_state_city_name_id', table_name='Venue')
+    op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'], unique=False)
+    op.create_index('ix_Venue_state_city_name_id', 'Venue', ['state', 'city', 'name', 'id'], unique=False)
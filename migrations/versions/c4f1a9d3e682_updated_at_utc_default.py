@@ -0,0 +1,35 @@
+"""UTC database default for updated_at
+
+Revision ID: c4f1a9d3e682
+Revises: a8e4c2f7b159
+Create Date: 2026-10-18 20:12:41.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4f1a9d3e682'
+down_revision = 'a8e4c2f7b159'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 2c8d5e7f9a14 defaults to now(), the session's local time, while the app
+    # writes UTC. The rows it stamped keep a local time: one behind UTC only
+    # predates the real last change, but one ahead of UTC would hide the
+    # writes that followed from Last-Modified and incremental exports, so it
+    # becomes the current UTC time.
+    utc_now = sa.literal_column("TIMEZONE('utc', CURRENT_TIMESTAMP)", sa.DateTime())
+    for table in ('Venue', 'Artist', 'Show'):
+        op.alter_column(table, 'updated_at', existing_type=sa.DateTime(),
+                        server_default=sa.text("TIMEZONE('utc', CURRENT_TIMESTAMP)"))
+        rows = sa.table(table, sa.column('updated_at', sa.DateTime()))
+        op.execute(rows.update().where(rows.c.updated_at > utc_now).values(updated_at=utc_now))
+
+
+def downgrade():
+    for table in ('Venue', 'Artist', 'Show'):
+        op.alter_column(table, 'updated_at', existing_type=sa.DateTime(), server_default=sa.func.now())
@@ -0,0 +1,30 @@
+"""indexes for the home page and the venue availability search
+
+Revision ID: d7a2c5e9f184
+Revises: b6d2e8f4a917
+Create Date: 2026-10-18 17:42:09.236518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a2c5e9f184'
+down_revision = 'b6d2e8f4a917'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # the recently listed artists and venues on the home page
+    op.create_index(op.f('ix_Artist_date_created'), 'Artist', ['date_created'], unique=False)
+    op.create_index(op.f('ix_Venue_date_created'), 'Venue', ['date_created'], unique=False)
+    op.create_index('ix_Venue_lower_state_lower_city', 'Venue',
+                    [sa.text('lower(state)'), sa.text('lower(city)')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Venue_lower_state_lower_city', table_name='Venue')
+    op.drop_index(op.f('ix_Venue_date_created'), table_name='Venue')
+    op.drop_index(op.f('ix_Artist_date_created'), table_name='Artist')
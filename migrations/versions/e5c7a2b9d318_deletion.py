@@ -0,0 +1,44 @@
+"""Deletion: when a venue, artist or show was last deleted
+
+Revision ID: e5c7a2b9d318
+Revises: b7d3e9a1f460
+Create Date: 2026-10-18 22:05:37.140286
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c7a2b9d318'
+down_revision = 'b7d3e9a1f460'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def upgrade():
+    deletion = op.create_table(
+        'Deletion',
+        sa.Column('table_name', sa.String(length=64), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), server_default=sa.text("TIMEZONE('utc', CURRENT_TIMESTAMP)"),
+                  nullable=False),
+        sa.PrimaryKeyConstraint('table_name')
+    )
+    op.bulk_insert(deletion, [{'table_name': table} for table in TABLES])
+    # the same as conditional.POSTGRES_TRIGGERS
+    op.execute(
+        'CREATE OR REPLACE FUNCTION record_deletion() RETURNS trigger AS $$ BEGIN '
+        "UPDATE \"Deletion\" SET deleted_at = TIMEZONE('utc', CURRENT_TIMESTAMP) WHERE table_name = TG_TABLE_NAME; "
+        'RETURN NULL; END $$ LANGUAGE plpgsql')
+    for table in TABLES:
+        op.execute(f'CREATE TRIGGER deletion_{table.lower()} AFTER DELETE ON "{table}" '
+                   'FOR EACH STATEMENT EXECUTE PROCEDURE record_deletion()')
+
+
+def downgrade():
+    for table in TABLES:
+        op.execute(f'DROP TRIGGER deletion_{table.lower()} ON "{table}"')
+    op.execute('DROP FUNCTION record_deletion()')
+    op.drop_table('Deletion')
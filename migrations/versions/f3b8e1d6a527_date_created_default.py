@@ -0,0 +1,28 @@
+"""database default for Artist and Venue date_created
+
+Revision ID: f3b8e1d6a527
+Revises: d7a2c5e9f184
+Create Date: 2026-10-18 18:31:54.907142
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b8e1d6a527'
+down_revision = 'd7a2c5e9f184'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # rows inserted outside the ORM (COPY in the importer) get the insert time
+    for table in ('Artist', 'Venue'):
+        op.alter_column(table, 'date_created', existing_type=sa.DateTime(),
+                        server_default=sa.text("TIMEZONE('utc', CURRENT_TIMESTAMP)"))
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.alter_column(table, 'date_created', existing_type=sa.DateTime(), server_default=None)
@@ -0,0 +1,58 @@
+"""Tombstone: one row per deleted venue, artist or show
+
+Revision ID: f9c1b4d7e263
+Revises: e5c7a2b9d318
+Create Date: 2026-10-19 10:12:44.508112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f9c1b4d7e263'
+down_revision = 'e5c7a2b9d318'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    now = "TIMEZONE('utc', CURRENT_TIMESTAMP)" if dialect == 'postgresql' else 'CURRENT_TIMESTAMP'
+    op.create_table(
+        'Tombstone',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('table_name', sa.String(length=64), nullable=False),
+        sa.Column('row_id', sa.Integer(), nullable=False),
+        sa.Column('deleted_at', sa.DateTime(), server_default=sa.text(now), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_Tombstone_table_name_deleted_at', 'Tombstone', ['table_name', 'deleted_at'])
+    # the same as exporter.POSTGRES_TRIGGERS / exporter.SQLITE_TRIGGERS
+    if dialect == 'postgresql':
+        op.execute(
+            'CREATE OR REPLACE FUNCTION record_tombstone() RETURNS trigger AS $$ BEGIN '
+            'INSERT INTO "Tombstone" (table_name, row_id) VALUES (TG_TABLE_NAME, OLD.id); '
+            'RETURN NULL; END $$ LANGUAGE plpgsql')
+        for table in TABLES:
+            op.execute(f'CREATE TRIGGER tombstone_{table.lower()} AFTER DELETE ON "{table}" '
+                       'FOR EACH ROW EXECUTE PROCEDURE record_tombstone()')
+    elif dialect == 'sqlite':
+        for table in TABLES:
+            op.execute(f'CREATE TRIGGER tombstone_{table.lower()}_ad AFTER DELETE ON "{table}" BEGIN '
+                       f"INSERT INTO \"Tombstone\" (table_name, row_id) VALUES ('{table}', OLD.id); END")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        for table in TABLES:
+            op.execute(f'DROP TRIGGER tombstone_{table.lower()} ON "{table}"')
+        op.execute('DROP FUNCTION record_tombstone()')
+    elif dialect == 'sqlite':
+        for table in TABLES:
+            op.execute(f'DROP TRIGGER tombstone_{table.lower()}_ad')
+    op.drop_index('ix_Tombstone_table_name_deleted_at', table_name='Tombstone')
+    op.drop_table('Tombstone')
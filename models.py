@@ -1,9 +1,90 @@
 import datetime
-from flask_sqlalchemy import SQLAlchemy
-db = SQLAlchemy()
+import re
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+from database import RoutingSQLAlchemy
+db = RoutingSQLAlchemy()
 
 
-class Venue(db.Model):
+class utcnow(FunctionElement):
+    # the current UTC time as a naive timestamp, like datetime.utcnow
+    type = db.DateTime()
+
+
+@compiles(utcnow)
+def _utcnow(element, compiler, **kw):
+    return 'CURRENT_TIMESTAMP'
+
+
+@compiles(utcnow, 'postgresql')
+def _utcnow_postgresql(element, compiler, **kw):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+
+def genre_key(name):
+    # "Hip-Hop", "hip hop" and "HIPHOP" are the same genre
+    return re.sub(r'[\W_]+', '', (name or '').casefold())
+
+
+class Genre(db.Model):
+    __tablename__ = 'Genre'
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    key = db.Column(db.String(100), nullable=False, unique=True)
+
+
+# (genre_id, entity id) indexes serve genre filters; the primary keys serve
+# loading an entity's genres
+venue_genres = db.Table(
+    'VenueGenre',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_VenueGenre_genre_id_venue_id', 'genre_id', 'venue_id'),
+)
+artist_genres = db.Table(
+    'ArtistGenre',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('Genre.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_ArtistGenre_genre_id_artist_id', 'genre_id', 'artist_id'),
+)
+
+
+def genres_for(names):
+    # Genre rows for `names`, matched on genre_key() so near-duplicates share
+    # a row. Genres created here are remembered for the rest of the session,
+    # since they may not be in it yet when the next entity asks for them.
+    genres = {}
+    for name in names or ():
+        key = genre_key(name)
+        if key and key not in genres:
+            genres[key] = name.strip()
+    if not genres:
+        return []
+    created = db.session.info.setdefault('created_genres', {})
+    found = {key: created[key] for key in genres if key in created}
+    missing = [key for key in genres if key not in found]
+    if missing:
+        with db.session.no_autoflush:
+            found.update((genre.key, genre) for genre in Genre.query.filter(Genre.key.in_(missing)))
+    for key, name in genres.items():
+        if key not in found:
+            found[key] = created[key] = Genre(name=name, key=key)
+    return [found[key] for key in genres]
+
+
+class GenresMixin:
+
+    @property
+    def genres(self):
+        return [genre.name for genre in self.genre_list]
+
+    @genres.setter
+    def genres(self, names):
+        self.genre_list = genres_for(names)
+
+
+class Venue(GenresMixin, db.Model):
     __tablename__ = 'Venue'
 
     id = db.Column(db.Integer, primary_key=True)
@@ -12,17 +93,28 @@ class Venue(db.Model):
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(100)), default=[])
+    genre_list = db.relationship('Genre', secondary=venue_genres, order_by=Genre.name)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(110))
     seeking_talent = db.Column(db.Boolean(), default=False)
     seeking_description = db.Column(db.String(500))
-    date_created = db.Column(db.DateTime(), default=datetime.datetime.utcnow())
+    date_created = db.Column(db.DateTime(), default=datetime.datetime.utcnow, server_default=utcnow(), index=True)
+    updated_at = db.Column(db.DateTime(), default=datetime.datetime.utcnow, server_default=utcnow(),
+                           onupdate=datetime.datetime.utcnow, index=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship('Show', backref="venue", lazy=True)
 
 
-class Artist(db.Model):
+# the availability search matches city and state case-insensitively
+db.Index('ix_Venue_lower_state_lower_city', db.func.lower(Venue.state), db.func.lower(Venue.city))
+# keyset pagination orders by these (see pagination.sort_key)
+db.Index('ix_Venue_state_city_name_id', db.func.coalesce(Venue.state, ''), db.func.coalesce(Venue.city, ''),
+         db.func.coalesce(Venue.name, ''), Venue.id)
+
+
+class Artist(GenresMixin, db.Model):
     __tablename__ = 'Artist'
 
     id = db.Column(db.Integer, primary_key=True)
@@ -30,19 +122,94 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.ARRAY(db.String(100)), default=[])
+    genre_list = db.relationship('Genre', secondary=artist_genres, order_by=Genre.name)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(110))
     seeking_venue = db.Column(db.Boolean(), default=False)
     seeking_description = db.Column(db.String(500))
-    date_created = db.Column(db.DateTime(), default=datetime.datetime.utcnow())
+    date_created = db.Column(db.DateTime(), default=datetime.datetime.utcnow, server_default=utcnow(), index=True)
+    updated_at = db.Column(db.DateTime(), default=datetime.datetime.utcnow, server_default=utcnow(),
+                           onupdate=datetime.datetime.utcnow, index=True)
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     shows = db.relationship("Show", backref="artist", lazy=True)
 
 
+db.Index('ix_Artist_name_id', db.func.coalesce(Artist.name, ''), Artist.id)
+
+
+def touch(target, value, initiator):
+    # genre changes only write the association tables, so bump updated_at for
+    # the conditional GET validators and incremental exports
+    target.updated_at = datetime.datetime.utcnow()
+
+
+for model in (Venue, Artist):
+    db.event.listen(model.genre_list, 'append', touch)
+    db.event.listen(model.genre_list, 'remove', touch)
+
+
+DEFAULT_SHOW_DURATION = datetime.timedelta(hours=2)
+# the show form caps durations, which bounds range scans on start_time
+MAX_SHOW_DURATION = datetime.timedelta(hours=24)
+
+
+def default_end_time(context):
+    return context.get_current_parameters()['start_time'] + DEFAULT_SHOW_DURATION
+
+
 class Show(db.Model):
     __tablename__ = 'Show'
+    __table_args__ = (
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+        db.Index('ix_Show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_Show_artist_id_start_time', 'artist_id', 'start_time'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'))
     venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'))
-    start_time = db.Column(db.DateTime(), nullable=False, default=datetime.datetime.utcnow())
+    start_time = db.Column(db.DateTime(), nullable=False, default=datetime.datetime.utcnow)
+    end_time = db.Column(db.DateTime(), nullable=False, default=default_end_time)
+    updated_at = db.Column(db.DateTime(), default=datetime.datetime.utcnow, server_default=utcnow(),
+                           onupdate=datetime.datetime.utcnow, index=True)
+
+
+class Deletion(db.Model):
+    # when a Venue, Artist or Show row was last deleted, one row per table
+    # kept by triggers (see conditional.py)
+    __tablename__ = 'Deletion'
+    table_name = db.Column(db.String(64), primary_key=True)
+    deleted_at = db.Column(db.DateTime(), nullable=False, server_default=utcnow())
+
+
+class Tombstone(db.Model):
+    # one row per deleted Venue, Artist or Show, written by triggers (see
+    # exporter.py) for incremental exports
+    __tablename__ = 'Tombstone'
+    __table_args__ = (
+        db.Index('ix_Tombstone_table_name_deleted_at', 'table_name', 'deleted_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(64), nullable=False)
+    row_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime(), nullable=False, server_default=utcnow())
+
+
+class ShowListing(db.Model):
+    # a show with the display fields of its artist and venue, kept in step
+    # with Show, Artist and Venue by database triggers (see listing.py)
+    __tablename__ = 'ShowListing'
+    __table_args__ = (
+        db.Index('ix_ShowListing_start_time_show_id', 'start_time', 'show_id'),
+        db.Index('ix_ShowListing_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_ShowListing_artist_id_start_time', 'artist_id', 'start_time'),
+    )
+    show_id = db.Column(db.Integer, db.ForeignKey('Show.id', ondelete='CASCADE'), primary_key=True)
+    start_time = db.Column(db.DateTime(), nullable=False)
+    artist_id = db.Column(db.Integer, nullable=False)
+    artist_name = db.Column(db.String)
+    artist_image_link = db.Column(db.String(500))
+    venue_id = db.Column(db.Integer, nullable=False)
+    venue_name = db.Column(db.String)
+    venue_image_link = db.Column(db.String(500))
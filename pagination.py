@@ -0,0 +1,97 @@
+import base64
+import binascii
+import datetime
+import json
+from flask import abort, current_app, request
+from models import db
+
+# Keyset (cursor) pagination for the listing pages. Rows are ordered by a
+# unique, indexed column tuple such as (name, id), and a page is fetched with
+# `WHERE (name, id) > (last name, last id) LIMIT n`, so deep pages cost the
+# same as the first one. Cursors are opaque urlsafe-base64 JSON holding the
+# direction and the boundary row's key. A row value comparison with a NULL in
+# it is never true, so nullable text columns are ordered and compared as
+# coalesce(column, ''), and their indexes are built on the same expression.
+
+
+class KeysetPage:
+
+    def __init__(self, items, next_cursor, prev_cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+        self.per_page = per_page
+
+
+def encode_cursor(direction, values):
+    values = [value.isoformat() if isinstance(value, datetime.datetime) else value for value in values]
+    payload = json.dumps([direction, values], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_cursor(cursor, columns):
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        direction, values = json.loads(payload)
+        if direction not in ('next', 'prev') or len(values) != len(columns):
+            raise ValueError(cursor)
+        values = [datetime.datetime.fromisoformat(value)
+                  if isinstance(column.type, db.DateTime) and value is not None else value
+                  for column, value in zip(columns, values)]
+    except (binascii.Error, TypeError, ValueError):
+        abort(400)
+    return direction, values
+
+
+def page_size():
+    per_page = request.args.get('per_page', current_app.config['PAGE_SIZE'], type=int)
+    return min(max(per_page, 1), current_app.config['MAX_PAGE_SIZE'])
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=None):
+    # `columns` must make the ordering unique, e.g. (Artist.name, Artist.id);
+    # rows need attributes named after the columns' keys
+    query, direction, per_page = keyset_query(query, columns, cursor, per_page)
+    return keyset_page(query.all(), columns, cursor, direction, per_page)
+
+
+def sort_key(column):
+    if column.expression.nullable and isinstance(column.type, db.String):
+        # a literal, not a parameter, so that it matches the index expression
+        return db.func.coalesce(column, db.literal_column("''"))
+    return column
+
+
+def keyset_query(query, columns, cursor=None, per_page=None):
+    # the query for one page and how to read it back with keyset_page(), for
+    # callers that run the query themselves
+    per_page = per_page or page_size()
+    keys = [sort_key(column) for column in columns]
+    direction = 'next'
+    if cursor:
+        direction, values = decode_cursor(cursor, columns)
+        values = ['' if value is None and key is not column else value
+                  for column, key, value in zip(columns, keys, values)]
+        if direction == 'next':
+            query = query.filter(db.tuple_(*keys) > db.tuple_(*values))
+        else:
+            query = query.filter(db.tuple_(*keys) < db.tuple_(*values))
+    if direction == 'next':
+        query = query.order_by(*keys)
+    else:
+        query = query.order_by(*[key.desc() for key in keys])
+    return query.limit(per_page + 1), direction, per_page
+
+
+def keyset_page(items, columns, cursor, direction, per_page):
+    items = list(items)
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if direction == 'prev':
+        items.reverse()
+    has_next = has_more if direction == 'next' else bool(cursor)
+    has_prev = bool(cursor) if direction == 'next' else has_more
+    key = lambda item: [getattr(item, column.key) for column in columns]
+    next_cursor = encode_cursor('next', key(items[-1])) if items and has_next else None
+    prev_cursor = encode_cursor('prev', key(items[0])) if items and has_prev else None
+    return KeysetPage(items, next_cursor, prev_cursor, per_page)
@@ -0,0 +1,124 @@
+import json
+import re
+import time
+from collections import Counter
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Per-request SQL profiling. Cursor events on every engine time each
+# statement of the current request; after the request, the query count,
+# total database time, slowest statements and statements repeated with
+# different parameters (the N+1 pattern) are reported. SQL_PROFILE picks
+# where: "header" adds X-SQL-* and Server-Timing headers (development),
+# "log" writes one JSON line per request to the app log (production) and
+# "off" disables profiling.
+#
+# SQL_QUERY_BUDGETS caps the queries of an endpoint; going over it raises
+# QueryBudgetExceeded when the app is testing and logs a warning otherwise.
+
+_STRINGS = re.compile(r"'(?:[^']|'')*'")
+_NUMBERS = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAMS = re.compile(r'%\(\w+\)s|%s|\?|(?<!:):\w+|\$\d+')
+_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_SPACES = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def fingerprint(statement):
+    # the statement with literals and parameters replaced by ? and IN lists
+    # collapsed, so the same query with other values looks the same
+    statement = _STRINGS.sub('?', statement)
+    statement = _PARAMS.sub('?', statement)
+    statement = _NUMBERS.sub('?', statement)
+    statement = _LISTS.sub('(?)', statement)
+    return _SPACES.sub(' ', statement).strip()
+
+
+class RequestProfile:
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.statements = []
+        self.fingerprints = Counter()
+
+    def record(self, statement, duration):
+        self.count += 1
+        self.total += duration
+        self.statements.append((duration, statement))
+        self.fingerprints[fingerprint(statement)] += 1
+
+    def slowest(self, n):
+        return sorted(self.statements, key=lambda item: item[0], reverse=True)[:n]
+
+    def repeated(self, threshold):
+        # [(fingerprint, times)] of statements run at least `threshold` times
+        return [(statement, times) for statement, times in self.fingerprints.most_common()
+                if times >= threshold]
+
+    def summary(self, slowest=3, threshold=5):
+        return {
+            'queries': self.count,
+            'db_ms': round(self.total * 1000, 3),
+            'slowest': [{'ms': round(duration * 1000, 3), 'statement': _SPACES.sub(' ', statement)}
+                        for duration, statement in self.slowest(slowest)],
+            'repeated': [{'times': times, 'statement': statement}
+                         for statement, times in self.repeated(threshold)],
+        }
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('profiler_start', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('profiler_start')
+    if not starts:
+        return
+    duration = time.perf_counter() - starts.pop()
+    if has_request_context():
+        profile = g.get('sql_profile')
+        if profile is not None:
+            profile.record(statement, duration)
+
+
+def init_app(app):
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+
+    @app.before_request
+    def start_profile():
+        if app.config.get('SQL_PROFILE', 'off') != 'off':
+            g.sql_profile = RequestProfile()
+
+    @app.after_request
+    def report_profile(response):
+        profile = g.pop('sql_profile', None)
+        if profile is None:
+            return response
+        mode = app.config['SQL_PROFILE']
+        g.sql_time, g.sql_queries = profile.total, profile.count
+        summary = profile.summary(app.config.get('SQL_SLOWEST', 3), app.config.get('SQL_N_PLUS_ONE_THRESHOLD', 5))
+        summary.update(method=request.method, path=request.path, endpoint=request.endpoint,
+                       status=response.status_code)
+        if mode == 'header':
+            response.headers['X-SQL-Queries'] = str(summary['queries'])
+            response.headers['X-SQL-Time-Ms'] = str(summary['db_ms'])
+            response.headers['X-SQL-Repeated'] = str(len(summary['repeated']))
+            response.headers['Server-Timing'] = f'db;dur={summary["db_ms"]};desc="{summary["queries"]} queries"'
+            if summary['repeated']:
+                app.logger.debug(json.dumps(summary))
+        elif mode == 'log':
+            app.logger.info(json.dumps(summary))
+        budget = app.config.get('SQL_QUERY_BUDGETS', {}).get(request.endpoint)
+        if budget is not None and profile.count > budget:
+            message = f'{request.endpoint} ran {profile.count} queries, its budget is {budget}'
+            if app.testing:
+                raise QueryBudgetExceeded(message, summary['repeated'])
+            app.logger.warning(message)
+        return response
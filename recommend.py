@@ -0,0 +1,329 @@
+import threading
+import numpy as np
+from sqlalchemy import event, inspect
+from models import Venue, Artist, Show, Genre, db
+import genres
+from generation import data_generation
+
+# Artist <-> venue recommendations. Each side is a matrix with one row per
+# venue or artist and one 0/1 column per genre, plus integer codes for city
+# and state. A query row is widened with the genres the other side has
+# booked alongside its own in all shows, played or upcoming (a genre
+# co-occurrence matrix), then scored against every row at once with a
+# matrix-vector product (cosine similarity) and a location bonus;
+# np.argpartition picks the top k. The matrices are built on first use and
+# patched in place from session events after each commit, so scoring never
+# touches the database: a deleted show, or the old pair of a moved one, is
+# subtracted from the co-occurrence counts, and a genre change of an entity
+# rebuilds them, since its shows were counted under its old genres. Each worker process has its own matrices and only
+# sees its own commits, so an entity missing from them that does exist (added
+# by another worker) rebuilds them, and so does a move of the data generation
+# (the importer, bulk deletes). Any change can reorder any entity's matches,
+# so the detail pages don't embed them: they fetch them from the JSON API,
+# and the pages' cache entries and ETags don't depend on them.
+
+# weight of the co-occurrence expansion and of a shared state / city
+COOCCURRENCE_WEIGHT = 0.5
+STATE_BONUS = 0.15
+CITY_BONUS = 0.15
+
+
+class EntityMatrix:
+    # genre rows of one side; rows of deleted entities stay but are inactive
+
+    def __init__(self, model, seeking):
+        self.model = model
+        self.seeking_attr = seeking
+        self.size = 0
+        self.rows = {}
+        self._allocate(1024, 32)
+
+    def _allocate(self, capacity, genres):
+        old = self.__dict__.get('genres')
+        self.ids = _grow(self.__dict__.get('ids'), (capacity,), np.int64)
+        self.genres = np.zeros((capacity, genres), np.float32)
+        if old is not None:
+            self.genres[:old.shape[0], :old.shape[1]] = old
+        self.norms = _grow(self.__dict__.get('norms'), (capacity,), np.float32)
+        self.cities = _grow(self.__dict__.get('cities'), (capacity,), np.int32)
+        self.states = _grow(self.__dict__.get('states'), (capacity,), np.int32)
+        self.seeking = _grow(self.__dict__.get('seeking'), (capacity,), np.bool_)
+        self.active = _grow(self.__dict__.get('active'), (capacity,), np.bool_)
+
+    def reserve(self, rows, genres):
+        capacity, columns = self.genres.shape
+        if rows > capacity or genres > columns:
+            while capacity < rows:
+                capacity *= 2
+            while columns < genres:
+                columns *= 2
+            self._allocate(capacity, columns)
+
+    def set(self, entity_id, columns, city, state, seeking):
+        row = self.rows.get(entity_id)
+        self.reserve(self.size + (row is None), max(columns, default=-1) + 1)
+        if row is None:
+            row = self.size
+            self.rows[entity_id] = row
+            self.ids[row] = entity_id
+            self.size += 1
+        self.genres[row] = 0
+        self.genres[row, list(columns)] = 1
+        self.norms[row] = np.sqrt(len(columns))
+        self.cities[row] = city
+        self.states[row] = state
+        self.seeking[row] = bool(seeking)
+        self.active[row] = True
+
+    def remove(self, entity_id):
+        row = self.rows.get(entity_id)
+        if row is not None:
+            self.active[row] = False
+
+    def columns(self, entity_id):
+        # the genre columns of an entity, None when it has no row
+        row = self.rows.get(entity_id)
+        if row is None:
+            return None
+        return set(np.flatnonzero(self.genres[row]).tolist())
+
+
+def _grow(array, shape, dtype):
+    grown = np.zeros(shape, dtype)
+    if array is not None:
+        grown[:array.shape[0]] = array
+    return grown
+
+
+class Recommender:
+
+    def __init__(self):
+        self.loaded = False
+        self.generation = None
+        # times the matrices were built, so that concurrent misses rebuild once
+        self.builds = 0
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.genre_columns = {}
+        self.locations = {}
+        self.sides = {Venue: EntityMatrix(Venue, 'seeking_talent'),
+                      Artist: EntityMatrix(Artist, 'seeking_venue')}
+        # cooccurrence[i, j]: shows between an artist with genre i and a venue
+        # with genre j
+        self.cooccurrence = np.zeros((32, 32), np.float32)
+
+    def init_app(self, app):
+        event.listen(db.session, 'after_flush', self._collect)
+        event.listen(db.session, 'after_commit', self._apply)
+        event.listen(db.session, 'after_rollback', self._discard)
+
+    def _column(self, genre):
+        column = self.genre_columns.get(genre)
+        if column is None:
+            column = self.genre_columns[genre] = len(self.genre_columns)
+            if column >= self.cooccurrence.shape[0]:
+                size = self.cooccurrence.shape[0] * 2
+                grown = np.zeros((size, size), np.float32)
+                grown[:self.cooccurrence.shape[0], :self.cooccurrence.shape[1]] = self.cooccurrence
+                self.cooccurrence = grown
+        return column
+
+    def _location(self, key):
+        if not key or not key[-1]:
+            return -1
+        return self.locations.setdefault(key, len(self.locations))
+
+    def _set(self, model, entity_id, genres, city, state, seeking):
+        city_key = ((city or '').strip().casefold(), (state or '').strip().casefold())
+        columns = {self._column(genre) for genre in genres or ()}
+        self.sides[model].set(entity_id, columns, self._location(city_key),
+                              self._location((city_key[1],)), seeking)
+
+    def _count_shows(self, pairs, sign=1):
+        # adds (artist_id, venue_id) shows to the co-occurrence matrix, or
+        # subtracts them with sign=-1
+        artists, venues = self.sides[Artist], self.sides[Venue]
+        artist_rows, venue_rows = [], []
+        for artist_id, venue_id in pairs:
+            if artist_id in artists.rows and venue_id in venues.rows:
+                artist_rows.append(artists.rows[artist_id])
+                venue_rows.append(venues.rows[venue_id])
+        if artist_rows:
+            columns = len(self.genre_columns)
+            counts = artists.genres[artist_rows, :columns].T @ venues.genres[venue_rows, :columns]
+            self.cooccurrence[:columns, :columns] += sign * counts
+
+    def load(self):
+        with self._lock:
+            generation = data_generation.current()
+            if self.loaded and self.generation == generation:
+                return
+            self._reset()
+            for model, side in self.sides.items():
+                foreign_key = genres.ASSOCIATIONS[model]
+                names = {}
+                for entity_id, name in (db.session.query(foreign_key, Genre.name)
+                                        .join(Genre, Genre.id == foreign_key.table.c.genre_id)):
+                    names.setdefault(entity_id, []).append(name)
+                rows = db.session.query(model.id, model.city, model.state, getattr(model, side.seeking_attr))
+                for entity_id, city, state, seeking in rows:
+                    self._set(model, entity_id, names.get(entity_id), city, state, seeking)
+            self._count_shows(db.session.query(Show.artist_id, Show.venue_id))
+            self.generation = generation
+            self.loaded = True
+            self.builds += 1
+
+    def invalidate(self):
+        # the next lookup rebuilds everything
+        with self._lock:
+            self.loaded = False
+
+    def recommend(self, model, entity_id, k=10):
+        # [(id, score)] of the best matches on the other side for a venue or
+        # artist, or None when it doesn't exist
+        self.load()
+        builds = self.builds
+        matches = self._score(model, entity_id, k)
+        if matches is None:
+            if db.session.query(model.id).filter(model.id == entity_id).first() is None:
+                return None
+            with self._lock:
+                if self.builds == builds:
+                    self.loaded = False
+            self.load()
+            matches = self._score(model, entity_id, k)
+        return [] if matches is None else matches
+
+    def _score(self, model, entity_id, k):
+        # recommend() from the matrices as they are; None when the entity
+        # isn't in them
+        other = Artist if model is Venue else Venue
+        with self._lock:
+            side, candidates = self.sides[model], self.sides[other]
+            row = side.rows.get(entity_id)
+            if row is None or not side.active[row]:
+                return None
+            columns = len(self.genre_columns)
+            n = candidates.size
+            if not n or not columns:
+                return []
+            query = side.genres[row, :columns]
+            # widen the query with the genres its side has been booked with,
+            # each source genre's counts normalized to a distribution
+            cooccurrence = self.cooccurrence[:columns, :columns]
+            if model is Venue:
+                cooccurrence = cooccurrence.T
+            totals = cooccurrence.sum(axis=1, keepdims=True)
+            played = np.divide(cooccurrence, totals, out=np.zeros_like(cooccurrence), where=totals > 0)
+            query = query + COOCCURRENCE_WEIGHT * (query @ played)
+            query_norm = np.linalg.norm(query)
+            if not query_norm:
+                return []
+            norms = candidates.norms[:n]
+            scores = candidates.genres[:n, :columns] @ query
+            scores = np.divide(scores, norms * query_norm, out=np.zeros(n, np.float32), where=norms > 0)
+            relevant = scores > 0
+            if side.states[row] >= 0:
+                scores += STATE_BONUS * (candidates.states[:n] == side.states[row])
+            if side.cities[row] >= 0:
+                scores += CITY_BONUS * (candidates.cities[:n] == side.cities[row])
+            eligible = relevant & candidates.active[:n] & candidates.seeking[:n]
+            scores = np.where(eligible, scores, -np.inf)
+            k = min(k, int(eligible.sum()))
+            if k <= 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind='stable')]
+            return [(int(candidates.ids[i]), round(float(scores[i]), 4)) for i in top]
+
+    def _collect(self, session, flush_context):
+        pending = session.info.setdefault('recommend', {'set': {}, 'removed': set(), 'shows': [],
+                                                        'removed_shows': [], 'stale': False})
+        for obj in session.new | session.dirty:
+            if isinstance(obj, (Venue, Artist)):
+                side = self.sides[type(obj)]
+                pending['set'][(type(obj), obj.id)] = (obj.genres, obj.city, obj.state,
+                                                        getattr(obj, side.seeking_attr))
+            elif isinstance(obj, Show) and obj in session.new:
+                pending['shows'].append((obj.artist_id, obj.venue_id))
+            elif isinstance(obj, Show) and _moved(obj):
+                old = _committed_pair(obj)
+                if old is None:
+                    pending['stale'] = True
+                elif old != (obj.artist_id, obj.venue_id):
+                    pending['removed_shows'].append(old)
+                    pending['shows'].append((obj.artist_id, obj.venue_id))
+        for obj in session.deleted:
+            if isinstance(obj, (Venue, Artist)):
+                pending['set'].pop((type(obj), obj.id), None)
+                pending['removed'].add((type(obj), obj.id))
+            elif isinstance(obj, Show):
+                old = _committed_pair(obj)
+                if old is None:
+                    pending['stale'] = True
+                else:
+                    pending['removed_shows'].append(old)
+
+    def _apply(self, session):
+        pending = session.info.pop('recommend', None)
+        if not pending or not any(pending.values()):
+            return
+        with self._lock:
+            if not self.loaded:
+                return
+            if pending['stale']:
+                # a show changed whose old artist and venue aren't known
+                self.loaded = False
+                return
+            for (model, entity_id), (entity_genres, *_) in pending['set'].items():
+                columns = self.sides[model].columns(entity_id)
+                if columns is not None and columns != {self.genre_columns.get(genre)
+                                                       for genre in entity_genres or ()}:
+                    self.loaded = False
+                    return
+            # removed shows were counted under the genres they still have
+            self._count_shows(pending['removed_shows'], sign=-1)
+            for (model, entity_id), values in pending['set'].items():
+                self._set(model, entity_id, *values)
+            for model, entity_id in pending['removed']:
+                self.sides[model].remove(entity_id)
+            self._count_shows(pending['shows'])
+
+    def _discard(self, session):
+        session.info.pop('recommend', None)
+
+
+def _moved(show):
+    state = inspect(show)
+    return any(state.attrs[key].history.has_changes() for key in ('artist_id', 'venue_id'))
+
+
+def _committed_pair(show):
+    # (artist_id, venue_id) of a show as the database had it before this
+    # flush, without loading anything; None when it wasn't loaded
+    state = inspect(show)
+    pair = []
+    for key in ('artist_id', 'venue_id'):
+        history = state.attrs[key].history
+        old = history.deleted or history.unchanged
+        if not old:
+            return None
+        pair.append(old[0])
+    return tuple(pair)
+
+
+recommender = Recommender()
+
+
+def recommendations(model, entity_id, k=10):
+    # recommend() with the name and image of each match, in one query
+    matches = recommender.recommend(model, entity_id, k)
+    if not matches:
+        return matches
+    other = Artist if model is Venue else Venue
+    rows = {row.id: row for row in db.session.query(other.id, other.name, other.image_link)
+            .filter(other.id.in_([match_id for match_id, _ in matches]))}
+    return [{'id': match_id, 'name': rows[match_id].name, 'image_link': rows[match_id].image_link, 'score': score}
+            for match_id, score in matches if match_id in rows]
@@ -0,0 +1,110 @@
+import bisect
+import datetime
+import threading
+from collections import OrderedDict
+from models import Show, db, DEFAULT_SHOW_DURATION
+
+# Double-booking checks. A venue or artist can't have two shows whose
+# [start_time, end_time) intervals overlap. Bookings of one entity are kept
+# non-overlapping, so they are ordered by start and by end alike, and the only
+# booking that can clash with [start, end) is the last one starting before
+# `end`: the database check reads that single predecessor through the
+# (entity, start_time) index, one indexed lookup per entity however many shows
+# it accumulates, and on Postgres exclusion constraints from the scheduling
+# migration back it up against concurrent inserts. Requests don't keep
+# schedules in memory: every worker process would need its own copy, loaded
+# with all of an entity's shows and still confirmed against the database.
+# The in-memory Schedule and BookingIndex are for `flask import`, which
+# checks a whole file's shows against each other and the stored ones.
+
+KEYS = {'venue': Show.venue_id, 'artist': Show.artist_id}
+
+
+def duration(minutes):
+    return datetime.timedelta(minutes=minutes) if minutes else DEFAULT_SHOW_DURATION
+
+
+class Schedule:
+    # sorted, non-overlapping bookings of one venue or artist
+
+    def __init__(self, bookings=()):
+        bookings = sorted(bookings, key=lambda booking: booking[1])
+        self.ids = [booking[0] for booking in bookings]
+        self.starts = [booking[1] for booking in bookings]
+        self.ends = [booking[2] for booking in bookings]
+
+    def conflict(self, start, end):
+        i = bisect.bisect_left(self.starts, end)
+        if i and self.ends[i - 1] > start:
+            return self.ids[i - 1]
+        return None
+
+    def add(self, show_id, start, end):
+        i = bisect.bisect_right(self.starts, start)
+        self.ids.insert(i, show_id)
+        self.starts.insert(i, start)
+        self.ends.insert(i, end)
+
+
+class BookingIndex:
+    # Schedules loaded lazily from the database and bounded to the
+    # `max_entities` most recently used venues and artists (None for no bound)
+
+    def __init__(self, max_entities=1024):
+        self.max_entities = max_entities
+        self._schedules = OrderedDict()
+        self._lock = threading.Lock()
+
+    def schedule(self, kind, entity_id):
+        key = (kind, entity_id)
+        with self._lock:
+            schedule = self._schedules.get(key)
+            if schedule is not None:
+                self._schedules.move_to_end(key)
+                return schedule
+        bookings = db.session.query(Show.id, Show.start_time, Show.end_time).filter(KEYS[kind] == entity_id)
+        schedule = Schedule(bookings)
+        with self._lock:
+            self._schedules[key] = schedule
+            while self.max_entities is not None and len(self._schedules) > self.max_entities:
+                self._schedules.popitem(last=False)
+        return schedule
+
+    def conflict(self, kind, entity_id, start, end):
+        return self.schedule(kind, entity_id).conflict(start, end)
+
+    def add(self, show):
+        with self._lock:
+            for kind, entity_id in (('venue', show.venue_id), ('artist', show.artist_id)):
+                schedule = self._schedules.get((kind, entity_id))
+                if schedule is not None:
+                    schedule.add(show.id, show.start_time, show.end_time)
+
+    def discard(self, kind, entity_id):
+        with self._lock:
+            self._schedules.pop((kind, entity_id), None)
+
+    def clear(self):
+        with self._lock:
+            self._schedules.clear()
+
+
+def overlapping(kind, entity_id, start, end):
+    # the stored show of `entity_id` that overlaps [start, end), if any
+    column = KEYS[kind]
+    show = (Show.query.filter(column == entity_id, Show.start_time < end)
+            .order_by(Show.start_time.desc()).first())
+    if show is not None and show.end_time > start:
+        return show
+    return None
+
+
+def find_conflict(venue_id, artist_id, start, end):
+    # returns (kind, clashing Show) or None
+    for kind, entity_id in (('venue', venue_id), ('artist', artist_id)):
+        if entity_id is None:
+            continue
+        show = overlapping(kind, entity_id, start, end)
+        if show is not None:
+            return kind, show
+    return None
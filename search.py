@@ -0,0 +1,73 @@
+import re
+from flask_sqlalchemy import Pagination
+from models import Venue, Artist, db
+import genres
+
+# Venue and artist search over name, city and state. Postgres matches against
+# the indexed `search_vector` tsvector column (prefix matching, ranked with
+# ts_rank) plus a trigram-indexed ILIKE on the name for infix matches; SQLite
+# uses the FTS5 tables kept in step by triggers. Both are created by the
+# search index migration. Other databases fall back to unindexed ILIKE.
+
+FTS_TABLES = {Venue: 'venue_search', Artist: 'artist_search'}
+
+
+def _tokens(term):
+    return re.findall(r'\w+', term or '')
+
+
+def _like(term):
+    escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _postgres(model, term, tokens):
+    vector = db.literal_column(f'"{model.__tablename__}".search_vector')
+    tsquery = db.func.to_tsquery('simple', ' & '.join(token + ':*' for token in tokens))
+    return (model.query
+            .filter(db.or_(vector.op('@@')(tsquery), model.name.ilike(_like(term.strip()), escape='\\')))
+            .order_by(db.func.ts_rank(vector, tsquery).desc(), model.name, model.id))
+
+
+def _sqlite(model, tokens):
+    name = FTS_TABLES[model]
+    fts = db.table(name, db.column('rowid'), db.column('rank'))
+    match = ' '.join('"%s"*' % token for token in tokens)
+    return (model.query
+            .join(fts, fts.c.rowid == model.id)
+            .filter(db.text(f'{name} MATCH :match').bindparams(match=match))
+            .order_by(fts.c.rank, model.id))
+
+
+def _fallback(model, term):
+    like = _like(term.strip())
+    return (model.query
+            .filter(db.or_(model.name.ilike(like, escape='\\'),
+                           model.city.ilike(like, escape='\\'),
+                           model.state.ilike(like, escape='\\')))
+            .order_by(model.name, model.id))
+
+
+def search(model, term, page=1, per_page=20, genre_names=None):
+    # returns a flask_sqlalchemy Pagination of `model` rows ranked by relevance,
+    # restricted to entities with all of `genre_names`
+    query = search_query(model, term, genre_names)
+    page = max(page, 1)
+    total = query.order_by(None).count()
+    items = query.limit(per_page).offset((page - 1) * per_page).all()
+    return Pagination(query, page, per_page, total, items)
+
+
+def search_query(model, term, genre_names=None):
+    tokens = _tokens(term)
+    if not tokens:
+        query = model.query.order_by(model.name, model.id)
+    else:
+        dialect = db.engine.dialect.name
+        if dialect == 'postgresql':
+            query = _postgres(model, term, tokens)
+        elif dialect == 'sqlite':
+            query = _sqlite(model, tokens)
+        else:
+            query = _fallback(model, term)
+    return genres.filter_by_genres(query, model, genre_names)
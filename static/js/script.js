@@ -2,3 +2,73 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// Fills the datalist of inputs marked with data-autocomplete with matching
+// names; each option's value is the entity id the form expects.
+document.addEventListener('DOMContentLoaded', function () {
+  var inputs = document.querySelectorAll('input[data-autocomplete]');
+  Array.prototype.forEach.call(inputs, function (input) {
+    var list = document.getElementById(input.getAttribute('list'));
+    var pending = null;
+    input.addEventListener('input', function () {
+      var term = input.value;
+      if (!term || /^\d+$/.test(term)) {
+        return;
+      }
+      if (pending) {
+        pending.abort();
+      }
+      pending = new XMLHttpRequest();
+      pending.open('GET', input.getAttribute('data-autocomplete') + '?q=' + encodeURIComponent(term));
+      pending.onload = function () {
+        var data = JSON.parse(this.responseText).data;
+        list.innerHTML = '';
+        data.forEach(function (entity) {
+          var option = document.createElement('option');
+          option.value = entity.id;
+          option.label = entity.name;
+          option.textContent = entity.name;
+          list.appendChild(option);
+        });
+      };
+      pending.send();
+    });
+  });
+});
+
+// Fills sections marked with data-recommendations with the matches the JSON
+// API returns, as tiles linking to data-link + id. The matches change with
+// any venue or artist, so they aren't part of the cached page.
+document.addEventListener('DOMContentLoaded', function () {
+  var sections = document.querySelectorAll('section[data-recommendations]');
+  Array.prototype.forEach.call(sections, function (section) {
+    var request = new XMLHttpRequest();
+    request.open('GET', section.getAttribute('data-recommendations'));
+    request.onload = function () {
+      if (this.status !== 200) {
+        return;
+      }
+      var row = section.querySelector('.row');
+      JSON.parse(this.responseText).data.forEach(function (match) {
+        var column = document.createElement('div');
+        column.className = 'col-sm-4';
+        var tile = document.createElement('div');
+        tile.className = 'tile tile-show';
+        var image = document.createElement('img');
+        image.src = match.image_link || '';
+        image.alt = match.name;
+        var heading = document.createElement('h5');
+        var link = document.createElement('a');
+        link.href = section.getAttribute('data-link') + match.id;
+        link.textContent = match.name;
+        heading.appendChild(link);
+        tile.appendChild(image);
+        tile.appendChild(heading);
+        column.appendChild(tile);
+        row.appendChild(column);
+      });
+      section.hidden = !row.children.length;
+    };
+    request.send();
+  });
+});
@@ -0,0 +1,277 @@
+import json
+import sqlite3
+import threading
+import time
+import click
+from flask.cli import AppGroup
+from models import db
+
+# Background tasks for derived data the write handlers don't need to wait
+# for. A handler commits, then enqueues a named task with JSON arguments;
+# worker threads (TASKS_WORKERS of them, started by the first request) run
+# it in an app context and commit. The queue is a SQLite table -- in memory,
+# or in the TASKS_DATABASE file so tasks survive a restart and every worker
+# process shares them. Enqueueing a task whose name and arguments match one
+# still waiting coalesces into it, so a burst of writes to one venue refreshes
+# it once. Failures are retried TASKS_MAX_ATTEMPTS times with doubling
+# delays, then kept as failed; a task whose worker died is picked up again
+# after TASKS_LEASE_SECONDS. Tasks must be safe to run more than once.
+#
+# `flask tasks list` shows the queue, `flask tasks drain` runs what is due in
+# the CLI process and `flask tasks retry` requeues failed tasks.
+
+tasks_cli = AppGroup('tasks', help='Inspect and run the background task queue.')
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS tasks ('
+    'id INTEGER PRIMARY KEY, name TEXT NOT NULL, args TEXT NOT NULL, '
+    "state TEXT NOT NULL DEFAULT 'queued', attempts INTEGER NOT NULL DEFAULT 0, "
+    'run_at REAL NOT NULL, locked_until REAL, error TEXT, created_at REAL NOT NULL)',
+    # one waiting task per name and arguments, the coalescing target
+    "CREATE UNIQUE INDEX IF NOT EXISTS tasks_waiting ON tasks (name, args) WHERE state = 'queued'",
+    'CREATE INDEX IF NOT EXISTS tasks_state_run_at ON tasks (state, run_at)',
+]
+COLUMNS = 'id, name, args, state, attempts, run_at, locked_until, error, created_at'
+
+
+class Store:
+    # the tasks table behind one connection shared by the threads of a process
+
+    def __init__(self, path=None):
+        self.path = path or ':memory:'
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.row_factory = sqlite3.Row
+        if path:
+            self._connection.execute('PRAGMA journal_mode=WAL')
+        for statement in SCHEMA:
+            self._connection.execute(statement)
+
+    def _transaction(self, *statements):
+        # runs (sql, parameters) pairs in one write transaction and returns
+        # the last cursor
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                for sql, parameters in statements:
+                    cursor.execute(sql, parameters)
+                self._connection.commit()
+            except BaseException:
+                self._connection.rollback()
+                raise
+            return cursor
+
+    def put(self, name, args, run_at):
+        now = time.time()
+        self._transaction((
+            'INSERT INTO tasks (name, args, run_at, created_at) VALUES (?, ?, ?, ?) '
+            "ON CONFLICT (name, args) WHERE state = 'queued' DO UPDATE SET run_at = min(run_at, excluded.run_at)",
+            (name, args, run_at, now)))
+
+    def claim(self, now, lease):
+        # the next due task, marked running until now + lease, or None; a
+        # running task whose lease ran out is due again
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                row = cursor.execute(
+                    f'SELECT {COLUMNS} FROM tasks WHERE (state = ? AND run_at <= ?) '
+                    'OR (state = ? AND locked_until <= ?) ORDER BY run_at, id LIMIT 1',
+                    ('queued', now, 'running', now)).fetchone()
+                if row is not None:
+                    cursor.execute(
+                        "UPDATE tasks SET state = 'running', attempts = attempts + 1, locked_until = ? WHERE id = ?",
+                        (now + lease, row['id']))
+                self._connection.commit()
+            except BaseException:
+                self._connection.rollback()
+                raise
+        if row is None:
+            return None
+        task = dict(row)
+        task['attempts'] += 1
+        return task
+
+    def done(self, task_id):
+        self._transaction(('DELETE FROM tasks WHERE id = ?', (task_id,)))
+
+    def retry(self, task, error, run_at):
+        # back to the queue, unless an identical task was queued meanwhile;
+        # that one does the work instead
+        self._transaction(
+            ("DELETE FROM tasks WHERE id = ? AND EXISTS (SELECT 1 FROM tasks WHERE name = ? AND args = ? "
+             "AND state = 'queued')", (task['id'], task['name'], task['args'])),
+            ("UPDATE tasks SET state = 'queued', run_at = ?, locked_until = NULL, error = ? WHERE id = ?",
+             (run_at, error, task['id'])))
+
+    def fail(self, task, error):
+        # keeps one failed task per name and arguments, the latest
+        self._transaction(
+            ("DELETE FROM tasks WHERE name = ? AND args = ? AND state = 'failed'", (task['name'], task['args'])),
+            ("UPDATE tasks SET state = 'failed', locked_until = NULL, error = ? WHERE id = ?",
+             (error, task['id'])))
+
+    def requeue(self, task_ids=None):
+        # failed tasks back to the queue as new, all of them without ids
+        failed = "state = 'failed'"
+        if task_ids:
+            failed += f' AND id IN ({", ".join("?" * len(task_ids))})'
+        cursor = self._transaction(
+            (f"DELETE FROM tasks WHERE {failed} AND EXISTS (SELECT 1 FROM tasks AS waiting "
+             "WHERE waiting.name = tasks.name AND waiting.args = tasks.args AND waiting.state = 'queued')",
+             list(task_ids or ())),
+            (f"UPDATE tasks SET state = 'queued', attempts = 0, run_at = ?, error = NULL WHERE {failed}",
+             [time.time()] + list(task_ids or ())))
+        return cursor.rowcount
+
+    def rows(self, state=None):
+        with self._lock:
+            if state is None:
+                return self._connection.execute(f'SELECT {COLUMNS} FROM tasks ORDER BY id').fetchall()
+            return self._connection.execute(f'SELECT {COLUMNS} FROM tasks WHERE state = ? ORDER BY id',
+                                            (state,)).fetchall()
+
+    def counts(self):
+        with self._lock:
+            return dict(self._connection.execute('SELECT state, count(*) FROM tasks GROUP BY state'))
+
+
+class TaskQueue:
+
+    def __init__(self):
+        self.handlers = {}
+        self.app = None
+        self.store = None
+        self.workers = 2
+        self.max_attempts = 5
+        self.retry_seconds = 2.0
+        self.lease_seconds = 300
+        self.poll_seconds = 1.0
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._ready = threading.Condition()
+
+    def init_app(self, app):
+        self.app = app
+        self.store = Store(app.config.get('TASKS_DATABASE'))
+        self.workers = app.config.get('TASKS_WORKERS', self.workers)
+        self.max_attempts = app.config.get('TASKS_MAX_ATTEMPTS', self.max_attempts)
+        self.retry_seconds = app.config.get('TASKS_RETRY_SECONDS', self.retry_seconds)
+        self.lease_seconds = app.config.get('TASKS_LEASE_SECONDS', self.lease_seconds)
+        self.poll_seconds = app.config.get('TASKS_POLL_SECONDS', self.poll_seconds)
+        # workers start with the first request, so CLI commands never run
+        # tasks behind the user's back and forked server workers get their own
+        app.before_request(self.start)
+
+    def task(self, name):
+        # registers the decorated function as the handler of `name`
+        def decorator(func):
+            self.handlers[name] = func
+            return func
+        return decorator
+
+    def enqueue(self, name, delay=0, **args):
+        # call after commit, so the task sees what the handler wrote
+        if name not in self.handlers:
+            raise KeyError(f'No task named {name!r}')
+        self.store.put(name, json.dumps(args, sort_keys=True), time.time() + delay)
+        with self._ready:
+            self._ready.notify()
+
+    def start(self):
+        if len(self._threads) >= self.workers:
+            return
+        with self._start_lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f'tasks-{len(self._threads)}', daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def _work(self):
+        while True:
+            try:
+                ran = self.run_next()
+            except Exception:
+                # e.g. the queue file stayed locked past its timeout
+                self.app.logger.exception('Task worker error')
+                ran = False
+            if not ran:
+                with self._ready:
+                    self._ready.wait(self.poll_seconds)
+
+    def run_next(self):
+        # runs one due task; False when there was none
+        task = self.store.claim(time.time(), self.lease_seconds)
+        if task is None:
+            return False
+        self.run(task)
+        return True
+
+    def run(self, task):
+        handler = self.handlers.get(task['name'])
+        if handler is None:
+            self.store.fail(task, f'No task named {task["name"]!r}')
+            return
+        with self.app.app_context():
+            try:
+                handler(**json.loads(task['args']))
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                error = f'{type(e).__name__}: {e}'
+                if task['attempts'] >= self.max_attempts:
+                    self.app.logger.exception(f'Task {task["name"]} {task["args"]} failed for good')
+                    self.store.fail(task, error)
+                else:
+                    self.app.logger.warning(f'Task {task["name"]} {task["args"]} failed, '
+                                            f'attempt {task["attempts"]}: {error}')
+                    delay = self.retry_seconds * 2 ** (task['attempts'] - 1)
+                    self.store.retry(task, error, time.time() + delay)
+                return
+        self.store.done(task['id'])
+
+
+task_queue = TaskQueue()
+
+
+@tasks_cli.command('list')
+@click.option('--state', type=click.Choice(['queued', 'running', 'failed']), help='Only tasks in this state.')
+def list_tasks(state):
+    """Show the tasks in the queue."""
+    now = time.time()
+    for row in task_queue.store.rows(state):
+        due = 'due' if row['run_at'] <= now else f'in {row["run_at"] - now:.0f}s'
+        line = f'{row["id"]:>6} {row["state"]:<8} {row["name"]} {row["args"]} attempts {row["attempts"]}, {due}'
+        if row['error']:
+            line += f' ({row["error"]})'
+        click.echo(line)
+    counts = task_queue.store.counts()
+    click.echo(', '.join(f'{counts.get(name, 0)} {name}' for name in ('queued', 'running', 'failed')))
+
+
+@tasks_cli.command('drain')
+@click.option('--wait', is_flag=True, help='Also wait for retries that are not due yet.')
+def drain(wait):
+    """Run queued tasks in this process until none are due."""
+    ran = 0
+    while True:
+        if task_queue.run_next():
+            ran += 1
+            continue
+        waiting = task_queue.store.rows('queued')
+        if not wait or not waiting:
+            break
+        time.sleep(max(min(row['run_at'] for row in waiting) - time.time(), 0) + 0.01)
+    counts = task_queue.store.counts()
+    click.echo(f'Ran {ran} tasks, {counts.get("queued", 0)} queued, {counts.get("failed", 0)} failed.')
+    if counts.get('failed'):
+        raise SystemExit(1)
+
+
+@tasks_cli.command('retry')
+@click.argument('task_ids', nargs=-1, type=int)
+def retry(task_ids):
+    """Queue failed tasks again, all of them unless ids are given."""
+    click.echo(f'Requeued {task_queue.store.requeue(task_ids)} tasks.')
@@ -0,0 +1,109 @@
+import itertools
+import os
+import sys
+import pytest
+
+# Every test gets its own SQLite file with the full schema, built the way
+# benchmarks.harness builds its database: tables (and the ShowListing
+# triggers) from the models, search tables from the search migration. The
+# SQL profiler reports X-SQL-Queries, so tests can count a request's
+# statements, and query budgets raise because the app is testing. The
+# response cache is off unless a test turns it on, and background tasks only
+# run when a test calls drain().
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# read by config.py when the app is imported
+os.environ.update({
+    'DATABASE_URL': 'sqlite://',
+    'DATABASE_REPLICA_URLS': '',
+    'SQL_PROFILE': 'header',
+    'CACHE_TYPE': 'null',
+    'TASKS_WORKERS': '0',
+    'DATA_GENERATION_FILE': '',
+})
+
+from app import app as flask_app  # noqa: E402
+from benchmarks import datagen  # noqa: E402
+from benchmarks.harness import create_schema  # noqa: E402
+from models import db  # noqa: E402
+import feed  # noqa: E402
+import recommend  # noqa: E402
+import tasks  # noqa: E402
+import typeahead  # noqa: E402
+
+
+def use_database(app, path):
+    # points the app at a new SQLite file and forgets the in-process
+    # structures built from the previous one
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{path}'
+    with app.app_context():
+        create_schema(db)
+    recommend.recommender.invalidate()
+    feed.home_feed.invalidate()
+    typeahead.venues.loaded = typeahead.artists.loaded = False
+    tasks.task_queue.store = tasks.Store()
+
+
+def queries(response):
+    return int(response.headers['X-SQL-Queries'])
+
+
+def drain():
+    # runs every due background task, returns how many ran
+    ran = 0
+    while tasks.task_queue.run_next():
+        ran += 1
+    return ran
+
+
+def create_venue(client, name, **fields):
+    form = {'name': name, 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+            'image_link': 'http://example.com/venue.jpg', 'genres': ['Jazz'], 'seeking_talent': 'y', **fields}
+    return client.post('/venues/create', data=form)
+
+
+def create_artist(client, name, **fields):
+    form = {'name': name, 'city': 'Austin', 'state': 'TX', 'image_link': 'http://example.com/artist.jpg',
+            'genres': ['Jazz'], 'seeking_venue': 'y', **fields}
+    return client.post('/artists/create', data=form)
+
+
+def create_show(client, venue_id, artist_id, start_time, duration=None):
+    form = {'venue_id': str(venue_id), 'artist_id': str(artist_id), 'start_time': start_time}
+    if duration is not None:
+        form['duration'] = str(duration)
+    return client.post('/shows/create', data=form, follow_redirects=True)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # create_schema() finds the search migration relative to the repository
+    monkeypatch.chdir(ROOT)
+    flask_app.config.update(TESTING=True, WTF_CSRF_ENABLED=False)
+    use_database(flask_app, tmp_path / 'fyyur.db')
+    yield flask_app
+    with flask_app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def load(app, tmp_path):
+    # load(shows) moves the app to a new database holding `shows` generated
+    # shows (benchmarks.datagen) and returns the venue, artist and show counts
+    databases = itertools.count(1)
+
+    def load(shows, seed=0):
+        use_database(app, tmp_path / f'fyyur-{next(databases)}.db')
+        with app.app_context():
+            return datagen.load(*datagen.generate(shows, seed))
+    return load
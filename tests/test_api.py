@@ -0,0 +1,63 @@
+import json
+from conftest import create_artist, create_show, create_venue
+
+
+def listed(client):
+    create_venue(client, 'Blue Hall', genres=['Jazz', 'Blues'])
+    create_venue(client, 'Red Hall')
+    create_artist(client, 'Alpha Trio')
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+
+
+def ndjson(response):
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.is_streamed
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_lists_stream_ndjson_by_default(client):
+    listed(client)
+    venues = ndjson(client.get('/api/venues'))
+    assert [venue['name'] for venue in venues] == ['Blue Hall', 'Red Hall']
+    assert venues[0]['genres'] == ['Blues', 'Jazz']
+    assert venues[0]['state'] == 'TX' and 'seeking_description' in venues[0]
+    shows = ndjson(client.get('/api/shows'))
+    assert [(show['venue_id'], show['artist_id'], show['start_time']) for show in shows] == [
+        (1, 1, '2099-05-01T20:00:00')]
+
+
+def test_lists_stream_a_json_array_on_request(client):
+    listed(client)
+    response = client.get('/api/artists?format=json')
+    assert response.mimetype == 'application/json'
+    assert [artist['name'] for artist in response.get_json()] == ['Alpha Trio']
+    assert client.get('/api/shows?format=json&fields=id').get_json() == [{'id': 1}]
+
+
+def test_fields_pick_the_columns(client):
+    listed(client)
+    assert ndjson(client.get('/api/venues?fields=name,city')) == [
+        {'name': 'Blue Hall', 'city': 'Austin'}, {'name': 'Red Hall', 'city': 'Austin'}]
+    # genres come with the id they were looked up by
+    assert ndjson(client.get('/api/venues?fields=genres')) == [
+        {'id': 1, 'genres': ['Blues', 'Jazz']}, {'id': 2, 'genres': ['Jazz']}]
+    assert client.get('/api/venues/1?fields=name').get_json() == {'name': 'Blue Hall'}
+
+
+def test_unknown_fields_are_rejected(client):
+    listed(client)
+    for path in ('/api/venues?fields=name,password', '/api/shows?fields=genres', '/api/artists/1?fields=x'):
+        response = client.get(path)
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Bad Request'
+
+
+def test_detail_returns_one_record(client):
+    listed(client)
+    venue = client.get('/api/venues/1').get_json()
+    assert (venue['id'], venue['name'], venue['genres']) == (1, 'Blue Hall', ['Blues', 'Jazz'])
+    assert client.get('/api/shows/1').get_json()['end_time'] == '2099-05-01T22:00:00'
+    response = client.get('/api/artists/9')
+    assert response.status_code == 404
+    assert response.get_json() == {'error': 'Not Found', 'message': 'No artist with id 9'}
@@ -0,0 +1,94 @@
+import asyncio
+import urllib.parse
+import pytest
+from werkzeug.datastructures import Headers
+from conftest import create_artist, create_show, create_venue, queries
+
+pytest.importorskip('asgiref')
+pytest.importorskip('aiosqlite')
+from sqlalchemy.ext.asyncio import create_async_engine  # noqa: E402
+from sqlalchemy.pool import NullPool  # noqa: E402
+import asgi  # noqa: E402
+
+
+class Response:
+
+    def __init__(self, messages):
+        start = messages[0]
+        self.status_code = start['status']
+        self.headers = Headers([(name.decode('latin1'), value.decode('latin1')) for name, value in start['headers']])
+        self.data = b''.join(message.get('body', b'') for message in messages[1:])
+
+
+def call(method, path, headers=(), form=None):
+    # drives asgi.application with one HTTP request
+    path, _, query = path.partition('?')
+    body = urllib.parse.urlencode(form or {}, doseq=True).encode()
+    headers = list(headers)
+    if form is not None:
+        headers.append(('Content-Type', 'application/x-www-form-urlencoded'))
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': query.encode(),
+             'http_version': '1.1', 'server': ('localhost', 80), 'scheme': 'http',
+             'headers': [(name.lower().encode(), value.encode()) for name, value in headers]}
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+
+    asyncio.run(asgi.application(scope, receive, send))
+    return Response(messages)
+
+
+@pytest.fixture
+def served(app, monkeypatch):
+    # points the async views at the test database; every call gets a new
+    # event loop, so connections aren't pooled across them
+    engine = create_async_engine(asgi.async_url(app.config['SQLALCHEMY_DATABASE_URI']), poolclass=NullPool)
+    monkeypatch.setattr(asgi, 'engine', engine)
+    monkeypatch.setattr(asgi, 'engines', {None: engine})
+    monkeypatch.setattr(asgi, 'replicas', [])
+    yield
+    asyncio.run(engine.dispose())
+
+
+def booked(client):
+    create_venue(client, 'Blue Hall')
+    create_artist(client, 'Alpha Trio')
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    create_show(client, 1, 1, '2001-05-01 20:00:00')
+
+
+def test_listings_are_served_async(client, served):
+    booked(client)
+    assert b'Blue Hall' in call('GET', '/venues').data
+    assert b'Alpha Trio' in call('GET', '/artists').data
+
+
+def test_detail_pages_stay_within_their_budget(client, served):
+    booked(client)
+    for path, other in (('/venues/1', b'Alpha Trio'), ('/artists/1', b'Blue Hall')):
+        response = call('GET', path)
+        assert response.status_code == 200
+        assert response.data.count(other) >= 2
+        assert queries(response) == 4
+    assert call('GET', '/venues/99').status_code == 404
+
+
+def test_unchanged_detail_page_answers_304(client, served):
+    booked(client)
+    etag = call('GET', '/venues/1').headers['ETag']
+    assert call('GET', '/venues/1', [('If-None-Match', etag)]).status_code == 304
+
+
+def test_search_is_served_async(client, served):
+    booked(client)
+    response = call('POST', '/venues/search', form={'search_term': 'blue'})
+    assert response.status_code == 200
+    assert b'Blue Hall' in response.data
+
+
+def test_other_routes_go_to_wsgi(client, served):
+    assert call('GET', '/shows/create').status_code == 200
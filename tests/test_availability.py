@@ -0,0 +1,69 @@
+import datetime
+from conftest import create_artist, create_show, create_venue
+import availability
+
+
+def at(day, hour, minute=0):
+    # pytz knows no DST rules past 2037, so the Chicago cases stay before it
+    return datetime.datetime(2030, 5, day, hour, minute)
+
+
+def test_merge_coalesces_overlapping_and_touching_intervals():
+    assert availability.merge([(at(3, 10), at(3, 12)), (at(3, 11), at(3, 13)), (at(3, 13), at(3, 14)),
+                               (at(3, 16), at(3, 17))]) == [(at(3, 10), at(3, 14)), (at(3, 16), at(3, 17))]
+
+
+def test_subtract_leaves_the_gaps():
+    windows = [(at(3, 10), at(3, 20)), (at(4, 10), at(4, 20))]
+    busy = [(at(3, 9), at(3, 11)), (at(3, 14), at(3, 15)), (at(4, 19), at(5, 1))]
+    assert availability.subtract(windows, busy) == [
+        (at(3, 11), at(3, 14)), (at(3, 15), at(3, 20)), (at(4, 10), at(4, 19))]
+    assert availability.subtract(windows, busy, min_length=datetime.timedelta(hours=4)) == [
+        (at(3, 15), at(3, 20)), (at(4, 10), at(4, 19))]
+
+
+def test_windows_pick_weekday_hours_and_run_past_midnight():
+    # 2030-05-03 is a Friday
+    assert availability.windows(at(3, 0), at(6, 0), {4}, datetime.time(18), datetime.time(23)) == [
+        (at(3, 18), at(3, 23))]
+    assert availability.windows(at(3, 0), at(5, 0), {4, 5}, datetime.time(22), datetime.time(2)) == [
+        (at(3, 22), at(4, 2)), (at(4, 22), at(5, 0))]
+
+
+def test_windows_in_a_timezone_come_back_in_utc():
+    chicago = availability.timezone_for('America/Chicago')
+    # Friday 18:00-23:00 in Chicago is 23:00-04:00 UTC in May (CDT)
+    assert availability.windows(at(3, 0), at(6, 0), {4}, datetime.time(18), datetime.time(23), chicago) == [
+        (at(3, 23), at(4, 4))]
+
+
+def book(client):
+    create_venue(client, 'Hall')
+    create_artist(client, 'Alpha')
+    # Friday 20:00-22:00 in Chicago
+    create_show(client, 1, 1, '2030-05-04 01:00:00', duration=120)
+
+
+def free(response):
+    assert response.status_code == 200
+    return [(slot['start'], slot['end']) for slot in response.get_json()['data'][0]['free']]
+
+
+def test_availability_subtracts_shows_in_the_requested_timezone(client):
+    book(client)
+    response = client.get('/api/venues/availability?start=2030-05-03&end=2030-05-04&days=fri'
+                          '&from=18:00&to=23:00&tz=America/Chicago')
+    assert free(response) == [('2030-05-03T23:00:00', '2030-05-04T01:00:00'),
+                              ('2030-05-04T03:00:00', '2030-05-04T04:00:00')]
+
+
+def test_availability_takes_offsets_as_given(client):
+    book(client)
+    response = client.get('/api/venues/availability?start=2030-05-03T20:00:00-05:00'
+                          '&end=2030-05-04T00:00:00-05:00')
+    assert free(response) == [('2030-05-04T03:00:00', '2030-05-04T05:00:00')]
+
+
+def test_availability_rejects_bad_arguments(client):
+    for query in ('start=tomorrow', 'tz=Nowhere/Else', 'start=2030-05-04&end=2030-05-03', 'days=someday'):
+        assert client.get(f'/api/venues/availability?{query}').status_code == 400
@@ -0,0 +1,107 @@
+import time
+import pytest
+from conftest import create_artist, create_show, create_venue
+from cache import LRUBackend, cache
+from database import STICKY_KEY, pinned_to_primary
+from generation import data_generation
+from models import Artist, Venue, db
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    # turns the response cache on with a fresh LRU
+    monkeypatch.setattr(cache, 'backend', LRUBackend(64))
+    monkeypatch.setattr(cache, 'derived', LRUBackend(64))
+    monkeypatch.setattr(cache, 'hits', 0)
+    monkeypatch.setattr(cache, 'misses', 0)
+    return cache
+
+
+def listed(client):
+    # a venue and an artist, with the create pages' flashes shown, since a
+    # pending flash bypasses the cache
+    create_venue(client, 'Blue Hall')
+    create_artist(client, 'Alpha Trio')
+    client.get('/')
+
+
+def rename(app, model, entity_id, name):
+    with app.app_context():
+        model.query.get(entity_id).name = name
+        db.session.commit()
+
+
+def test_second_get_is_a_hit(client, cached):
+    listed(client)
+    first = client.get('/venues/1')
+    hits = cached.hits
+    second = client.get('/venues/1')
+    assert cached.hits == hits + 1
+    assert second.status_code == 200
+    assert second.data == first.data
+
+
+def test_venue_write_invalidates_its_pages(app, client, cached):
+    listed(client)
+    for path in ('/venues/1', '/venues'):
+        client.get(path)
+    rename(app, Venue, 1, 'Red Hall')
+    misses = cached.misses
+    for path in ('/venues/1', '/venues'):
+        assert b'Red Hall' in client.get(path).data
+    assert cached.misses == misses + 2
+
+
+def test_artist_write_invalidates_its_pages(app, client, cached):
+    listed(client)
+    for path in ('/artists/1', '/artists'):
+        client.get(path)
+    rename(app, Artist, 1, 'Beta Trio')
+    misses = cached.misses
+    for path in ('/artists/1', '/artists'):
+        assert b'Beta Trio' in client.get(path).data
+    assert cached.misses == misses + 2
+
+
+def test_show_write_invalidates_both_detail_pages(client, cached):
+    listed(client)
+    assert b'Alpha Trio' not in client.get('/venues/1').data
+    assert b'Blue Hall' not in client.get('/artists/1').data
+    assert b'Alpha Trio' not in client.get('/shows').data
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    misses = cached.misses
+    assert b'Alpha Trio' in client.get('/venues/1').data
+    assert b'Blue Hall' in client.get('/artists/1').data
+    assert b'Alpha Trio' in client.get('/shows').data
+    assert cached.misses == misses + 3
+
+
+def test_generation_bump_invalidates_every_page(client, cached):
+    # what another process' import does to this worker's entries
+    listed(client)
+    for path in ('/venues/1', '/artists'):
+        client.get(path)
+    data_generation.bump()
+    misses = cached.misses
+    for path in ('/venues/1', '/artists'):
+        client.get(path)
+    assert cached.misses == misses + 2
+
+
+def test_client_pinned_to_primary_bypasses_the_cache(app, client, cached, monkeypatch):
+    listed(client)
+    client.get('/venues/1')
+    monkeypatch.setitem(app.config, 'REPLICA_BINDS', ['replica0'])
+    client.set_cookie('localhost', STICKY_KEY, str(time.time() + 60))
+    hits, misses, entries = cached.hits, cached.misses, len(cached.backend)
+    for _ in range(2):
+        assert client.get('/venues/1').status_code == 200
+    assert (cached.hits, cached.misses, len(cached.backend)) == (hits, misses, entries)
+
+
+def test_a_write_pins_the_client_to_the_primary(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'REPLICA_BINDS', ['replica0'])
+    cookies = create_venue(client, 'Blue Hall').headers.getlist('Set-Cookie')
+    cookie = next(cookie for cookie in cookies if cookie.startswith(f'{STICKY_KEY}='))
+    with app.test_request_context(headers={'Cookie': cookie.split(';')[0]}):
+        assert pinned_to_primary()
@@ -0,0 +1,55 @@
+import datetime
+import time
+from conftest import create_artist, create_show, create_venue
+from models import Show, Venue, db
+
+
+def revalidate(client, path, response):
+    # (status with If-None-Match, status with If-Modified-Since) against an
+    # earlier response
+    etag = client.get(path, headers={'If-None-Match': response.headers['ETag']}).status_code
+    since = client.get(path, headers={'If-Modified-Since': response.headers['Last-Modified']}).status_code
+    return etag, since
+
+
+def test_unchanged_pages_answer_304(client):
+    create_venue(client, 'Hall')
+    create_artist(client, 'Alpha')
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    for path in ('/venues', '/artists', '/shows', '/venues/1', '/artists/1'):
+        response = client.get(path)
+        assert response.status_code == 200
+        assert revalidate(client, path, response) == (304, 304)
+
+
+def test_home_page_has_no_last_modified(client):
+    response = client.get('/')
+    assert 'Last-Modified' not in response.headers
+    assert client.get('/', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+
+
+def test_deletions_move_last_modified(app, client):
+    create_venue(client, 'Hall')
+    create_venue(client, 'Room')
+    create_artist(client, 'Alpha')
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    listing, detail = client.get('/venues'), client.get('/artists/1')
+    # Last-Modified has a one second resolution
+    time.sleep(1.1)
+    with app.app_context():
+        db.session.delete(Venue.query.get(2))
+        Show.query.filter(Show.id == 1).delete()
+        db.session.commit()
+    assert revalidate(client, '/venues', listing) == (200, 200)
+    assert revalidate(client, '/artists/1', detail) == (200, 200)
+
+
+def test_show_starting_moves_last_modified(client):
+    create_venue(client, 'Hall')
+    create_artist(client, 'Alpha')
+    start = datetime.datetime.utcnow().replace(microsecond=0) + datetime.timedelta(seconds=2)
+    create_show(client, 1, 1, start.strftime('%Y-%m-%d %H:%M:%S'))
+    response = client.get('/venues/1')
+    while datetime.datetime.utcnow() <= start:
+        time.sleep(0.1)
+    assert revalidate(client, '/venues/1', response) == (200, 200)
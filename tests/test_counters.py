@@ -0,0 +1,59 @@
+from conftest import create_artist, create_show, create_venue, drain
+from models import Venue, Artist, db
+import counters
+
+
+def stored(app, model, entity_id):
+    with app.app_context():
+        entity = model.query.get(entity_id)
+        return entity.upcoming_shows_count, entity.past_shows_count
+
+
+def out_of_date(app):
+    with app.app_context():
+        return [row for model in (Venue, Artist) for row in counters.mismatches(model)]
+
+
+def test_generated_data_has_exact_counters(app, load):
+    load(1000)
+    assert out_of_date(app) == []
+
+
+def test_creating_shows_updates_counters(app, client):
+    create_venue(client, 'Hall')
+    create_artist(client, 'Alpha')
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    create_show(client, 1, 1, '2001-05-01 20:00:00')
+    drain()
+    assert stored(app, Venue, 1) == (1, 1)
+    assert stored(app, Artist, 1) == (1, 1)
+    assert out_of_date(app) == []
+
+
+def test_deleting_a_venue_refreshes_its_artists(app, client):
+    create_venue(client, 'Hall')
+    create_venue(client, 'Room')
+    create_artist(client, 'Alpha')
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    create_show(client, 2, 1, '2099-06-01 20:00:00')
+    drain()
+    assert client.delete('/venues/1').get_json() == {'success': True}
+    drain()
+    assert stored(app, Artist, 1) == (1, 0)
+    assert out_of_date(app) == []
+
+
+def test_check_command_reports_and_fixes(app, client):
+    create_venue(client, 'Hall')
+    create_artist(client, 'Alpha')
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    drain()
+    with app.app_context():
+        Venue.query.filter(Venue.id == 1).update({'upcoming_shows_count': 7})
+        db.session.commit()
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['counters', 'check'])
+    assert result.exit_code == 1
+    assert 'Venue 1: stored 7/0, actual 1/0' in result.output
+    assert runner.invoke(args=['counters', 'check', '--fix']).exit_code == 0
+    assert stored(app, Venue, 1) == (1, 0)
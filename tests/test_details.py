@@ -0,0 +1,35 @@
+import re
+from conftest import queries
+from models import Show, db
+
+
+def busiest(app, column):
+    with app.app_context():
+        return (db.session.query(column).group_by(column)
+                .order_by(db.func.count(Show.id).desc(), column).first()[0])
+
+
+def test_detail_queries_do_not_grow_with_shows(app, client, load):
+    counts = {}
+    for shows in (200, 2000):
+        load(shows)
+        for kind, column in (('venues', Show.venue_id), ('artists', Show.artist_id)):
+            response = client.get(f'/{kind}/{busiest(app, column)}')
+            assert response.status_code == 200
+            counts[shows, kind] = queries(response)
+    assert counts[200, 'venues'] == counts[2000, 'venues']
+    assert counts[200, 'artists'] == counts[2000, 'artists']
+
+
+def test_venue_page_lists_its_shows(app, client, load):
+    load(2000)
+    venue_id = busiest(app, Show.venue_id)
+    with app.app_context():
+        artist_ids = {row[0] for row in db.session.query(Show.artist_id).filter(Show.venue_id == venue_id)}
+    page = client.get(f'/venues/{venue_id}').get_data(as_text=True)
+    shown = set(map(int, re.findall(r'<h5><a href="/artists/(\d+)">', page)))
+    assert artist_ids <= shown
+
+
+def test_missing_venue_is_404(client):
+    assert client.get('/venues/12345').status_code == 404
@@ -0,0 +1,64 @@
+import csv
+import datetime
+import json
+from conftest import create_artist, create_venue
+from exporter import run_export
+from models import Venue, db
+
+
+def export(app, tmp_path, fmt='ndjson', incremental=False):
+    # the exported records
+    out = tmp_path / f'venues.{fmt}'
+    with app.app_context():
+        run_export(Venue, str(out), fmt, 2, incremental, None)
+    with open(out, encoding='utf-8', newline='') as f:
+        if fmt == 'csv':
+            return list(csv.DictReader(f))
+        return [json.loads(line) for line in f]
+
+
+def listed(client):
+    for name in ('Blue Hall', 'Red Hall', 'Green Room'):
+        create_venue(client, name)
+    create_artist(client, 'Alpha Trio')
+
+
+def test_full_export_writes_every_row(app, client, tmp_path):
+    listed(client)
+    records = export(app, tmp_path)
+    assert [record['name'] for record in records] == ['Blue Hall', 'Red Hall', 'Green Room']
+    assert records[0]['genres'] == ['Jazz']
+    assert 'deleted' not in records[0]
+    rows = export(app, tmp_path, 'csv')
+    assert [row['name'] for row in rows] == ['Blue Hall', 'Red Hall', 'Green Room']
+    assert rows[0]['genres'] == 'Jazz'
+
+
+def test_incremental_export_writes_changes_and_tombstones(app, client, tmp_path):
+    listed(client)
+    first = export(app, tmp_path, incremental=True)
+    assert [(record['id'], record['deleted']) for record in first] == [(1, False), (2, False), (3, False)]
+    # rows read again within the overlap are not written twice
+    assert export(app, tmp_path, incremental=True) == []
+    with app.app_context():
+        Venue.query.get(1).name = 'Blue Hall B'
+        db.session.delete(Venue.query.get(2))
+        db.session.commit()
+    records = export(app, tmp_path, incremental=True)
+    assert [(record['id'], record['name'], record['deleted']) for record in records] == [
+        (1, 'Blue Hall B', False), (2, None, True)]
+    assert export(app, tmp_path, incremental=True) == []
+
+
+def test_incremental_export_picks_up_rows_stamped_before_the_watermark(app, client, tmp_path):
+    listed(client)
+    export(app, tmp_path, incremental=True)
+    with open(tmp_path / 'venues.ndjson.watermark', encoding='utf-8') as f:
+        watermark = datetime.datetime.fromisoformat(json.load(f)['watermark'])
+    # a transaction that stamped its row before the last export read, and
+    # committed after it
+    with app.app_context():
+        db.session.execute(db.update(Venue).where(Venue.id == 3)
+                           .values(name='Green Room B', updated_at=watermark - datetime.timedelta(seconds=10)))
+        db.session.commit()
+    assert [record['name'] for record in export(app, tmp_path, incremental=True)] == ['Green Room B']
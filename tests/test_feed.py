@@ -0,0 +1,70 @@
+from conftest import create_artist, create_show, create_venue, queries
+from generation import data_generation
+from models import Venue, db
+import feed
+
+
+def names(kind):
+    return [entry['name'] for entry in feed.home_feed.recent(kind)]
+
+
+def test_feed_lists_the_newest_first_and_stays_bounded(app, client, monkeypatch):
+    monkeypatch.setattr(feed.home_feed, 'size', 3)
+    feed.home_feed.invalidate()
+    for i in range(5):
+        create_venue(client, f'Hall {i}')
+    with app.app_context():
+        assert names('venues') == ['Hall 4', 'Hall 3', 'Hall 2']
+        first, second = feed.home_feed.recent('venues')[1:]
+        assert first['date_created'] >= second['date_created']
+    feed.home_feed.invalidate()
+    with app.app_context():
+        assert names('venues') == ['Hall 4', 'Hall 3', 'Hall 2']
+
+
+def test_home_page_reads_no_rows(client):
+    create_venue(client, 'Blue Hall')
+    create_artist(client, 'Alpha Trio')
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    client.get('/')
+    response = client.get('/')
+    page = response.get_data(as_text=True)
+    assert 'Blue Hall' in page and 'Alpha Trio' in page
+    assert '/artists/1' in page and '/venues/1' in page
+    assert queries(response) == 0
+
+
+def test_renames_reach_the_feed_and_its_shows(app, client):
+    create_venue(client, 'Blue Hall')
+    create_artist(client, 'Alpha Trio')
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    with app.app_context():
+        feed.home_feed.load()
+        Venue.query.get(1).name = 'Red Hall'
+        db.session.commit()
+        assert names('venues') == ['Red Hall']
+        assert [entry['venue_name'] for entry in feed.home_feed.recent('shows')] == ['Red Hall']
+
+
+def test_deletes_refill_the_feed(app, client):
+    create_venue(client, 'Blue Hall')
+    create_venue(client, 'Red Hall')
+    create_artist(client, 'Alpha Trio')
+    create_show(client, 2, 1, '2099-05-01 20:00:00')
+    client.get('/')
+    client.delete('/venues/2')
+    with app.app_context():
+        assert names('venues') == ['Blue Hall']
+        assert feed.home_feed.recent('shows') == []
+
+
+def test_generation_move_reloads_the_feed(app, client):
+    create_venue(client, 'Blue Hall')
+    client.get('/')
+    # as the importer would, unseen by this process' session events
+    with app.app_context():
+        db.session.execute(Venue.__table__.insert().values(name='Red Hall'))
+        db.session.commit()
+        assert names('venues') == ['Blue Hall']
+        data_generation.bump()
+        assert names('venues') == ['Red Hall', 'Blue Hall']
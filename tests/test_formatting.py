@@ -0,0 +1,56 @@
+import datetime
+import babel.dates
+import pytest
+from conftest import create_artist, create_show, create_venue
+import formatting
+
+TIMES = [datetime.datetime(2030, month, day, hour, minute)
+         for month, day, hour, minute in ((1, 1, 0, 0), (5, 3, 12, 5), (7, 14, 23, 59), (12, 31, 9, 30))]
+
+
+@pytest.mark.parametrize('locale', ['en', 'fr', 'de', 'es'])
+@pytest.mark.parametrize('pattern', ['full', 'medium', 'yy-M-d H:mm:ss', 'EEEEE LLLL MMMMM', 'QQQ w'])
+def test_compiled_patterns_format_like_babel(pattern, locale):
+    for value in TIMES:
+        expected = babel.dates.format_datetime(value, formatting.FORMATS.get(pattern, pattern), locale=locale)
+        assert formatting.compiled(pattern, locale)(value) == expected
+
+
+def test_values_are_shown_in_the_timezone(app):
+    value = datetime.datetime(2030, 5, 3, 23, 0)
+    with app.app_context():
+        assert formatting.format_datetime(value, 'H:mm', 'en', 'UTC') == '23:00'
+        assert formatting.format_datetime(value, 'EEE H:mm', 'en', 'America/Chicago') == 'Fri 18:00'
+        assert formatting.format_datetime(value.replace(tzinfo=datetime.timezone.utc), 'H:mm', 'en',
+                                          'Europe/Paris') == '1:00'
+
+
+def test_only_datetimes_are_formatted(app):
+    with app.app_context():
+        assert formatting.format_datetime(None) == ''
+        with pytest.raises(TypeError):
+            formatting.format_datetime('2030-05-03 23:00:00')
+
+
+def test_request_picks_locale_and_timezone(app):
+    with app.test_request_context(headers={'Accept-Language': 'de-DE,de;q=0.9'}):
+        assert (formatting.request_locale(), formatting.request_timezone()) == ('de', 'UTC')
+    with app.test_request_context(headers={'Accept-Language': 'de', 'Cookie': 'locale=fr; tz=Europe/Paris'}):
+        assert (formatting.request_locale(), formatting.request_timezone()) == ('fr', 'Europe/Paris')
+        assert formatting.cache_variant() == 'fr|Europe/Paris'
+    with app.test_request_context(headers={'Cookie': 'locale=xx; tz=Nowhere/Else'}):
+        assert (formatting.request_locale(), formatting.request_timezone()) == ('en', 'UTC')
+
+
+def test_html_pages_vary_on_locale(client):
+    response = client.get('/')
+    assert {'Accept-Language', 'Cookie'} <= set(response.vary)
+
+
+def test_show_tiles_follow_the_timezone_cookie(client):
+    create_venue(client, 'Blue Hall')
+    create_artist(client, 'Alpha Trio')
+    create_show(client, 1, 1, '2030-05-03 23:00:00')
+    assert 'May, 3, 2030 at 11:00PM' in client.get('/shows').get_data(as_text=True)
+    client.set_cookie('localhost', 'tz', 'America/Chicago')
+    assert 'May, 3, 2030 at 6:00PM' in client.get('/shows').get_data(as_text=True)
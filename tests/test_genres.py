@@ -0,0 +1,47 @@
+from conftest import create_artist, create_venue
+from models import Artist, Genre, Venue, db
+import genres
+
+
+def tagged(client):
+    create_venue(client, 'Blue Hall', genres=['Jazz', 'Blues'])
+    create_venue(client, 'Red Hall', genres=['Jazz'])
+    create_venue(client, 'Loud Room', genres=['Blues', 'Punk'])
+
+
+def test_near_duplicate_names_share_a_genre(app):
+    with app.app_context():
+        db.session.add(Venue(name='Blue Hall', genres=['Hip-Hop', 'hip hop']))
+        db.session.add(Artist(name='Alpha Trio', genres=['HIPHOP']))
+        db.session.commit()
+        assert [genre.name for genre in Genre.query] == ['Hip-Hop']
+        assert Artist.query.one().genres == ['Hip-Hop']
+
+
+def test_filters_match_all_genres_and_facets_count_the_matches(app, client):
+    tagged(client)
+    with app.app_context():
+        query = genres.filter_by_genres(Venue.query.order_by(Venue.id), Venue, ['blues'])
+        assert [venue.name for venue in query] == ['Blue Hall', 'Loud Room']
+        assert genres.facet_counts(Venue, query) == [('Blues', 2), ('Jazz', 1), ('Punk', 1)]
+        query = genres.filter_by_genres(Venue.query, Venue, ['Blues', 'jazz'])
+        assert [venue.name for venue in query] == ['Blue Hall']
+        assert genres.filter_by_genres(Venue.query, Venue, ['Polka']).count() == 0
+
+
+def test_listing_filters_by_genre_with_facets(client):
+    tagged(client)
+    create_artist(client, 'Alpha Trio', genres=['Punk'])
+    page = client.get('/venues?genre=Jazz').get_data(as_text=True)
+    assert 'Blue Hall' in page and 'Red Hall' in page and 'Loud Room' not in page
+    assert 'Jazz (2)' in page and 'Blues (1)' in page
+    page = client.get('/artists?genre=Jazz').get_data(as_text=True)
+    assert 'Alpha Trio' not in page
+
+
+def test_search_filters_by_genre_with_facets(client):
+    tagged(client)
+    response = client.post('/venues/search', data={'search_term': 'hall', 'genre': ['Blues']})
+    page = response.get_data(as_text=True)
+    assert 'Number of search results for "hall": 1' in page
+    assert 'Blues (1)' in page and 'Jazz (1)' in page
@@ -0,0 +1,87 @@
+import json
+import pytest
+from conftest import create_artist, create_show, create_venue
+from generation import data_generation
+from importer import run_import
+import importer
+from models import Artist, Show, Venue
+
+
+def write(tmp_path, name, records):
+    path = tmp_path / name
+    path.write_text(''.join(json.dumps(record) + '\n' for record in records), encoding='utf-8')
+    return str(path)
+
+
+def rejects(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def venue(name, **fields):
+    return {'name': name, 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+            'image_link': 'http://example.com/venue.jpg', 'genres': 'Jazz;Blues', **fields}
+
+
+def test_import_inserts_valid_rows_and_rejects_the_rest(app, tmp_path):
+    path = write(tmp_path, 'venues.ndjson', [venue('Blue Hall'), venue(''), venue('Red Hall', state='XX')])
+    with app.app_context():
+        run_import(Venue, path, None, 2, str(tmp_path / 'rejects.ndjson'))
+        assert [(v.name, sorted(v.genres)) for v in Venue.query.order_by(Venue.id)] == [
+            ('Blue Hall', ['Blues', 'Jazz'])]
+    assert [(reject['line'], sorted(reject['errors'])) for reject in rejects(tmp_path / 'rejects.ndjson')] == [
+        (2, ['name']), (3, ['state'])]
+
+
+def test_import_reads_csv(app, tmp_path):
+    path = tmp_path / 'artists.csv'
+    path.write_text('name,city,state,genres,seeking_venue\nAlpha Trio,Austin,TX,Jazz|Rock n Roll,no\n', encoding='utf-8')
+    with app.app_context():
+        run_import(Artist, str(path), None, 10, None)
+        artist = Artist.query.one()
+        assert (artist.name, artist.seeking_venue, len(artist.genres)) == ('Alpha Trio', False, 2)
+
+
+def test_show_import_rejects_overlaps(app, client, tmp_path):
+    create_venue(client, 'Blue Hall')
+    create_venue(client, 'Red Hall')
+    create_artist(client, 'Alpha Trio')
+    create_artist(client, 'Beta Band')
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    path = write(tmp_path, 'shows.ndjson', [
+        # overlaps the existing booking of venue 1
+        {'venue_id': 1, 'artist_id': 2, 'start_time': '2099-05-01 21:00:00'},
+        {'venue_id': 2, 'artist_id': 2, 'start_time': '2099-06-01 20:00:00'},
+        # overlaps the row above, for artist 2
+        {'venue_id': 1, 'artist_id': 2, 'start_time': '2099-06-01 21:00:00'},
+        {'venue_id': 9, 'artist_id': 1, 'start_time': '2099-07-01 20:00:00'},
+        {'venue_id': 1, 'artist_id': 1, 'start_time': '2099-07-01 20:00:00'},
+    ])
+    with app.app_context():
+        run_import(Show, path, None, 2, str(tmp_path / 'rejects.ndjson'))
+        assert Show.query.count() == 3
+    found = {reject['line']: reject['errors'] for reject in rejects(tmp_path / 'rejects.ndjson')}
+    assert sorted(found) == [1, 3, 4]
+    assert 'show 1' in found[1]['venue_id'][0]
+    assert 'line 2' in found[3]['artist_id'][0]
+    assert found[4] == {'artist_id/venue_id': ['Unknown artist or venue.']}
+
+
+def test_failed_import_keeps_committed_batches_and_bumps_the_generation(app, tmp_path, monkeypatch):
+    path = write(tmp_path, 'venues.ndjson', [venue('Blue Hall'), venue('Red Hall'), venue('Green Room')])
+    insert_rows = importer.insert_rows
+    calls = []
+
+    def failing(table, rows):
+        if table is Venue.__table__:
+            calls.append(rows)
+            if len(calls) == 2:
+                raise RuntimeError('disk full')
+        insert_rows(table, rows)
+    monkeypatch.setattr(importer, 'insert_rows', failing)
+    generation = data_generation.current()
+    with app.app_context():
+        with pytest.raises(RuntimeError):
+            run_import(Venue, path, None, 1, None)
+        assert [v.name for v in Venue.query] == ['Blue Hall']
+    assert data_generation.current() == generation + 1
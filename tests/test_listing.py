@@ -0,0 +1,60 @@
+from conftest import create_artist, create_show, create_venue, queries
+from models import Artist, ShowListing, db
+import listing
+
+
+def listing_rows(app):
+    with app.app_context():
+        return [row._asdict() for row in db.session.query(ShowListing.show_id, ShowListing.artist_name,
+                                                           ShowListing.venue_name).order_by(ShowListing.show_id)]
+
+
+def wrong(app):
+    with app.app_context():
+        return list(listing.mismatches())
+
+
+def test_generated_data_is_listed(app, load):
+    load(1000)
+    assert wrong(app) == []
+
+
+def test_triggers_follow_writes(app, client):
+    create_venue(client, 'Hall')
+    create_venue(client, 'Room')
+    create_artist(client, 'Alpha')
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    create_show(client, 2, 1, '2099-06-01 20:00:00')
+    assert listing_rows(app) == [{'show_id': 1, 'artist_name': 'Alpha', 'venue_name': 'Hall'},
+                                 {'show_id': 2, 'artist_name': 'Alpha', 'venue_name': 'Room'}]
+    with app.app_context():
+        Artist.query.get(1).name = 'Alpha Band'
+        db.session.commit()
+    assert {row['artist_name'] for row in listing_rows(app)} == {'Alpha Band'}
+    client.delete('/venues/1')
+    assert [row['show_id'] for row in listing_rows(app)] == [2]
+    assert wrong(app) == []
+
+
+def test_shows_page_queries_do_not_grow_with_shows(client, load):
+    counts = {}
+    for shows in (200, 2000):
+        load(shows)
+        response = client.get('/shows')
+        assert response.status_code == 200
+        counts[shows] = queries(response)
+    assert counts[200] == counts[2000] == 2
+
+
+def test_check_command_rebuilds_the_table(app, load):
+    load(200)
+    with app.app_context():
+        db.session.query(ShowListing).filter(ShowListing.show_id <= 5).delete()
+        db.session.commit()
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['listing', 'check'])
+    assert result.exit_code == 1
+    assert 'Show 1: missing' in result.output
+    result = runner.invoke(args=['listing', 'check', '--fix'])
+    assert result.exit_code == 0
+    assert wrong(app) == []
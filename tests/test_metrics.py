@@ -0,0 +1,65 @@
+import json
+import os
+import re
+import metrics
+
+
+def series(text, name, **labels):
+    # the value of one sample of a /metrics body, 0 when it's missing
+    for line in text.splitlines():
+        match = re.fullmatch(r'(\w+)(?:\{(.*)\})? (\S+)', line)
+        if match and match[1] == name and dict(re.findall(r'(\w+)="([^"]*)"', match[2] or '')) == labels:
+            return float(match[3])
+    return 0
+
+
+def test_histograms_expose_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.histogram('latency', 'Latency.', ['route'], (0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 3.0):
+        histogram.observe(('home',), value)
+    text = metrics.exposition(registry.snapshot())
+    assert '# TYPE latency histogram' in text
+    assert [series(text, 'latency_bucket', route='home', le=le) for le in ('0.1', '1.0', '+Inf')] == [1, 3, 4]
+    assert series(text, 'latency_count', route='home') == 4
+    assert series(text, 'latency_sum', route='home') == 4.05
+
+
+def test_label_values_are_escaped():
+    registry = metrics.Registry()
+    registry.counter('hits', 'Hits.', ['path']).inc(('a"b\\c',))
+    assert 'hits{path="a\\"b\\\\c"} 1' in metrics.exposition(registry.snapshot())
+
+
+def test_requests_are_timed_per_route(client):
+    before = client.get('/metrics').get_data(as_text=True)
+    for _ in range(3):
+        client.get('/venues')
+    client.get('/venues/999')
+    text = client.get('/metrics').get_data(as_text=True)
+    labels = {'endpoint': 'venues', 'method': 'GET', 'status': '200'}
+    assert series(text, 'fyyur_request_duration_seconds_count', **labels) == \
+        series(before, 'fyyur_request_duration_seconds_count', **labels) + 3
+    assert series(text, 'fyyur_request_duration_seconds_count', endpoint='show_venue', method='GET',
+                  status='404') >= 1
+    assert series(text, 'fyyur_db_queries_total', endpoint='venues') > \
+        series(before, 'fyyur_db_queries_total', endpoint='venues')
+    assert series(text, 'fyyur_template_render_seconds_count', template='pages/venues.html') >= 3
+    assert '# TYPE fyyur_cache_hits_total counter' in text
+    assert '# TYPE fyyur_db_pool_wait_seconds histogram' in text
+
+
+def test_worker_snapshots_are_summed(tmp_path):
+    registry = metrics.Registry()
+    registry.directory = str(tmp_path)
+    registry.counter('jobs', 'Jobs.', []).inc(())
+    gauge = {'type': 'gauge', 'help': 'In use.', 'labels': [], 'values': [[[], 5]]}
+    worker = {'pid': os.getpid(), 'metrics': {'jobs': {'type': 'counter', 'help': 'Jobs.', 'labels': [],
+                                                        'values': [[[], 2]]}}}
+    (tmp_path / 'other.json').write_text(json.dumps(worker))
+    # a worker that exited keeps its counters but not its gauges
+    dead = {'pid': 2 ** 22 + 1, 'metrics': {'jobs': worker['metrics']['jobs'], 'busy': gauge}}
+    (tmp_path / 'dead.json').write_text(json.dumps(dead))
+    text = metrics.exposition(registry.collect())
+    assert series(text, 'jobs') == 5
+    assert series(text, 'busy') == 0
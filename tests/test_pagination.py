@@ -0,0 +1,55 @@
+import html
+import re
+from conftest import queries
+from models import Artist, Venue, db
+
+NEXT = re.compile(r'<li class="next"><a href="([^"]+)">')
+
+
+def walk(client, path):
+    # [(artist ids, query count)] of every page, following the Next links
+    pages = []
+    while path:
+        response = client.get(path)
+        assert response.status_code == 200
+        page = response.get_data(as_text=True)
+        pages.append(([int(i) for i in re.findall(r'<a href="/artists/(\d+)">', page)], queries(response)))
+        found = NEXT.search(page)
+        path = html.unescape(found.group(1)) if found else None
+    return pages
+
+
+def test_cursor_walk_lists_every_artist_once(client, load):
+    artists = load(1000)[1]
+    pages = walk(client, '/artists?per_page=20')
+    ids = [artist_id for page, _ in pages for artist_id in page]
+    assert len(pages) == -(-artists // 20)
+    assert sorted(ids) == list(range(1, artists + 1))
+
+
+def test_deep_pages_cost_the_same_as_the_first(client, load):
+    load(1000)
+    counts = {count for _, count in walk(client, '/artists?per_page=20')}
+    assert len(counts) == 1
+
+
+def test_bad_cursor_is_rejected(client):
+    assert client.get('/artists?cursor=not-a-cursor').status_code == 400
+
+
+def test_cursor_walk_crosses_null_keys(app, client):
+    # rows with a NULL sort column used to fall out of the cursor comparison
+    with app.app_context():
+        db.session.add_all(Artist(name=None if i % 3 == 0 else f'Artist {i}') for i in range(10))
+        db.session.add_all(Venue(name=f'Venue {i}', city=None if i % 2 else 'Austin',
+                                 state=None if i % 4 == 1 else 'TX') for i in range(10))
+        db.session.commit()
+    ids = [artist_id for page, _ in walk(client, '/artists?per_page=2') for artist_id in page]
+    assert sorted(ids) == list(range(1, 11))
+    venue_ids, path = [], '/venues?per_page=2'
+    while path:
+        page = client.get(path).get_data(as_text=True)
+        venue_ids += [int(i) for i in re.findall(r'<a href="/venues/(\d+)">', page)]
+        found = NEXT.search(page)
+        path = html.unescape(found.group(1)) if found else None
+    assert sorted(venue_ids) == list(range(1, 11))
@@ -0,0 +1,42 @@
+import pytest
+from conftest import create_venue, queries
+from profiler import QueryBudgetExceeded, RequestProfile, fingerprint
+
+
+def test_responses_report_their_queries(client):
+    create_venue(client, 'Hall')
+    response = client.get('/venues')
+    assert queries(response) > 0
+    assert response.headers['Server-Timing'].startswith('db;dur=')
+    assert queries(client.get('/shows/create')) == 0
+
+
+def test_going_over_the_budget_fails_under_testing(app, client, monkeypatch):
+    monkeypatch.setitem(app.config['SQL_QUERY_BUDGETS'], 'venues', 1)
+    with pytest.raises(QueryBudgetExceeded):
+        client.get('/venues')
+
+
+def test_every_endpoint_stays_within_its_budget(client, load):
+    # budgets raise under testing, so a 200 is within budget; a detail page
+    # runs exactly its four: validator, entity, ShowListing tiles and genres
+    load(1000)
+    for path in ('/', '/venues', '/artists', '/shows', '/venues/1', '/artists/1'):
+        assert client.get(path).status_code == 200
+    for path in ('/venues/1', '/artists/1'):
+        assert queries(client.get(path)) == 4
+
+
+def test_fingerprint_ignores_values():
+    assert fingerprint("SELECT * FROM t WHERE a = 'x' AND b IN (1, 2, 3)") == \
+        fingerprint("SELECT * FROM t WHERE a = 'yy' AND b IN (4)")
+    assert fingerprint('SELECT 1 FROM t WHERE id = ?') == 'SELECT ? FROM t WHERE id = ?'
+
+
+def test_repeated_statements_are_reported():
+    profile = RequestProfile()
+    for venue_id in range(6):
+        profile.record(f'SELECT name FROM "Venue" WHERE id = {venue_id}', 0.001)
+    profile.record('SELECT count(*) FROM "Show"', 0.001)
+    assert profile.repeated(5) == [('SELECT name FROM "Venue" WHERE id = ?', 6)]
+    assert profile.summary()['queries'] == 7
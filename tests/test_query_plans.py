@@ -0,0 +1,21 @@
+from benchmarks import datagen, explain, harness
+from conftest import use_database
+
+# the benchmarks.explain check on every read route: the second request of
+# each must not scan Show, Venue or Artist in full (ALLOWED routes aside)
+
+HOT_TABLES = {'Show', 'Venue', 'Artist'}
+
+
+def test_read_routes_do_not_scan_hot_tables(app, tmp_path, monkeypatch):
+    # harness.TestClient turns PROPAGATE_EXCEPTIONS off
+    monkeypatch.setitem(app.config, 'PROPAGATE_EXCEPTIONS', None)
+    data = datagen.generate(2000, 0)
+    use_database(app, tmp_path / 'plans.db')
+    with app.app_context():
+        datagen.load(*data)
+    targets = harness.targets(app, data)
+    assert len(targets) > 10
+    scans = [(route, table) for route, table, _ in explain.check(app, targets, min_rows=100)
+             if table in HOT_TABLES]
+    assert scans == []
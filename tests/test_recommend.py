@@ -0,0 +1,88 @@
+from conftest import create_artist, create_show, create_venue
+from models import Artist, Show, Venue, db
+import recommend
+
+
+def matches(client, kind, entity_id):
+    response = client.get(f'/api/{kind}/{entity_id}/recommendations')
+    return response.status_code, [match['name'] for match in response.get_json().get('data', [])]
+
+
+def test_matches_share_genres_and_seek(client):
+    create_venue(client, 'Jazz Club', genres=['Jazz'])
+    create_artist(client, 'Trio', genres=['Jazz'])
+    create_artist(client, 'Shredders', genres=['Metal'])
+    create_artist(client, 'Quartet', genres=['Jazz'], seeking_venue='')
+    assert matches(client, 'venues', 1) == (200, ['Trio'])
+    assert matches(client, 'artists', 1) == (200, ['Jazz Club'])
+
+
+def test_entity_added_behind_the_matrices_is_found(app, client):
+    create_venue(client, 'Jazz Club', genres=['Jazz'])
+    assert matches(client, 'venues', 1) == (200, [])
+    # as another worker or the importer would, unseen by this process' events
+    with app.app_context():
+        db.session.execute(Artist.__table__.insert().values(name='Trio', seeking_venue=True))
+        db.session.commit()
+    builds = recommend.recommender.builds
+    assert matches(client, 'artists', 1)[0] == 200
+    assert recommend.recommender.builds == builds + 1
+
+
+def test_missing_entity_is_404(client):
+    create_venue(client, 'Jazz Club')
+    assert client.get('/api/venues/2/recommendations').status_code == 404
+    assert client.get('/api/artists/1/recommendations').status_code == 404
+
+
+def test_detail_page_leaves_matches_to_the_api(client):
+    create_venue(client, 'Jazz Club', genres=['Jazz'])
+    first = client.get('/venues/1')
+    recommend.recommender.invalidate()
+    create_artist(client, 'Trio', genres=['Jazz'])
+    second = client.get('/venues/1')
+    assert 'data-recommendations="/api/venues/1/recommendations' in second.get_data(as_text=True)
+    assert second.headers['ETag'] == first.headers['ETag']
+
+
+def booked(client):
+    create_venue(client, 'Jazz Club', genres=['Jazz'])
+    create_venue(client, 'Metal Bar', genres=['Metal'])
+    create_artist(client, 'Trio', genres=['Jazz', 'Blues'])
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    create_show(client, 1, 1, '2099-06-01 20:00:00')
+
+
+def assert_counts_match_a_rebuild():
+    counts = recommend.recommender.cooccurrence.copy()
+    columns = dict(recommend.recommender.genre_columns)
+    recommend.recommender.invalidate()
+    recommend.recommender.load()
+    rebuilt = recommend.recommender.cooccurrence
+    for row_genre, row in columns.items():
+        for column_genre, column in columns.items():
+            expected = rebuilt[recommend.recommender.genre_columns[row_genre],
+                               recommend.recommender.genre_columns[column_genre]]
+            assert counts[row, column] == expected, (row_genre, column_genre)
+
+
+def test_deleted_and_moved_shows_leave_the_counts(app, client):
+    booked(client)
+    with app.app_context():
+        recommend.recommender.load()
+        builds = recommend.recommender.builds
+        db.session.delete(Show.query.get(1))
+        Show.query.get(2).venue_id = 2
+        db.session.commit()
+        assert recommend.recommender.builds == builds
+        assert recommend.recommender.loaded
+        assert_counts_match_a_rebuild()
+
+
+def test_genre_change_rebuilds_the_counts(app, client):
+    booked(client)
+    with app.app_context():
+        recommend.recommender.load()
+        Artist.query.get(1).genres = ['Metal']
+        db.session.commit()
+        assert not recommend.recommender.loaded
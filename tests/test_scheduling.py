@@ -0,0 +1,65 @@
+import datetime
+from sqlalchemy import event
+from conftest import create_artist, create_show, create_venue
+from models import Show, db
+import scheduling
+
+
+def book(client):
+    create_venue(client, 'Hall')
+    create_venue(client, 'Room')
+    create_artist(client, 'Alpha')
+    create_artist(client, 'Beta')
+    create_show(client, 1, 1, '2099-05-01 20:00:00', duration=120)
+
+
+def shows(app):
+    with app.app_context():
+        return Show.query.count()
+
+
+def test_overlapping_venue_booking_is_rejected(app, client):
+    book(client)
+    page = create_show(client, 1, 2, '2099-05-01 21:00:00').get_data(as_text=True)
+    assert 'The venue is already booked' in page
+    assert shows(app) == 1
+
+
+def test_overlapping_artist_booking_is_rejected(app, client):
+    book(client)
+    page = create_show(client, 2, 1, '2099-05-01 19:00:00', duration=90).get_data(as_text=True)
+    assert 'The artist is already booked' in page
+    assert shows(app) == 1
+
+
+def test_back_to_back_bookings_are_accepted(app, client):
+    book(client)
+    create_show(client, 1, 1, '2099-05-01 22:00:00')
+    create_show(client, 1, 2, '2099-05-01 18:00:00', duration=120)
+    assert shows(app) == 3
+
+
+def test_conflict_check_reads_one_row_per_entity(app, load):
+    load(2000)
+    statements = []
+    start = datetime.datetime(2030, 1, 1, 20)
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            assert scheduling.find_conflict(1, 1, start, start + datetime.timedelta(hours=2)) is None
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+    assert len(statements) == 2
+    assert all('LIMIT' in statement for statement in statements)
+
+
+def test_schedule_finds_the_clashing_predecessor():
+    at = datetime.datetime(2030, 1, 1)
+    schedule = scheduling.Schedule([(1, at, at + datetime.timedelta(hours=2)),
+                                    (2, at + datetime.timedelta(hours=3), at + datetime.timedelta(hours=4))])
+    assert schedule.conflict(at + datetime.timedelta(hours=1), at + datetime.timedelta(hours=3)) == 1
+    assert schedule.conflict(at + datetime.timedelta(hours=2), at + datetime.timedelta(hours=3)) is None
+    assert schedule.conflict(at + datetime.timedelta(hours=3, minutes=30), at + datetime.timedelta(hours=5)) == 2
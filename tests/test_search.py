@@ -0,0 +1,58 @@
+from conftest import create_artist, create_venue
+from models import Artist, Venue, db
+import search
+
+
+def names(app, model, term, page=1, per_page=20):
+    with app.app_context():
+        results = search.search(model, term, page, per_page)
+        return results.total, [entity.name for entity in results.items]
+
+
+def test_search_matches_word_prefixes_of_name_city_and_state(app, client):
+    create_venue(client, 'The Musical Hop', city='San Francisco', state='CA')
+    create_venue(client, 'Park Square Live', city='New York', state='NY')
+    create_artist(client, 'Guns N Petals', city='San Francisco', state='CA')
+    assert names(app, Venue, 'mus') == (1, ['The Musical Hop'])
+    assert names(app, Venue, 'hop musical') == (1, ['The Musical Hop'])
+    assert names(app, Venue, 'new york') == (1, ['Park Square Live'])
+    assert names(app, Artist, 'san fran') == (1, ['Guns N Petals'])
+    assert names(app, Venue, 'nothing') == (0, [])
+
+
+def test_search_tolerates_query_syntax(app, client):
+    create_venue(client, 'Club "Q"')
+    for term in ('"', 'q*', 'NOT AND', '(q', '%_'):
+        assert names(app, Venue, term)[0] in (0, 1)
+
+
+def test_search_pages_with_a_total(app, client):
+    for i in range(5):
+        create_venue(client, f'Hall {i}')
+    first, second, third = (names(app, Venue, 'hall', page, 2) for page in (1, 2, 3))
+    assert first[0] == second[0] == third[0] == 5
+    assert len(first[1]) == len(second[1]) == 2 and len(third[1]) == 1
+    assert sorted(first[1] + second[1] + third[1]) == [f'Hall {i}' for i in range(5)]
+
+
+def test_search_follows_renames_and_deletes(app, client):
+    create_venue(client, 'Blue Hall')
+    create_venue(client, 'Green Room')
+    with app.app_context():
+        Venue.query.get(1).name = 'Red Hall'
+        db.session.delete(Venue.query.get(2))
+        db.session.commit()
+    assert names(app, Venue, 'blue') == (0, [])
+    assert names(app, Venue, 'red') == (1, ['Red Hall'])
+    assert names(app, Venue, 'green') == (0, [])
+
+
+def test_search_pages_render_results(client):
+    create_venue(client, 'Blue Hall')
+    create_artist(client, 'Alpha Trio')
+    response = client.post('/venues/search', data={'search_term': 'blue'})
+    assert response.status_code == 200
+    assert 'Number of search results for "blue": 1' in response.get_data(as_text=True)
+    assert b'/venues/1' in response.data
+    response = client.post('/artists/search', data={'search_term': 'trio'})
+    assert b'Alpha Trio' in response.data
@@ -0,0 +1,67 @@
+import time
+from conftest import create_artist, create_show, create_venue, drain
+from models import Venue
+import tasks
+
+
+def queued(state='queued'):
+    return [(row['name'], row['args']) for row in tasks.task_queue.store.rows(state)]
+
+
+def test_writes_queue_counter_refreshes(app, client):
+    create_venue(client, 'Hall')
+    create_artist(client, 'Alpha')
+    for day in (1, 2, 3):
+        create_show(client, 1, 1, f'2099-05-0{day} 20:00:00')
+    # three shows of one venue and artist coalesce into one refresh each
+    assert sorted(queued()) == [('counters.refresh', '{"entity_id": 1, "model": "Artist"}'),
+                                ('counters.refresh', '{"entity_id": 1, "model": "Venue"}')]
+    with app.app_context():
+        assert Venue.query.get(1).upcoming_shows_count == 0
+    assert drain() == 2
+    with app.app_context():
+        assert Venue.query.get(1).upcoming_shows_count == 3
+    assert queued() == []
+
+
+def test_failing_tasks_are_retried_then_kept(app, monkeypatch):
+    calls = []
+
+    def flaky(n):
+        calls.append(n)
+        raise RuntimeError('unavailable')
+    monkeypatch.setitem(tasks.task_queue.handlers, 'test.flaky', flaky)
+    monkeypatch.setattr(tasks.task_queue, 'max_attempts', 3)
+    monkeypatch.setattr(tasks.task_queue, 'retry_seconds', 0)
+    tasks.task_queue.enqueue('test.flaky', n=1)
+    assert drain() == 3
+    assert calls == [1, 1, 1]
+    [failed] = tasks.task_queue.store.rows('failed')
+    assert failed['attempts'] == 3 and failed['error'] == 'RuntimeError: unavailable'
+    assert tasks.task_queue.store.requeue() == 1
+    assert queued() == [('test.flaky', '{"n": 1}')]
+
+
+def test_tasks_of_a_dead_worker_run_again_after_their_lease(app):
+    store = tasks.task_queue.store
+    store.put('counters.refresh', '{}', time.time())
+    assert store.claim(time.time(), lease=60) is not None
+    assert store.claim(time.time(), lease=60) is None
+    assert store.claim(time.time() + 61, lease=60)['attempts'] == 2
+
+
+def test_durable_queue_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'tasks.db')
+    tasks.Store(path).put('counters.refresh', '{"entity_id": 1, "model": "Venue"}', time.time())
+    assert [row['name'] for row in tasks.Store(path).rows('queued')] == ['counters.refresh']
+
+
+def test_cli_lists_and_drains(app, client):
+    create_venue(client, 'Hall')
+    create_artist(client, 'Alpha')
+    create_show(client, 1, 1, '2099-05-01 20:00:00')
+    runner = app.test_cli_runner()
+    assert '2 queued, 0 running, 0 failed' in runner.invoke(args=['tasks', 'list']).output
+    result = runner.invoke(args=['tasks', 'drain'])
+    assert result.exit_code == 0
+    assert 'Ran 2 tasks, 0 queued, 0 failed.' in result.output
@@ -0,0 +1,66 @@
+from conftest import create_artist, create_venue, queries
+from generation import data_generation
+from models import Venue, db
+import typeahead
+
+
+def suggest(client, kind, prefix):
+    response = client.get(f'/{kind}/autocomplete', query_string={'q': prefix})
+    assert response.status_code == 200
+    return [match['name'] for match in response.get_json()['data']]
+
+
+def test_keys_start_at_every_word():
+    assert typeahead.keys_for('  The Musical  Hop ') == ['the musical hop', 'musical hop', 'hop']
+
+
+def test_any_word_start_matches_once(client):
+    create_venue(client, 'The Musical Hop')
+    create_venue(client, 'Hop Hop House')
+    create_artist(client, 'Guns N Petals')
+    assert suggest(client, 'venues', 'MUS') == ['The Musical Hop']
+    assert sorted(suggest(client, 'venues', 'hop')) == ['Hop Hop House', 'The Musical Hop']
+    assert suggest(client, 'venues', 'musical h') == ['The Musical Hop']
+    assert suggest(client, 'artists', 'pet') == ['Guns N Petals']
+    assert suggest(client, 'venues', '') == []
+    assert suggest(client, 'venues', 'zebra') == []
+
+
+def test_suggestions_are_limited(app, client):
+    for i in range(12):
+        create_venue(client, f'Hall {i}')
+    assert len(suggest(client, 'venues', 'hall')) == 10
+    with app.app_context():
+        assert len(typeahead.venues.search('hall', limit=3)) == 3
+
+
+def test_lookups_stay_off_the_database(client):
+    create_venue(client, 'Blue Hall')
+    suggest(client, 'venues', 'b')
+    assert queries(client.get('/venues/autocomplete?q=blue')) == 0
+
+
+def test_form_writes_update_the_index(client):
+    create_venue(client, 'Blue Hall')
+    assert suggest(client, 'venues', 'blue') == ['Blue Hall']
+    create_venue(client, 'Blue Room')
+    assert sorted(suggest(client, 'venues', 'blue')) == ['Blue Hall', 'Blue Room']
+    client.post('/venues/1/edit', data={'name': 'Red Hall', 'city': 'Austin', 'state': 'TX', 'address': '1 Main St',
+                                        'image_link': 'http://example.com/venue.jpg', 'genres': ['Jazz']})
+    assert suggest(client, 'venues', 'blue') == ['Blue Room']
+    assert suggest(client, 'venues', 'red') == ['Red Hall']
+    client.delete('/venues/2')
+    assert suggest(client, 'venues', 'blue') == []
+
+
+def test_generation_move_reloads_the_index(app, client):
+    create_venue(client, 'Blue Hall')
+    suggest(client, 'venues', 'blue')
+    # as the importer would, unseen by this process' form handlers
+    with app.app_context():
+        db.session.execute(Venue.__table__.insert().values(name='Blue Room', city='Austin', state='TX',
+                                                           address='2 Main St'))
+        db.session.commit()
+    assert suggest(client, 'venues', 'blue') == ['Blue Hall']
+    data_generation.bump()
+    assert sorted(suggest(client, 'venues', 'blue')) == ['Blue Hall', 'Blue Room']
@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from sqlalchemy import event
+from models import Venue, db
+
+AREAS = [('New York', 'NY'), ('San Francisco', 'CA'), ('Austin', 'TX'), ('Seattle', 'WA')]
+
+
+def add_venues(app, count):
+    with app.app_context():
+        start = db.session.query(Venue).count()
+        db.session.add_all(Venue(name=f'Venue {start + i}', city=AREAS[i % len(AREAS)][0],
+                                 state=AREAS[i % len(AREAS)][1], address=f'{i} Main St')
+                           for i in range(count))
+        db.session.commit()
+
+
+@contextmanager
+def counted_statements(app):
+    # counts the statements sent to the database while the block runs
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', count)
+
+
+def test_venues_listing_queries_do_not_grow_with_venues(app, client):
+    counts = []
+    for venues in (5, 45):
+        add_venues(app, venues)
+        with counted_statements(app) as statements:
+            assert client.get('/venues').status_code == 200
+        counts.append(len(statements))
+    assert counts[0] == counts[1]
+
+
+def test_venues_listing_groups_by_area(app, client):
+    add_venues(app, 8)
+    page = client.get('/venues').get_data(as_text=True)
+    for city, state in AREAS:
+        assert page.count(f'{city}, {state}') == 1
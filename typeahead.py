@@ -0,0 +1,89 @@
+import bisect
+import threading
+from models import Venue, Artist, db
+from generation import data_generation
+
+# In-process prefix index over artist and venue names for the show form's
+# autocomplete. Every word suffix of a name is a key ("the musical hop",
+# "musical hop", "hop"), so typing any word start matches. Keys live in a
+# sorted list searched with bisect; writes build a new list and swap it in,
+# so lookups never take a lock or touch the database. The worker that saves a
+# form updates its own index; other workers only reload when the data
+# generation moves (imports, bulk deletes), so until then their suggestions
+# can miss names created or renamed through another worker's forms.
+
+
+def normalize(text):
+    return ' '.join((text or '').casefold().split())
+
+
+def keys_for(name):
+    words = normalize(name).split(' ')
+    return [' '.join(words[i:]) for i in range(len(words)) if words[i]]
+
+
+class PrefixIndex:
+
+    def __init__(self, model):
+        self.model = model
+        self.loaded = False
+        self.generation = None
+        self._keys = []
+        self._names = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        with self._lock:
+            generation = data_generation.current()
+            if self.loaded and self.generation == generation:
+                return
+            names = dict(db.session.query(self.model.id, self.model.name))
+            self._keys = sorted((key, entity_id) for entity_id, name in names.items()
+                                for key in keys_for(name))
+            self._names = names
+            self.generation = generation
+            self.loaded = True
+
+    def add(self, entity_id, name):
+        # inserts or renames an entity
+        with self._lock:
+            if not self.loaded:
+                return
+            keys = [entry for entry in self._keys if entry[1] != entity_id] \
+                if entity_id in self._names else list(self._keys)
+            for key in keys_for(name):
+                bisect.insort(keys, (key, entity_id))
+            self._names = {**self._names, entity_id: name}
+            self._keys = keys
+
+    def remove(self, entity_id):
+        with self._lock:
+            if not self.loaded or entity_id not in self._names:
+                return
+            self._keys = [entry for entry in self._keys if entry[1] != entity_id]
+            names = dict(self._names)
+            del names[entity_id]
+            self._names = names
+
+    def search(self, prefix, limit=10):
+        self.load()
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        keys, names = self._keys, self._names
+        results = []
+        seen = set()
+        i = bisect.bisect_left(keys, (prefix,))
+        while i < len(keys) and len(results) < limit:
+            key, entity_id = keys[i]
+            if not key.startswith(prefix):
+                break
+            if entity_id not in seen:
+                seen.add(entity_id)
+                results.append({'id': entity_id, 'name': names[entity_id]})
+            i += 1
+        return results
+
+
+artists = PrefixIndex(Artist)
+venues = PrefixIndex(Venue)